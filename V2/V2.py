@@ -1,144 +1,797 @@
 import sys
+import os
+import io
+import re
 import requests
 import json
 import threading
 import time
+import functools
+import copy
+import uuid
+import tracemalloc
+import cProfile
+import pstats
+import zlib
+import gzip
+import numpy as np
 import anthropic
 import openai
-from collections import defaultdict
+from collections import defaultdict, deque
+from requests.adapters import HTTPAdapter
+from html import escape as html_escape
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLineEdit, QTextEdit, QComboBox, QLabel,
-    QSplitter, QProgressBar, QTabWidget, QDialog, QDialogButtonBox, QToolBar, QAction, QSpinBox, QMessageBox, QCheckBox, QSizePolicy, QScrollArea, QGridLayout
+    QSplitter, QProgressBar, QTabWidget, QTextBrowser, QListView, QDialog, QDialogButtonBox, QToolBar, QAction, QSpinBox, QMessageBox, QCheckBox, QSizePolicy,
+    QListWidget, QAbstractItemView, QFileDialog, QInputDialog
 )
-from PyQt5.QtGui import QColor, QTextCursor, QFont, QTextCharFormat, QPainter, QSyntaxHighlighter, QLinearGradient, QPalette, QBrush
-from PyQt5.QtCore import Qt, pyqtSlot, Q_ARG, QMetaObject, pyqtSignal, QTimer, QSize, QThread, QRect
-from PyQt5.QtChart import QChart, QChartView, QBarSeries, QBarSet, QValueAxis, QBarCategoryAxis, QLineSeries
+from PyQt5.QtGui import QColor, QTextCursor, QFont, QTextCharFormat, QTextBlockFormat, QTextDocument, QTextDocumentFragment, QPainter, QLinearGradient, QPalette, QBrush
+from PyQt5.QtCore import Qt, QObject, QAbstractListModel, QModelIndex, QSortFilterProxyModel, pyqtSlot, Q_ARG, QMetaObject, pyqtSignal, QTimer, QSize, QThread, QRect
+from PyQt5.QtChart import QChart, QChartView, QBarSeries, QBarSet, QValueAxis, QBarCategoryAxis, QLineSeries, QScatterSeries
 from pygments import highlight
-from pygments.lexers import PythonLexer
+from pygments.lexers import get_lexer_by_name, TextLexer
 from pygments.formatters import HtmlFormatter
-from bs4 import BeautifulSoup
+from pygments.util import ClassNotFound
 
 class Theme:
     DARK = {
         'bg': '#1e1e2e',
         'text': '#cdd6f4',
+        'subtext': '#a6adc8',
+        'muted': '#6c7086',
+        'on_accent': '#1e1e2e',
         'button': '#45475a',
         'button_hover': '#585b70',
+        'button_pressed': '#313244',
         'input': '#313244',
         'border': '#6c7086',
         'scroll_bg': '#313244',
         'scroll_handle': '#585b70',
         'status_bg': '#313244',
         'status_chunk': '#89b4fa',
-        'accent': '#cba6f7'
+        'accent': '#cba6f7',
+        'danger': '#f38ba8'
     }
 
+    # Widgets carry object names and dynamic properties only; all styling lives in this one sheet
+    TEMPLATE = """
+        QWidget {{
+            background-color: {bg};
+            color: {text};
+        }}
+        QLabel, QCheckBox {{
+            background: transparent;
+        }}
+        QLabel#spendLabel {{
+            color: {subtext};
+        }}
+        QLabel#statusLabel {{
+            font-weight: bold;
+        }}
+        QPushButton {{
+            background-color: {button};
+            color: {text};
+            border: none;
+            padding: 10px 20px;
+            border-radius: 5px;
+        }}
+        QPushButton:hover {{
+            background-color: {button_hover};
+        }}
+        QPushButton[modern="true"] {{
+            border-radius: 8px;
+            font-weight: bold;
+        }}
+        QPushButton[modern="true"]:pressed {{
+            background-color: {button_pressed};
+        }}
+        QPushButton:disabled {{
+            background-color: {button_pressed};
+            color: {muted};
+        }}
+        QPushButton[provider="true"]:checked {{
+            background-color: {accent};
+            color: {on_accent};
+        }}
+        QPushButton#removeParticipant {{
+            padding: 4px;
+        }}
+        QPushButton#removeParticipant:hover {{
+            background-color: {danger};
+            color: {on_accent};
+        }}
+        QMessageBox QPushButton {{
+            padding: 5px 15px;
+        }}
+        QLineEdit, QSpinBox, QTextEdit, QListWidget {{
+            background-color: {input};
+            color: {text};
+            border: 1px solid {border};
+            padding: 5px;
+            border-radius: 5px;
+        }}
+        QListWidget::item:selected {{
+            background-color: {button_hover};
+        }}
+        QLineEdit#chatInput {{
+            padding: 10px;
+            border-radius: 8px;
+        }}
+        QTextEdit#chatDisplay {{
+            background-color: {bg};
+            border: none;
+            padding: 10px;
+            border-radius: 10px;
+        }}
+        QComboBox {{
+            background-color: {input};
+            color: {text};
+            border: 1px solid {border};
+            padding: 5px;
+            border-radius: 8px;
+        }}
+        QComboBox::drop-down {{
+            subcontrol-origin: padding;
+            subcontrol-position: top right;
+            width: 25px;
+            border-left: 1px solid {border};
+            border-top-right-radius: 8px;
+            border-bottom-right-radius: 8px;
+        }}
+        QComboBox QAbstractItemView {{
+            background-color: {input};
+            color: {text};
+            selection-background-color: {button_hover};
+        }}
+        QListView#modelPicker {{
+            background-color: {bg};
+            border: 1px solid {border};
+            border-radius: 8px;
+            padding: 4px;
+        }}
+        QListView#modelPicker::item {{
+            padding: 6px 10px;
+            border-radius: 6px;
+        }}
+        QListView#modelPicker::item:hover {{
+            background-color: {button};
+        }}
+        QListView#modelPicker::item:selected {{
+            background-color: {accent};
+            color: {on_accent};
+        }}
+        QTabBar::tab {{
+            background-color: {input};
+            color: {text};
+            padding: 8px;
+            margin-right: 2px;
+        }}
+        QTabBar::tab:selected {{
+            background-color: {button};
+        }}
+        QTabWidget#modeTabs::pane {{
+            border: 1px solid {border};
+            border-radius: 8px;
+        }}
+        QTabWidget#modeTabs QTabBar::tab {{
+            padding: 10px;
+            border-top-left-radius: 8px;
+            border-top-right-radius: 8px;
+        }}
+        QCheckBox::indicator {{
+            width: 18px;
+            height: 18px;
+            border-radius: 4px;
+            border: 1px solid {border};
+        }}
+        QCheckBox::indicator:unchecked {{
+            background-color: {input};
+        }}
+        QCheckBox::indicator:checked {{
+            background-color: {accent};
+        }}
+        QProgressBar {{
+            border: 1px solid {border};
+            border-radius: 5px;
+            text-align: center;
+            background-color: {status_bg};
+        }}
+        QProgressBar::chunk {{
+            background-color: {accent};
+            width: 20px;
+        }}
+        QToolBar {{
+            border: none;
+            spacing: 10px;
+        }}
+        QToolButton {{
+            background-color: {button};
+            color: {text};
+            border: none;
+            padding: 5px;
+            border-radius: 5px;
+        }}
+        QToolButton:hover, QToolButton:checked {{
+            background-color: {button_hover};
+        }}
+        QScrollBar:vertical {{
+            background: {scroll_bg};
+            width: 10px;
+            margin: 0px;
+        }}
+        QScrollBar::handle:vertical {{
+            background: {scroll_handle};
+            min-height: 20px;
+            border-radius: 5px;
+        }}
+        QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {{
+            height: 0px;
+        }}
+    """
+    compiled = {}
+
+    @classmethod
+    def stylesheet(cls, theme):
+        key = tuple(sorted(theme.items()))
+        if key not in cls.compiled:
+            cls.compiled[key] = cls.TEMPLATE.format(**theme)
+        return cls.compiled[key]
+
+class Timeouts:
+    CONNECT = 5
+    READ = 120
+    FIRST_TOKEN = 90
+    REQUEST = (CONNECT, READ)
+
+class CircuitBreaker:
+    FAILURE_THRESHOLD = 3
+    PROBE_INTERVAL = 15.0
+
+    def __init__(self, name, probe, on_change=None):
+        self.name = name
+        self.probe = probe
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.is_open = False
+        self.failures = 0
+        self.last_error = ""
+        self.probe_timer = None
+
+    def allow(self):
+        with self.lock:
+            return not self.is_open
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self, error):
+        with self.lock:
+            self.failures += 1
+            self.last_error = str(error)
+            should_open = self.failures >= self.FAILURE_THRESHOLD
+        if should_open:
+            self.open()
+
+    def trip(self, error):
+        with self.lock:
+            self.last_error = str(error)
+        self.open()
+
+    def open(self):
+        with self.lock:
+            if self.is_open:
+                return
+            self.is_open = True
+        self.schedule_probe()
+        if self.on_change:
+            self.on_change(self.name, False)
+
+    def close(self):
+        with self.lock:
+            if not self.is_open:
+                return
+            self.is_open = False
+            self.failures = 0
+            self.last_error = ""
+        if self.on_change:
+            self.on_change(self.name, True)
+
+    def schedule_probe(self):
+        self.probe_timer = threading.Timer(self.PROBE_INTERVAL, self.run_probe)
+        self.probe_timer.daemon = True
+        self.probe_timer.start()
+
+    def run_probe(self):
+        try:
+            self.probe()
+        except Exception as e:
+            with self.lock:
+                self.last_error = str(e)
+                still_open = self.is_open
+            if still_open:
+                self.schedule_probe()
+            return
+        self.close()
+
+    def shutdown(self):
+        if self.probe_timer is not None:
+            self.probe_timer.cancel()
+
+class Metrics(QObject):
+    # Recording only appends to a deque (atomic under the GIL); aggregation happens when /metrics is scraped
+    SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 500)
+    LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+    DEFINITIONS = {
+        "llm_response_seconds": ("histogram", "Wall time of a model response", SECONDS_BUCKETS),
+        "llm_time_to_first_token_seconds": ("histogram", "Time from request to the first streamed token", SECONDS_BUCKETS),
+        "llm_tokens_per_second": ("histogram", "Completion tokens per second after the first token", RATE_BUCKETS),
+        "llm_completion_tokens": ("counter", "Completion tokens reported or estimated", None),
+        "llm_requests": ("counter", "Model requests started", None),
+        "llm_errors": ("counter", "Model requests that ended in an error", None),
+        "llm_retries": ("counter", "Turns re-issued on a fallback model", None),
+        "llm_cancellations": ("counter", "Requests cancelled before finishing", None),
+        "llm_prewarm_requests": ("counter", "Prompt cache priming requests sent for the next speaker", None),
+        "llm_prewarm_saved_seconds": ("histogram", "Estimated time to first token saved by priming, against the median unprimed turn; 0 when no faster", SECONDS_BUCKETS),
+        "gui_event_loop_lag_seconds": ("histogram", "How late the GUI thread serviced a periodic timer", LAG_BUCKETS),
+    }
+    LAG_INTERVAL_MS = 250
+    DRAIN_AT = 10000  # Aggregate early if nobody scrapes for a while
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.enabled = False
+        self.events = deque()
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self.collectors = []  # Callables returning (name, type, help, [(labels, value)]) read at scrape time
+        self.lag_timer = QTimer(self)
+        self.lag_timer.timeout.connect(self.sample_lag)
+        self.last_tick = 0.0
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if enabled:
+            self.last_tick = time.perf_counter()
+            self.lag_timer.start(self.LAG_INTERVAL_MS)
+        else:
+            self.lag_timer.stop()
+
+    def sample_lag(self):
+        now = time.perf_counter()
+        self.observe("gui_event_loop_lag_seconds", max(0.0, now - self.last_tick - self.LAG_INTERVAL_MS / 1000))
+        self.last_tick = now
+
+    def inc(self, name, amount=1, **labels):
+        if self.enabled:
+            self.events.append((name, tuple(sorted(labels.items())), amount))
+            if len(self.events) > self.DRAIN_AT:
+                self.drain()
+
+    observe = inc
+
+    def observe_request(self, call, elapsed, error=None):
+        if not self.enabled:
+            return
+        labels = {"provider": call.provider, "model": call.model.split(": ", 1)[-1]}
+        self.inc("llm_requests", **labels)
+        if isinstance(error, (ClientDisconnected, Cancelled)):
+            reason = "client_disconnected" if isinstance(error, ClientDisconnected) else "user_stop"
+            self.inc("llm_cancellations", provider=call.provider, reason=reason)
+            return
+        if error is not None:
+            self.inc("llm_errors", provider=call.provider, kind=type(error).__name__)
+            return
+        self.observe("llm_response_seconds", elapsed, **labels)
+        completion_tokens = call.usage()[1]
+        self.inc("llm_completion_tokens", completion_tokens, **labels)
+        if call.first_token_time is not None:
+            self.observe("llm_time_to_first_token_seconds", call.first_token_time - call.start_time, **labels)
+            streaming = time.time() - call.first_token_time
+            if streaming > 0 and completion_tokens:
+                self.observe("llm_tokens_per_second", completion_tokens / streaming, **labels)
+
+    def drain(self):
+        with self.lock:
+            while True:
+                try:
+                    name, labels, value = self.events.popleft()
+                except IndexError:
+                    break
+                kind, _, buckets = self.DEFINITIONS[name]
+                if kind == "counter":
+                    self.counters[name, labels] += value
+                    continue
+                histogram = self.histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self.histograms[name, labels] = [0] * (len(buckets) + 2)
+                for index, bound in enumerate(buckets):
+                    if value <= bound:
+                        histogram[index] += 1
+                histogram[-2] += value
+                histogram[-1] += 1
+
+    @staticmethod
+    def format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        self.drain()
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: list(value) for key, value in self.histograms.items()}
+        for name, (kind, help_text, buckets) in self.DEFINITIONS.items():
+            metric = f"{name}_total" if kind == "counter" else name
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            if kind == "counter":
+                lines += [f"{metric}{self.format_labels(labels)} {value:g}" for (key, labels), value in counters.items() if key == name]
+                continue
+            for (key, labels), histogram in histograms.items():
+                if key != name:
+                    continue
+                for bound, count in zip(buckets, histogram):
+                    lines.append(f"{name}_bucket{self.format_labels(labels, [('le', f'{bound:g}')])} {count}")
+                lines.append(f"{name}_bucket{self.format_labels(labels, [('le', '+Inf')])} {histogram[-1]}")
+                lines.append(f"{name}_sum{self.format_labels(labels)} {histogram[-2]:g}")
+                lines.append(f"{name}_count{self.format_labels(labels)} {histogram[-1]}")
+        for collector in self.collectors:
+            for name, kind, help_text, samples in collector():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                lines += [f"{name}{self.format_labels(sorted(labels.items()))} {value:g}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+class MetricsExporter:
+    HOST = "127.0.0.1"
+    PORT = 9464
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.httpd = None
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer((self.HOST, self.PORT), MetricsRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.metrics = self.metrics
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.metrics.set_enabled(True)
+
+    def stop(self):
+        self.metrics.set_enabled(False)
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def url(self):
+        return f"http://{self.HOST}:{self.PORT}/metrics"
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class Tracer:
+    # Spans in Chrome trace-event format, kept in a ring buffer while enabled; open the export in Perfetto
+    MAX_EVENTS = 500000
+    GUI_TRACK = "GUI thread"
+
+    def __init__(self):
+        self.enabled = False
+        self.events = deque(maxlen=self.MAX_EVENTS)
+        self.origin = time.time()  # Timestamps are exported relative to this, keeping microseconds exact
+        self.tracks = {self.GUI_TRACK: 1}  # Track name -> tid, in first-use order
+        self.last_export = ""
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def clear(self):
+        self.events.clear()
+
+    def complete(self, name, category, start, end, track=GUI_TRACK, **args):
+        # start and end are time.time() seconds; the caller checks enabled on hot paths
+        if self.enabled and end >= start:
+            self.events.append((name, category, start, end, track, args))
+
+    def track_id(self, track):
+        return self.tracks.setdefault(track, len(self.tracks) + 1)
+
+    def export(self, path):
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "LLM Collaboration"}}]
+        for name, category, start, end, track, args in list(self.events):
+            start, end = round((start - self.origin) * 1e6, 1), round((end - self.origin) * 1e6, 1)
+            event = {"name": name, "cat": category, "ph": "X", "ts": start, "dur": round(end - start, 1),
+                     "pid": pid, "tid": self.track_id(track)}
+            if args:
+                event["args"] = args
+            events.append(event)
+        for track, tid in self.tracks.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": track}})
+            events.append({"name": "thread_sort_index", "ph": "M", "pid": pid, "tid": tid, "args": {"sort_index": tid}})
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        self.last_export = f"{len(events)} events to {path}"
+        return len(events)
+
+def timed(section):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            diagnostics = self.diagnostics
+            if diagnostics is None or not (diagnostics.enabled or diagnostics.tracer.enabled):
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                if diagnostics.enabled:
+                    diagnostics.record(section, elapsed)
+                if diagnostics.tracer.enabled:
+                    end = time.time()
+                    diagnostics.tracer.complete(section, "gui", end - elapsed, end)
+        return wrapper
+    return decorator
+
+class Diagnostics(QObject):
+    LAG_INTERVAL_MS = 50
+    LAG_HISTORY = 1200
+    TOP_ALLOCATORS = 10
+    PROFILE_LINES = 30
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.enabled = False
+        self.sections = defaultdict(lambda: [0, 0.0, 0.0])  # count, total, max
+        self.lag_samples = deque(maxlen=self.LAG_HISTORY)
+        self.lag_timer = QTimer(self)
+        self.lag_timer.timeout.connect(self.sample_lag)
+        self.last_tick = 0.0
+        self.tracemalloc_enabled = False
+        self.previous_snapshot = None
+        self.memory_report = ""
+        self.profiler = None
+        self.profile_rounds_left = 0
+        self.profile_report = ""
+        self.tracer = Tracer()
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if enabled:
+            self.last_tick = time.perf_counter()
+            self.lag_timer.start(self.LAG_INTERVAL_MS)
+        else:
+            self.lag_timer.stop()
+            self.set_tracemalloc(False)
+            self.tracer.set_enabled(False)
+            if self.profiler is not None:
+                self.finish_profile()
+
+    def sample_lag(self):
+        # The timer fires late by however long the main thread was busy with something else
+        now = time.perf_counter()
+        self.lag_samples.append(max(0.0, now - self.last_tick - self.LAG_INTERVAL_MS / 1000))
+        self.last_tick = now
+
+    def record(self, section, elapsed):
+        stats = self.sections[section]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    def reset(self):
+        self.sections.clear()
+        self.lag_samples.clear()
+        self.tracer.clear()
+
+    def set_tracemalloc(self, enabled):
+        if enabled and not self.tracemalloc_enabled:
+            tracemalloc.start()
+        elif not enabled and self.tracemalloc_enabled:
+            tracemalloc.stop()
+            self.previous_snapshot = None
+        self.tracemalloc_enabled = enabled
+
+    def start_profile(self, rounds):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.profiler = cProfile.Profile()
+        self.profile_rounds_left = rounds
+        self.profile_report = f"Profiling the next {rounds} round(s)..."
+        self.profiler.enable()
+
+    def finish_profile(self):
+        self.profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats("cumulative").print_stats(self.PROFILE_LINES)
+        self.profile_report = output.getvalue()
+        self.profiler = None
+
+    def round_finished(self, round_number):
+        if not self.enabled:
+            return
+        if self.tracemalloc_enabled:
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            if self.previous_snapshot is None:
+                stats = snapshot.statistics("lineno")
+            else:
+                stats = snapshot.compare_to(self.previous_snapshot, "lineno")
+            self.previous_snapshot = snapshot
+            current, peak = tracemalloc.get_traced_memory()
+            lines = [f"Round {round_number}: {current / 1024:.1f} KiB traced, {peak / 1024:.1f} KiB peak"]
+            lines.extend(str(stat) for stat in stats[:self.TOP_ALLOCATORS])
+            self.memory_report = "\n".join(lines)
+        if self.profiler is not None:
+            self.profile_rounds_left -= 1
+            if self.profile_rounds_left <= 0:
+                self.finish_profile()
+
+    def lag_summary(self):
+        if not self.lag_samples:
+            return "Event-loop lag: no samples yet"
+        samples = sorted(self.lag_samples)
+        p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+        return (f"Event-loop lag: last {self.lag_samples[-1] * 1000:.1f} ms, "
+                f"p95 {p95 * 1000:.1f} ms, max {samples[-1] * 1000:.1f} ms over {len(samples)} samples")
+
+    def report(self):
+        lines = [self.lag_summary(), "", f"{'Section':<24}{'Calls':>8}{'Total ms':>12}{'Avg ms':>10}{'Max ms':>10}"]
+        for section, (count, total, longest) in sorted(self.sections.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{section:<24}{count:>8}{total * 1000:>12.1f}{total * 1000 / count:>10.2f}{longest * 1000:>10.2f}")
+        if self.memory_report:
+            lines.extend(["", "Top allocators (tracemalloc):", self.memory_report])
+        if self.profile_report:
+            lines.extend(["", "cProfile:", self.profile_report])
+        if self.tracer.enabled or self.tracer.events:
+            lines.extend(["", f"Trace: {len(self.tracer.events)} spans buffered" + (f", last export {self.tracer.last_export} "
+                          "(open in ui.perfetto.dev)" if self.tracer.last_export else "")])
+        return "\n".join(lines)
+
 class ModernButton(QPushButton):
     def __init__(self, text, parent=None):
         super().__init__(text, parent)
         self.setFont(QFont("Segoe UI", 10))
         self.setCursor(Qt.PointingHandCursor)
-        self.setStyleSheet("""
-            QPushButton {
-                background-color: #45475a;
-                color: #cdd6f4;
-                border: none;
-                padding: 10px 20px;
-                border-radius: 8px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #585b70;
-            }
-            QPushButton:pressed {
-                background-color: #313244;
-            }
-            QPushButton:disabled {
-                background-color: #313244;
-                color: #6c7086;
-            }
-        """)
+        self.setProperty("modern", True)
 
 class ModernComboBox(QComboBox):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setFont(QFont("Segoe UI", 10))
-        self.setStyleSheet("""
-            QComboBox {
-                background-color: #313244;
-                color: #cdd6f4;
-                border: 1px solid #6c7086;
-                padding: 5px;
-                border-radius: 8px;
-            }
-            QComboBox::drop-down {
-                subcontrol-origin: padding;
-                subcontrol-position: top right;
-                width: 25px;
-                border-left-width: 1px;
-                border-left-color: #6c7086;
-                border-left-style: solid;
-                border-top-right-radius: 8px;
-                border-bottom-right-radius: 8px;
-            }
-            QComboBox QAbstractItemView {
-                background-color: #313244;
-                color: #cdd6f4;
-                selection-background-color: #585b70;
-            }
-        """)
 
 class ProviderButton(ModernButton):
     def __init__(self, text, parent=None):
         super().__init__(text, parent)
+        self.setProperty("provider", True)
         self.setCheckable(True)
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
-        self.setStyleSheet("""
-            QPushButton {
-                background-color: #45475a;
-                color: #cdd6f4;
-                border: none;
-                padding: 10px 20px;
-                border-radius: 8px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #585b70;
-            }
-            QPushButton:checked {
-                background-color: #cba6f7;
-                color: #1e1e2e;
-            }
-            QPushButton:disabled {
-                background-color: #313244;
-                color: #6c7086;
-            }
-        """)
 
-class ModelButton(ModernButton):
-    def __init__(self, model_name, parent=None):
-        super().__init__(model_name, parent)
-        self.model_name = model_name
-        self.setCheckable(True)
-        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
-        self.setStyleSheet("""
-            QPushButton {
-                background-color: #313244;
-                color: #cdd6f4;
-                border: none;
-                padding: 10px 20px;
-                border-radius: 8px;
-                text-align: left;
-            }
-            QPushButton:hover {
-                background-color: #45475a;
-            }
-            QPushButton:checked {
-                background-color: #cba6f7;
-                color: #1e1e2e;
-            }
-        """)
+class ModelCatalog(QAbstractListModel):
+    # Every provider's models in one flat list; pickers show slices of it through ModelFilter
+    PROVIDER_ROLE = Qt.UserRole
+    FULL_NAME_ROLE = Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []  # (provider, model)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        provider, model = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return model
+        if role == self.PROVIDER_ROLE:
+            return provider
+        if role in (self.FULL_NAME_ROLE, Qt.ToolTipRole):
+            return f"{provider}: {model}"
+        return None
+
+    def set_models(self, provider, models):
+        self.beginResetModel()
+        self.rows = [row for row in self.rows if row[0] != provider] + [(provider, model) for model in models]
+        self.endResetModel()
+
+class ModelFilter(QSortFilterProxyModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.provider = None
+        self.text = ""
+
+    def set_provider(self, provider):
+        self.provider = provider
+        self.invalidateFilter()
+
+    def set_text(self, text):
+        self.text = text.strip().lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        provider, model = self.sourceModel().rows[source_row]
+        return provider == self.provider and self.text in model.lower()
+
+class ModelPicker(QWidget):
+    model_selected = pyqtSignal(str)
+
+    def __init__(self, catalog, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(4)
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search models...")
+        self.search_input.setClearButtonEnabled(True)
+        layout.addWidget(self.search_input)
+
+        self.proxy = ModelFilter(self)
+        self.proxy.setSourceModel(catalog)
+        self.view = QListView()
+        self.view.setObjectName("modelPicker")
+        self.view.setModel(self.proxy)
+        self.view.setUniformItemSizes(True)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.setSelectionMode(QAbstractItemView.SingleSelection)
+        layout.addWidget(self.view)
+
+        # Only a click, Enter or select() changes the model; filtering moves Qt's current row, so the
+        # highlight is put back on the real selection afterwards
+        self.selected = ""
+        self.search_input.textChanged.connect(self.proxy.set_text)
+        self.search_input.textChanged.connect(self.show_selection)
+        self.search_input.returnPressed.connect(self.pick_first_match)
+        self.proxy.modelReset.connect(self.show_selection)
+        self.view.clicked.connect(self.pick)
+        self.view.activated.connect(self.pick)
+
+    def set_provider(self, provider):
+        self.search_input.clear()
+        self.proxy.set_provider(provider)
+        self.show_selection()
+
+    def pick_first_match(self):
+        if self.proxy.rowCount():
+            self.pick(self.proxy.index(0, 0))
+            self.view.setFocus()
+
+    def pick(self, index):
+        if index.isValid():
+            self.select(index.data())
+            self.model_selected.emit(index.data())
+
+    def select(self, model_name):
+        self.selected = model_name
+        self.show_selection()
+
+    def show_selection(self):
+        matches = self.proxy.match(self.proxy.index(0, 0), Qt.DisplayRole, self.selected, 1, Qt.MatchExactly) if self.selected else []
+        if matches:
+            self.view.setCurrentIndex(matches[0])
+        else:
+            self.view.selectionModel().clear()
 
 class APIKeyDialog(QDialog):
     def __init__(self, parent=None):
@@ -151,6 +804,9 @@ class APIKeyDialog(QDialog):
         self.anthropic_key = QLineEdit(self)
         self.openai_key = QLineEdit(self)
         self.ollama_ip = QLineEdit(self)
+        self.custom_url = QLineEdit(self)
+        self.custom_url.setPlaceholderText("http://localhost:8000/v1")
+        self.custom_key = QLineEdit(self)
 
         self.layout.addWidget(QLabel("Groq API Key:"))
         self.layout.addWidget(self.groq_key)
@@ -158,47 +814,26 @@ class APIKeyDialog(QDialog):
         self.layout.addWidget(self.anthropic_key)
         self.layout.addWidget(QLabel("OpenAI API Key:"))
         self.layout.addWidget(self.openai_key)
-        self.layout.addWidget(QLabel("Ollama IP Address:"))
+        self.layout.addWidget(QLabel("Ollama Hosts (comma-separated IP or host:port):"))
         self.layout.addWidget(self.ollama_ip)
+        self.layout.addWidget(QLabel("Custom OpenAI-Compatible Server URL (vLLM, llama.cpp, ...):"))
+        self.layout.addWidget(self.custom_url)
+        self.layout.addWidget(QLabel("Custom Server API Key (optional):"))
+        self.layout.addWidget(self.custom_key)
 
         self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, self)
         self.buttons.accepted.connect(self.accept)
         self.buttons.rejected.connect(self.reject)
         self.layout.addWidget(self.buttons)
 
-        self.setStyleSheet("""
-            QDialog {
-                background-color: #1e1e2e;
-                color: #cdd6f4;
-            }
-            QLabel {
-                color: #cdd6f4;
-            }
-            QLineEdit {
-                background-color: #313244;
-                color: #cdd6f4;
-                border: 1px solid #6c7086;
-                padding: 5px;
-                border-radius: 5px;
-            }
-            QPushButton {
-                background-color: #45475a;
-                color: #cdd6f4;
-                border: none;
-                padding: 10px 20px;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #585b70;
-            }
-        """)
-
     def get_keys(self):
         return {
             "groq": self.groq_key.text(),
             "anthropic": self.anthropic_key.text(),
             "openai": self.openai_key.text(),
-            "ollama_ip": self.ollama_ip.text()
+            "ollama_ip": self.ollama_ip.text(),
+            "custom_url": self.custom_url.text(),
+            "custom_key": self.custom_key.text()
         }
 
 class SettingsDialog(QDialog):
@@ -226,6 +861,14 @@ class SettingsDialog(QDialog):
         self.openai_key.setText(self.api_keys.get('openai', ''))
         self.ollama_ip = QLineEdit(self)
         self.ollama_ip.setText(self.api_keys.get('ollama_ip', ''))
+        self.ollama_max_concurrency = QSpinBox(self)
+        self.ollama_max_concurrency.setRange(1, 64)
+        self.ollama_max_concurrency.setValue(int(self.api_keys.get('ollama_max_concurrency', OllamaPool.DEFAULT_MAX_CONCURRENCY)))
+        self.custom_url = QLineEdit(self)
+        self.custom_url.setPlaceholderText("http://localhost:8000/v1")
+        self.custom_url.setText(self.api_keys.get('custom_url', ''))
+        self.custom_key = QLineEdit(self)
+        self.custom_key.setText(self.api_keys.get('custom_key', ''))
 
         self.api_layout.addWidget(QLabel("Groq API Key:"))
         self.api_layout.addWidget(self.groq_key)
@@ -233,8 +876,14 @@ class SettingsDialog(QDialog):
         self.api_layout.addWidget(self.anthropic_key)
         self.api_layout.addWidget(QLabel("OpenAI API Key:"))
         self.api_layout.addWidget(self.openai_key)
-        self.api_layout.addWidget(QLabel("Ollama IP Address:"))
+        self.api_layout.addWidget(QLabel("Ollama Hosts (comma-separated IP or host:port):"))
         self.api_layout.addWidget(self.ollama_ip)
+        self.api_layout.addWidget(QLabel("Max Concurrent Requests per Ollama Host:"))
+        self.api_layout.addWidget(self.ollama_max_concurrency)
+        self.api_layout.addWidget(QLabel("Custom OpenAI-Compatible Server URL (vLLM, llama.cpp, ...):"))
+        self.api_layout.addWidget(self.custom_url)
+        self.api_layout.addWidget(QLabel("Custom Server API Key (optional):"))
+        self.api_layout.addWidget(self.custom_key)
 
         self.tabs.addTab(self.api_tab, "API Keys")
 
@@ -243,56 +892,26 @@ class SettingsDialog(QDialog):
         self.buttons.rejected.connect(self.reject)
         layout.addWidget(self.buttons)
 
-        self.setStyleSheet("""
-            QDialog, QTabWidget, QWidget {
-                background-color: #1e1e2e;
-                color: #cdd6f4;
-            }
-            QLabel {
-                color: #cdd6f4;
-            }
-            QLineEdit {
-                background-color: #313244;
-                color: #cdd6f4;
-                border: 1px solid #6c7086;
-                padding: 5px;
-                border-radius: 5px;
-            }
-            QPushButton {
-                background-color: #45475a;
-                color: #cdd6f4;
-                border: none;
-                padding: 10px 20px;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #585b70;
-            }
-            QTabBar::tab {
-                background-color: #313244;
-                color: #cdd6f4;
-                padding: 8px;
-                margin-right: 2px;
-            }
-            QTabBar::tab:selected {
-                background-color: #45475a;
-            }
-        """)
-
     def get_keys(self):
         return {
             "groq": self.groq_key.text(),
             "anthropic": self.anthropic_key.text(),
             "openai": self.openai_key.text(),
-            "ollama_ip": self.ollama_ip.text()
+            "ollama_ip": self.ollama_ip.text(),
+            "ollama_max_concurrency": self.ollama_max_concurrency.value(),
+            "custom_url": self.custom_url.text(),
+            "custom_key": self.custom_key.text()
         }
 
 class CollaborationSettingsDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, settings=None, models=None):
         super().__init__(parent)
         self.setWindowTitle("Collaboration Settings")
         self.setModal(True)
+        self.models = models or []
         self.init_ui()
+        if settings:
+            self.set_settings(settings)
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -316,59 +935,322 @@ class CollaborationSettingsDialog(QDialog):
         layout.addWidget(self.temperature_label)
         layout.addWidget(self.temperature_input)
 
-        self.model1_role_label = QLabel("Role for Model 1:")
-        self.model1_role_dropdown = ModernComboBox()
-        self.model1_role_dropdown.addItems(Role.ROLES)
-        layout.addWidget(self.model1_role_label)
-        layout.addWidget(self.model1_role_dropdown)
-
-        self.model2_role_label = QLabel("Role for Model 2:")
-        self.model2_role_dropdown = ModernComboBox()
-        self.model2_role_dropdown.addItems(Role.ROLES)
-        layout.addWidget(self.model2_role_label)
-        layout.addWidget(self.model2_role_dropdown)
+        self.mode_label = QLabel("Collaboration Mode:")
+        self.mode_dropdown = ModernComboBox()
+        self.mode_dropdown.addItems(["Discussion", "Draft and Refine"])
+        layout.addWidget(self.mode_label)
+        layout.addWidget(self.mode_dropdown)
+
+        self.refine_after_label = QLabel("Start Refining After Draft Characters (0 to wait for the full draft):")
+        self.refine_after_input = QSpinBox()
+        self.refine_after_input.setRange(0, 100000)
+        self.refine_after_input.setValue(0)
+        layout.addWidget(self.refine_after_label)
+        layout.addWidget(self.refine_after_input)
+
+        self.scheduler_label = QLabel("Turn Order:")
+        self.scheduler_dropdown = ModernComboBox()
+        self.scheduler_dropdown.addItems(TurnScheduler.POLICIES)
+        layout.addWidget(self.scheduler_label)
+        layout.addWidget(self.scheduler_dropdown)
+
+        self.context_messages_label = QLabel("Latest Messages in Each Prompt (0 for the whole history):")
+        self.context_messages_input = QSpinBox()
+        self.context_messages_input.setRange(0, 10000)
+        self.context_messages_input.setValue(40)
+        layout.addWidget(self.context_messages_label)
+        layout.addWidget(self.context_messages_input)
+
+        self.chain_of_thought_checkbox = QCheckBox("Chain of Thought (reasoning stays out of the shared history)")
+        layout.addWidget(self.chain_of_thought_checkbox)
+
+        self.prewarm_checkbox = QCheckBox("Prewarm the Next Speaker's Prompt Cache (Round robin and Draft and Refine)")
+        self.prewarm_checkbox.setToolTip("Send a one-token request with the next speaker's prompt prefix while the current speaker streams")
+        layout.addWidget(self.prewarm_checkbox)
+
+        self.novelty_threshold_label = QLabel("Stop When Novelty Drops Below (0.0 - 1.0, 0 to disable):")
+        self.novelty_threshold_input = QLineEdit()
+        self.novelty_threshold_input.setText("0.25")
+        layout.addWidget(self.novelty_threshold_label)
+        layout.addWidget(self.novelty_threshold_input)
+
+        self.convergence_rounds_label = QLabel("Consecutive Low-Novelty Rounds Before Stopping:")
+        self.convergence_rounds_input = QSpinBox()
+        self.convergence_rounds_input.setRange(1, 100)
+        self.convergence_rounds_input.setValue(2)
+        layout.addWidget(self.convergence_rounds_label)
+        layout.addWidget(self.convergence_rounds_input)
+
+        self.ttft_deadline_label = QLabel("Time-to-First-Token Deadline (seconds, 0 to disable):")
+        self.ttft_deadline_input = QLineEdit()
+        self.ttft_deadline_input.setText("0")
+        layout.addWidget(self.ttft_deadline_label)
+        layout.addWidget(self.ttft_deadline_input)
+
+        self.turn_deadline_label = QLabel("Total Turn Deadline (seconds, 0 to disable):")
+        self.turn_deadline_input = QLineEdit()
+        self.turn_deadline_input.setText("0")
+        layout.addWidget(self.turn_deadline_label)
+        layout.addWidget(self.turn_deadline_input)
+
+        self.fallback_model_label = QLabel("Fallback Model When a Deadline Is Missed:")
+        self.fallback_model_dropdown = ModernComboBox()
+        self.fallback_model_dropdown.addItem("None")
+        self.fallback_model_dropdown.addItems(self.models)
+        layout.addWidget(self.fallback_model_label)
+        layout.addWidget(self.fallback_model_dropdown)
+
+        self.budget_tokens_label = QLabel("Session Token Budget (0 for unlimited):")
+        self.budget_tokens_input = QSpinBox()
+        self.budget_tokens_input.setRange(0, 100000000)
+        self.budget_tokens_input.setSingleStep(1000)
+        layout.addWidget(self.budget_tokens_label)
+        layout.addWidget(self.budget_tokens_input)
+
+        self.budget_dollars_label = QLabel("Session Dollar Budget (0 for unlimited):")
+        self.budget_dollars_input = QLineEdit()
+        self.budget_dollars_input.setText("0")
+        layout.addWidget(self.budget_dollars_label)
+        layout.addWidget(self.budget_dollars_input)
+
+        self.budget_model_tokens_label = QLabel("Token Budget per Model (0 for unlimited):")
+        self.budget_model_tokens_input = QSpinBox()
+        self.budget_model_tokens_input.setRange(0, 100000000)
+        self.budget_model_tokens_input.setSingleStep(1000)
+        layout.addWidget(self.budget_model_tokens_label)
+        layout.addWidget(self.budget_model_tokens_input)
+
+        self.best_of_n_label = QLabel("Best-of-N Samples for Single-Model Questions (1 to disable):")
+        self.best_of_n_input = QSpinBox()
+        self.best_of_n_input.setRange(1, 16)
+        self.best_of_n_input.setValue(1)
+        layout.addWidget(self.best_of_n_label)
+        layout.addWidget(self.best_of_n_input)
+
+        self.best_of_models_label = QLabel("Also Sample With:")
+        self.best_of_models_list = QListWidget()
+        self.best_of_models_list.setSelectionMode(QAbstractItemView.MultiSelection)
+        self.best_of_models_list.addItems(self.models)
+        self.best_of_models_list.setFixedHeight(90)
+        layout.addWidget(self.best_of_models_label)
+        layout.addWidget(self.best_of_models_list)
+
+        self.best_of_ranker_label = QLabel("Rank Samples By:")
+        self.best_of_ranker_dropdown = ModernComboBox()
+        self.best_of_ranker_dropdown.addItems(list(SampleRanker.METHODS))
+        layout.addWidget(self.best_of_ranker_label)
+        layout.addWidget(self.best_of_ranker_dropdown)
+
+        self.judge_model_label = QLabel("Judge Model:")
+        self.judge_model_dropdown = ModernComboBox()
+        self.judge_model_dropdown.addItem("None")
+        self.judge_model_dropdown.addItems(self.models)
+        layout.addWidget(self.judge_model_label)
+        layout.addWidget(self.judge_model_dropdown)
+
+        self.response_cache_label = QLabel("Reuse Earlier Single-Model Answers:")
+        self.response_cache_dropdown = ModernComboBox()
+        self.response_cache_dropdown.addItems(ResponseCache.MODES)
+        layout.addWidget(self.response_cache_label)
+        layout.addWidget(self.response_cache_dropdown)
+
+        self.cache_similarity_label = QLabel("Semantic Cache Similarity Threshold (0-1):")
+        self.cache_similarity_input = QLineEdit()
+        self.cache_similarity_input.setText("0.8")
+        layout.addWidget(self.cache_similarity_label)
+        layout.addWidget(self.cache_similarity_input)
 
         button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         button_box.accepted.connect(self.accept)
         button_box.rejected.connect(self.reject)
         layout.addWidget(button_box)
 
-        self.setStyleSheet("""
-            QDialog {
-                background-color: #1e1e2e;
-                color: #cdd6f4;
-            }
-            QLabel {
-                color: #cdd6f4;
-            }
-            QLineEdit, QSpinBox {
-                background-color: #313244;
-                color: #cdd6f4;
-                border: 1px solid #6c7086;
-                padding: 5px;
-                border-radius: 5px;
-            }
-            QPushButton {
-                background-color: #45475a;
-                color: #cdd6f4;
-                border: none;
-                padding: 10px 20px;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #585b70;
-            }
-        """)
-
     def get_settings(self):
         return {
             "rounds": int(self.rounds_input.value()),
             "max_tokens": int(self.max_tokens_input.text()),
             "temperature": float(self.temperature_input.text()),
-            "model1_role": self.model1_role_dropdown.currentText(),
-            "model2_role": self.model2_role_dropdown.currentText()
+            "mode": self.mode_dropdown.currentText(),
+            "refine_after_chars": int(self.refine_after_input.value()),
+            "scheduler": self.scheduler_dropdown.currentText(),
+            "context_messages": int(self.context_messages_input.value()),
+            "chain_of_thought": self.chain_of_thought_checkbox.isChecked(),
+            "prewarm_next_speaker": self.prewarm_checkbox.isChecked(),
+            "novelty_threshold": float(self.novelty_threshold_input.text()),
+            "convergence_rounds": int(self.convergence_rounds_input.value()),
+            "ttft_deadline": float(self.ttft_deadline_input.text()),
+            "turn_deadline": float(self.turn_deadline_input.text()),
+            "fallback_model": "" if self.fallback_model_dropdown.currentIndex() == 0 else self.fallback_model_dropdown.currentText(),
+            "budget_tokens": int(self.budget_tokens_input.value()),
+            "budget_dollars": float(self.budget_dollars_input.text()),
+            "budget_model_tokens": int(self.budget_model_tokens_input.value()),
+            "best_of_n": int(self.best_of_n_input.value()),
+            "best_of_models": [item.text() for item in self.best_of_models_list.selectedItems()],
+            "best_of_ranker": self.best_of_ranker_dropdown.currentText(),
+            "judge_model": "" if self.judge_model_dropdown.currentIndex() == 0 else self.judge_model_dropdown.currentText(),
+            "response_cache": self.response_cache_dropdown.currentText(),
+            "cache_similarity": float(self.cache_similarity_input.text())
         }
 
+    def set_settings(self, settings):
+        self.rounds_input.setValue(settings.get("rounds", 0))
+        self.max_tokens_input.setText(str(settings.get("max_tokens", 1000)))
+        self.temperature_input.setText(str(settings.get("temperature", 0.7)))
+        self.mode_dropdown.setCurrentText(settings.get("mode", "Discussion"))
+        self.refine_after_input.setValue(settings.get("refine_after_chars", 0))
+        self.scheduler_dropdown.setCurrentText(settings.get("scheduler", TurnScheduler.POLICIES[0]))
+        self.context_messages_input.setValue(settings.get("context_messages", 40))
+        self.chain_of_thought_checkbox.setChecked(settings.get("chain_of_thought", False))
+        self.prewarm_checkbox.setChecked(settings.get("prewarm_next_speaker", False))
+        self.novelty_threshold_input.setText(str(settings.get("novelty_threshold", 0.25)))
+        self.convergence_rounds_input.setValue(settings.get("convergence_rounds", 2))
+        self.ttft_deadline_input.setText(str(settings.get("ttft_deadline", 0)))
+        self.turn_deadline_input.setText(str(settings.get("turn_deadline", 0)))
+        if settings.get("fallback_model"):
+            self.fallback_model_dropdown.setCurrentText(settings["fallback_model"])
+        self.budget_tokens_input.setValue(settings.get("budget_tokens", 0))
+        self.budget_dollars_input.setText(str(settings.get("budget_dollars", 0)))
+        self.budget_model_tokens_input.setValue(settings.get("budget_model_tokens", 0))
+        self.best_of_n_input.setValue(settings.get("best_of_n", 1))
+        selected = set(settings.get("best_of_models", []))
+        for index in range(self.best_of_models_list.count()):
+            item = self.best_of_models_list.item(index)
+            item.setSelected(item.text() in selected)
+        self.best_of_ranker_dropdown.setCurrentText(settings.get("best_of_ranker", "Agreement vote"))
+        if settings.get("judge_model"):
+            self.judge_model_dropdown.setCurrentText(settings["judge_model"])
+        self.response_cache_dropdown.setCurrentText(settings.get("response_cache", "Off"))
+        self.cache_similarity_input.setText(str(settings.get("cache_similarity", 0.8)))
+
+class DiagnosticsDialog(QDialog):
+    def __init__(self, diagnostics, parent=None):
+        super().__init__(parent)
+        self.diagnostics = diagnostics
+        self.setWindowTitle("Diagnostics")
+        self.resize(720, 520)
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        controls_layout = QHBoxLayout()
+        self.tracemalloc_checkbox = QCheckBox("tracemalloc snapshot per round")
+        self.tracemalloc_checkbox.setChecked(self.diagnostics.tracemalloc_enabled)
+        self.tracemalloc_checkbox.toggled.connect(self.diagnostics.set_tracemalloc)
+        controls_layout.addWidget(self.tracemalloc_checkbox)
+
+        self.profile_rounds_input = QSpinBox()
+        self.profile_rounds_input.setRange(1, 1000)
+        self.profile_rounds_input.setValue(3)
+        self.profile_button = QPushButton("Profile Next Rounds")
+        self.profile_button.clicked.connect(lambda: self.diagnostics.start_profile(self.profile_rounds_input.value()))
+        controls_layout.addWidget(self.profile_rounds_input)
+        controls_layout.addWidget(self.profile_button)
+
+        self.trace_checkbox = QCheckBox("Trace spans")
+        self.trace_checkbox.setChecked(self.diagnostics.tracer.enabled)
+        self.trace_checkbox.toggled.connect(self.diagnostics.tracer.set_enabled)
+        controls_layout.addWidget(self.trace_checkbox)
+        self.export_trace_button = QPushButton("Export Trace...")
+        self.export_trace_button.clicked.connect(self.export_trace)
+        controls_layout.addWidget(self.export_trace_button)
+
+        self.reset_button = QPushButton("Reset")
+        self.reset_button.clicked.connect(self.diagnostics.reset)
+        controls_layout.addWidget(self.reset_button)
+        layout.addLayout(controls_layout)
+
+        self.report_display = QTextEdit()
+        self.report_display.setReadOnly(True)
+        self.report_display.setFont(QFont("Consolas", 9))
+        self.report_display.setLineWrapMode(QTextEdit.NoWrap)
+        layout.addWidget(self.report_display)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+
+    def refresh(self):
+        if self.isVisible():
+            self.report_display.setPlainText(self.diagnostics.report())
+
+    def export_trace(self):
+        default = time.strftime("trace-%Y%m%d-%H%M%S.json")
+        path, _ = QFileDialog.getSaveFileName(self, "Export Trace", default, "Chrome trace (*.json)")
+        if path:
+            self.diagnostics.tracer.export(path)
+            self.refresh()
+
+class SamplesDialog(QDialog):
+    def __init__(self, samples, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Best-of-N Samples")
+        self.resize(720, 520)
+        layout = QVBoxLayout(self)
+
+        tabs = QTabWidget()
+        for rank, sample in enumerate(samples, 1):
+            display = QTextEdit()
+            display.setReadOnly(True)
+            display.setFont(QFont("Segoe UI", 10))
+            display.setPlainText(sample["text"] or f"Error: {sample['error']}")
+            model_name = sample["model"].split(": ", 1)[1]
+            tabs.addTab(display, f"#{rank} {model_name} ({sample['score']:.2f})")
+            tabs.setTabToolTip(rank - 1, f"Temperature {sample['temperature']:.2f}, {sample['elapsed']:.2f}s")
+        layout.addWidget(tabs)
+
+class BatchDialog(QDialog):
+    def __init__(self, models, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Batch Run")
+        self.resize(640, 520)
+        layout = QVBoxLayout(self)
+
+        layout.addWidget(QLabel("Prompts (one per line, or load a .txt or .jsonl file with a \"prompt\" field):"))
+        self.prompts_input = QTextEdit()
+        self.prompts_input.setAcceptRichText(False)
+        layout.addWidget(self.prompts_input)
+        self.load_button = QPushButton("Load File...")
+        self.load_button.clicked.connect(self.load_prompts)
+        layout.addWidget(self.load_button)
+
+        layout.addWidget(QLabel("Model (OpenAI or Anthropic):"))
+        self.model_dropdown = ModernComboBox()
+        self.model_dropdown.setEditable(True)
+        self.model_dropdown.addItems(models)
+        layout.addWidget(self.model_dropdown)
+
+        layout.addWidget(QLabel("Batch API Base URL (empty for the provider's own):"))
+        self.base_url_input = QLineEdit()
+        self.base_url_input.setPlaceholderText(f"{OpenAIBatch.BASE_URL} or {AnthropicBatch.BASE_URL}")
+        layout.addWidget(self.base_url_input)
+
+        layout.addWidget(QLabel("Poll Every (seconds):"))
+        self.poll_interval_input = QSpinBox()
+        self.poll_interval_input.setRange(1, 3600)
+        self.poll_interval_input.setValue(BatchWorker.POLL_INTERVAL)
+        layout.addWidget(self.poll_interval_input)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+
+    def load_prompts(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Prompts", "", "Prompts (*.txt *.jsonl)")
+        if not path:
+            return
+        with open(path, encoding="utf-8") as file:
+            if path.endswith(".jsonl"):
+                prompts = [json.loads(line)["prompt"].replace("\n", " ") for line in file if line.strip()]
+            else:
+                prompts = [line.rstrip("\n") for line in file]
+        self.prompts_input.setPlainText("\n".join(prompts))
+
+    def get_batch(self):
+        prompts = [line.strip() for line in self.prompts_input.toPlainText().splitlines() if line.strip()]
+        return self.model_dropdown.currentText().strip(), prompts, self.base_url_input.text().strip(), self.poll_interval_input.value()
+
 class Role:
     ROLES = [
         "General Assistant",
@@ -393,77 +1275,193 @@ class Role:
         "Chef"
     ]
 
-class CodeHighlighter(QSyntaxHighlighter):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.formatter = HtmlFormatter(style='monokai')
-
-    def highlightBlock(self, text):
-        highlighted = highlight(text, PythonLexer(), self.formatter)
-        soup = BeautifulSoup(highlighted, 'html.parser')
-
-        format_dict = {
-            'k': QColor('#f92672'),  # Keyword
-            's': QColor('#e6db74'),  # String
-            'c': QColor('#75715e'),  # Comment
-            'n': QColor('#a6e22e'),  # Name
-            'o': QColor('#f92672'),  # Operator
-            'p': QColor('#f8f8f2'),  # Punctuation
-        }
+class MarkdownStream:
+    HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+    LIST_ITEM = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+    TABLE_SEPARATOR = re.compile(r"^\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?$")
+    INLINE_CODE = re.compile(r"`([^`]+)`")
+    BOLD = re.compile(r"\*\*(.+?)\*\*|__(.+?)__")
+    ITALIC = re.compile(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?!\*)|(?<!\w)_(?!\s)(.+?)(?<!\s)_(?!\w)")
+    LINK = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+    HEADING_SIZES = {1: 20, 2: 17, 3: 15, 4: 13, 5: 12, 6: 11}
+    CODE_STYLE = "font-family: Consolas, 'Courier New', monospace; background-color: #181825;"
+
+    def __init__(self):
+        self.buffer = ""
+        self.offset = 0  # Raw characters consumed by emitted fragments
+        self.in_code = False
+        self.lexer = None
+        self.table_rows = []
+        self.formatter = HtmlFormatter(style='monokai', nowrap=True, noclasses=True)
+
+    def feed(self, text):
+        self.buffer += text
+        fragments = []
+        while True:
+            newline = self.buffer.find("\n")
+            if newline < 0:
+                break
+            line = self.buffer[:newline]
+            self.buffer = self.buffer[newline + 1:]
+            self.process_line(line, len(line) + 1, fragments)
+        return fragments
+
+    def finish(self):
+        fragments = []
+        if self.buffer:
+            line, self.buffer = self.buffer, ""
+            self.process_line(line, len(line), fragments)
+        self.flush_table(fragments)
+        self.in_code = False
+        return fragments
+
+    def process_line(self, line, length, fragments):
+        stripped = line.strip()
+        if self.in_code:
+            if stripped.startswith("```"):
+                self.in_code = False
+                html = None
+            else:
+                html = self.render_code_line(line)
+        elif stripped.startswith("|"):
+            self.table_rows.append(stripped)
+            self.offset += length
+            return
+        else:
+            self.flush_table(fragments)
+            if stripped.startswith("```"):
+                self.in_code = True
+                self.lexer = self.code_lexer(stripped[3:].strip())
+                html = None
+            else:
+                html = self.render_line(line)
+        self.offset += length
+        fragments.append((html, self.offset))
+
+    def flush_table(self, fragments):
+        if not self.table_rows:
+            return
+        rows = [row for row in self.table_rows if not self.TABLE_SEPARATOR.match(row)]
+        self.table_rows = []
+        html = ['<table border="1" cellspacing="0" cellpadding="4" style="border-color: #6c7086;">']
+        for index, row in enumerate(rows):
+            cells = [cell.strip() for cell in row.strip("|").split("|")]
+            tag = "th" if index == 0 else "td"
+            html.append("<tr>" + "".join(f"<{tag}>{self.render_inline(cell)}</{tag}>" for cell in cells) + "</tr>")
+        html.append("</table>")
+        fragments.append(("".join(html), self.offset))
+
+    def code_lexer(self, language):
+        try:
+            return get_lexer_by_name(language) if language else TextLexer()
+        except ClassNotFound:
+            return TextLexer()
+
+    def render_code_line(self, line):
+        code = highlight(line, self.lexer, self.formatter).rstrip("\n")
+        return f'<pre style="margin: 0; {self.CODE_STYLE}">{code}</pre>'
+
+    def render_line(self, line):
+        stripped = line.strip()
+        if not stripped:
+            return None
+        heading = self.HEADING.match(stripped)
+        if heading:
+            size = self.HEADING_SIZES[len(heading.group(1))]
+            return f'<p><span style="font-size: {size}pt; font-weight: bold;">{self.render_inline(heading.group(2))}</span></p>'
+        if re.fullmatch(r"(-{3,}|\*{3,}|_{3,})", stripped):
+            return '<hr/>'
+        item = self.LIST_ITEM.match(line)
+        if item:
+            indent = "&nbsp;" * (2 + len(item.group(1).expandtabs(4)))
+            marker = "•" if item.group(2) in "-*+" else item.group(2)
+            return f'<p>{indent}{marker} {self.render_inline(item.group(3))}</p>'
+        if stripped.startswith(">"):
+            return f'<p><span style="color: #a6adc8; font-style: italic;">│ {self.render_inline(stripped.lstrip("> "))}</span></p>'
+        return f'<p>{self.render_inline(stripped)}</p>'
+
+    def render_inline(self, text):
+        parts = self.INLINE_CODE.split(text)
+        rendered = []
+        for index, part in enumerate(parts):
+            escaped = html_escape(part, quote=False)
+            if index % 2:
+                rendered.append(f'<span style="{self.CODE_STYLE}">{escaped}</span>')
+                continue
+            escaped = self.LINK.sub(r'<a href="\2" style="color: #89b4fa;">\1</a>', escaped)
+            escaped = self.BOLD.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", escaped)
+            escaped = self.ITALIC.sub(lambda m: f"<i>{m.group(1) or m.group(2)}</i>", escaped)
+            rendered.append(escaped)
+        return "".join(rendered)
+
+class MarkdownRenderer(QObject):
+    fragment_ready = pyqtSignal(int, object, int)
+    response_rendered = pyqtSignal(int)
+
+    def __init__(self):
+        super().__init__()
+        self.streams = {}
 
-        self.setFormat(0, len(text), QTextCharFormat())  # Reset format
+    @pyqtSlot(int, str)
+    def feed(self, response_id, text):
+        stream = self.streams.setdefault(response_id, MarkdownStream())
+        self.emit_fragments(response_id, stream.feed(text))
 
-        pos = 0
-        for tag in soup.find_all(['span']):
-            class_name = tag.get('class', [None])[0]
-            if class_name in format_dict:
-                color = format_dict[class_name]
-                char_format = QTextCharFormat()
-                char_format.setForeground(color)
-                start = text.find(tag.get_text(), pos)
-                end = start + len(tag.get_text())
-                self.setFormat(start, end - start, char_format)
-                pos = end
+    @pyqtSlot(int)
+    def finish(self, response_id):
+        stream = self.streams.pop(response_id, None)
+        if stream is not None:
+            self.emit_fragments(response_id, stream.finish())
+        self.response_rendered.emit(response_id)
+
+    @pyqtSlot()
+    def reset(self):
+        self.streams.clear()
+
+    def emit_fragments(self, response_id, fragments):
+        # Parsing the HTML into a document is the expensive part, so it happens here
+        for html, consumed in fragments:
+            document = None
+            if html:
+                document = QTextDocument()
+                document.setDefaultFont(QFont("Segoe UI", 11))
+                document.setHtml(html)
+                document.moveToThread(QApplication.instance().thread())
+            self.fragment_ready.emit(response_id, document, consumed)
 
 class ChatBox(QWidget):
+    MAX_DOCUMENT_CHARS = 200000  # Scrollback kept in the view; the session history keeps every turn
+
+    render_requested = pyqtSignal(int, str)
+    render_finish_requested = pyqtSignal(int)
+    render_reset_requested = pyqtSignal()
+
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
+        self.diagnostics = main_window.diagnostics
         self.init_ui()
         self.model_colors = {}
+        self.live = True
+        self.pending = []  # Updates queued while the tab is hidden, replayed when it is shown
+        self.init_renderer()
 
     def init_ui(self):
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
 
-        self.chat_display = QTextEdit()
-        self.chat_display.setReadOnly(True)
+        self.chat_display = QTextBrowser()
+        self.chat_display.setObjectName("chatDisplay")
+        self.chat_display.setOpenLinks(False)
+        self.chat_display.anchorClicked.connect(self.toggle_panel)
         self.chat_display.setFont(QFont("Segoe UI", 11))
-        self.chat_display.setStyleSheet("""
-            QTextEdit {
-                background-color: #1e1e2e;
-                color: #cdd6f4;
-                border: none;
-                padding: 10px;
-                border-radius: 10px;
-            }
-        """)
-        self.highlighter = CodeHighlighter(self.chat_display.document())
         layout.addWidget(self.chat_display)
 
         input_layout = QHBoxLayout()
         self.chat_input = QLineEdit()
+        self.chat_input.setObjectName("chatInput")
         self.chat_input.setPlaceholderText("Type your message here...")
         self.chat_input.setFont(QFont("Segoe UI", 11))
-        self.chat_input.setStyleSheet("""
-            QLineEdit {
-                background-color: #313244;
-                color: #cdd6f4;
-                border: 1px solid #6c7086;
-                padding: 10px;
-                border-radius: 8px;
-            }
-        """)
         self.send_button = ModernButton("Send")
         input_layout.addWidget(self.chat_input)
         input_layout.addWidget(self.send_button)
@@ -475,13 +1473,55 @@ class ChatBox(QWidget):
         self.current_model_name = ""
         self.current_is_user = False
 
+    def init_renderer(self):
+        self.response_id = 0
+        self.streams = {}  # response id -> [tail start position, unrendered raw tail, raw characters rendered]
+        self.active_response = None
+        self.unsent = ""  # Text of the active response not yet handed to the renderer
+        self.panels = {}  # panel id -> [title, text, expanded, cursor selecting the panel]
+        self.renderer_thread = QThread(self)
+        self.renderer = MarkdownRenderer()
+        self.renderer.moveToThread(self.renderer_thread)
+        self.render_requested.connect(self.renderer.feed)
+        self.render_finish_requested.connect(self.renderer.finish)
+        self.render_reset_requested.connect(self.renderer.reset)
+        self.renderer.fragment_ready.connect(self.splice_fragment)
+        self.renderer.response_rendered.connect(self.drop_stream)
+        self.renderer_thread.finished.connect(self.renderer.deleteLater)
+        self.renderer_thread.start()
+
+    def shutdown_renderer(self):
+        self.renderer_thread.quit()
+        self.renderer_thread.wait()
+
     def send_message(self):
         message = self.chat_input.text().strip()
         if message:
             self.main_window.handle_message(message)
             self.chat_input.clear()
 
+    def set_live(self, live):
+        self.live = live
+        if live:
+            pending, self.pending = self.pending, []
+            started = time.time()
+            for name, args in pending:
+                getattr(self, name)(*args)
+            if pending and self.diagnostics.tracer.enabled:
+                self.diagnostics.tracer.complete("replay hidden updates", "gui", started, time.time(), updates=len(pending))
+
+    def defer(self, name, *args):
+        if name == "append_response" and self.pending and self.pending[-1][0] == name and self.pending[-1][1][1] == args[1]:
+            # Consecutive tokens of one response are replayed as a single insert
+            self.pending[-1] = (name, (self.pending[-1][1][0] + args[0], args[1]))
+        else:
+            self.pending.append((name, args))
+
+    @timed("display_message")
     def display_message(self, message, is_user=False, append=False):
+        if not self.live:
+            self.defer("display_message", message, is_user, append)
+            return
         cursor = self.chat_display.textCursor()
         cursor.movePosition(QTextCursor.End)
 
@@ -519,12 +1559,186 @@ class ChatBox(QWidget):
         self.chat_display.setTextCursor(cursor)
         self.chat_display.ensureCursorVisible()
 
+    def text_format(self, color="#cdd6f4", bold=False):
+        format = QTextCharFormat()
+        format.setFont(QFont("Segoe UI", 11))
+        format.setForeground(QColor(color))
+        format.setFontWeight(QFont.Bold if bold else QFont.Normal)
+        return format
+
+    def begin_response(self, model_name):
+        if not self.live:
+            self.defer("begin_response", model_name)
+            return
+        self.finish_response()
+        cursor = self.chat_display.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText("\n")
+        color = self.model_colors.get(model_name, QColor("#cdd6f4"))
+        cursor.insertText(f"{model_name}:", self.text_format(color.name(), bold=True))
+        cursor.insertBlock()
+        self.response_id += 1
+        self.active_response = self.response_id
+        self.streams[self.response_id] = [cursor.position(), "", 0]
+        self.chat_display.setTextCursor(cursor)
+
+    @timed("append_response")
+    def append_response(self, text, model_name):
+        if not self.live:
+            self.defer("append_response", text, model_name)
+            return
+        if self.active_response is None:
+            self.begin_response(model_name)
+        stream = self.streams[self.active_response]
+        # Show the raw text right away; the renderer replaces it with formatted fragments
+        cursor = QTextCursor(self.chat_display.document())
+        cursor.setPosition(stream[0] + len(stream[1]))
+        cursor.insertText(text, self.text_format())
+        stream[1] += text
+        # The renderer only emits fragments for whole lines, so it is fed a line at a time instead of a signal per token
+        self.unsent += text
+        if "\n" in text:
+            self.render_requested.emit(self.active_response, self.unsent)
+            self.unsent = ""
+        self.chat_display.setTextCursor(cursor)
+        self.chat_display.ensureCursorVisible()
+
+    def finish_response(self):
+        if not self.live:
+            self.defer("finish_response")
+            return
+        if self.active_response is not None:
+            if self.unsent:
+                self.render_requested.emit(self.active_response, self.unsent)
+                self.unsent = ""
+            self.render_finish_requested.emit(self.active_response)
+            self.active_response = None
+            self.trim_scrollback()
+
+    def trim_scrollback(self):
+        document = self.chat_display.document()
+        excess = document.characterCount() - self.MAX_DOCUMENT_CHARS
+        if excess <= 0:
+            return
+        # Cut a quarter of the limit more than needed so this runs rarely, at a block boundary ahead of any text
+        # the renderer has yet to replace
+        limit = min([stream[0] for stream in self.streams.values()] + [excess + self.MAX_DOCUMENT_CHARS // 4])
+        end = document.findBlock(limit).position()
+        if end <= 0:
+            return
+        for panel_id, panel in list(self.panels.items()):
+            if panel[3].selectionEnd() <= end:
+                del self.panels[panel_id]
+        cursor = QTextCursor(document)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        self.shift_streams(0, -end)
+
+    @pyqtSlot(int, object, int)
+    @timed("splice_fragment")
+    def splice_fragment(self, response_id, document, consumed):
+        stream = self.streams.get(response_id)
+        if stream is None:
+            return
+        tail_start, raw_tail, rendered = stream
+        # consumed counts raw characters from the start of the response; the tail holds the unrendered rest
+        remaining = raw_tail[consumed - rendered:]
+        cursor = QTextCursor(self.chat_display.document())
+        cursor.setPosition(tail_start)
+        cursor.setPosition(tail_start + len(raw_tail), QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        if document is not None:
+            if not cursor.atBlockStart():
+                cursor.insertBlock()
+            cursor.insertFragment(QTextDocumentFragment(document))
+            cursor.insertBlock(QTextBlockFormat(), self.text_format())
+        new_start = cursor.position()
+        cursor.insertText(remaining, self.text_format())
+        stream[:] = [new_start, remaining, consumed]
+        shift = cursor.position() - (tail_start + len(raw_tail))
+        if shift:
+            for other_id, other in self.streams.items():
+                if other_id > response_id:
+                    other[0] += shift
+        if response_id == self.active_response:
+            self.chat_display.ensureCursorVisible()
+
+    def drop_stream(self, response_id):
+        self.streams.pop(response_id, None)
+
+    def shift_streams(self, position, shift):
+        for stream in self.streams.values():
+            if stream[0] >= position:
+                stream[0] += shift
+
+    def add_panel(self, title, text, model_name):
+        if not self.live:
+            self.defer("add_panel", title, text, model_name)
+            return
+        stream = self.streams.get(self.active_response)
+        if stream is None or stream[1] or stream[2]:
+            # Reasoning that arrives after some output starts a fresh block below it
+            self.begin_response(model_name)
+            stream = self.streams[self.active_response]
+        panel_id = len(self.panels) + 1
+        cursor = QTextCursor(self.chat_display.document())
+        cursor.setPosition(stream[0])
+        start = cursor.position()
+        self.insert_panel(cursor, panel_id, title, text, False)
+        end = cursor.position()
+        self.shift_streams(start, end - start)
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        cursor.setKeepPositionOnInsert(True)
+        self.panels[panel_id] = [title, text, False, cursor]
+
+    def insert_panel(self, cursor, panel_id, title, text, expanded):
+        link = self.text_format("#6c7086", bold=True)
+        link.setAnchor(True)
+        link.setAnchorHref(f"panel:{panel_id}")
+        if expanded:
+            cursor.insertText(f"▾ {title}", link)
+            cursor.insertBlock(QTextBlockFormat(), self.text_format())
+            body = self.text_format("#6c7086")
+            body.setFontItalic(True)
+            cursor.insertText(text, body)
+        else:
+            cursor.insertText(f"▸ {title} ({len(text.split())} words)", link)
+        cursor.insertBlock(QTextBlockFormat(), self.text_format())
+
+    def toggle_panel(self, url):
+        if url.scheme() != "panel":
+            return
+        panel = self.panels.get(int(url.path()))
+        if panel is None:
+            return
+        title, text, expanded, selection = panel
+        start, end = selection.selectionStart(), selection.selectionEnd()
+        cursor = QTextCursor(self.chat_display.document())
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        self.insert_panel(cursor, int(url.path()), title, text, not expanded)
+        self.shift_streams(end, cursor.position() - end)
+        selection.setPosition(start)
+        selection.setPosition(cursor.position(), QTextCursor.KeepAnchor)
+        panel[2] = not expanded
+
     def clear_chat(self):
         self.chat_display.clear()
+        self.pending.clear()
+        self.panels.clear()
+        self.streams.clear()
+        self.active_response = None
+        self.unsent = ""
+        self.render_reset_requested.emit()
 
 class VisualizationWidget(QWidget):
-    def __init__(self, parent=None):
+    MAX_ROUNDS = 50  # Only the latest rounds are drawn, so a redraw costs the same however long the session runs
+
+    def __init__(self, parent=None, diagnostics=None):
         super().__init__(parent)
+        self.diagnostics = diagnostics
         self.init_ui()
 
     def init_ui(self):
@@ -541,11 +1755,25 @@ class VisualizationWidget(QWidget):
 
         layout.addWidget(self.chart_view)
 
-    def update_chart(self, data):
-        QMetaObject.invokeMethod(self, "update_chart_internal", Qt.QueuedConnection, Q_ARG(dict, data))
-
-    @pyqtSlot(dict)
-    def update_chart_internal(self, data):
+        self.spend_label = QLabel("Spent 0 tokens")
+        self.spend_label.setObjectName("spendLabel")
+        layout.addWidget(self.spend_label)
+
+    def update_spend(self, text):
+        self.spend_label.setText(text)
+
+    def update_chart(self, data, markers=None):
+        rounds = max((len(times) for times in data.values()), default=0)
+        first = max(1, rounds - self.MAX_ROUNDS + 1)
+        # Round r of a model is times[r - 1]; only rounds from first on are passed and drawn
+        data = {model: times[first - 1:] for model, times in data.items()}
+        markers = [marker for marker in markers or [] if marker[0] >= first]
+        QMetaObject.invokeMethod(self, "update_chart_internal", Qt.QueuedConnection,
+                                 Q_ARG(dict, data), Q_ARG(list, markers), Q_ARG(int, first))
+
+    @pyqtSlot(dict, list, int)
+    @timed("update_chart_internal")
+    def update_chart_internal(self, data, markers, first=1):
         self.chart.removeAllSeries()
         for axis in self.chart.axes():
             self.chart.removeAxis(axis)
@@ -553,7 +1781,8 @@ class VisualizationWidget(QWidget):
         bar_series = QBarSeries()
         line_series_list = []
 
-        axis_x = QValueAxis()
+        # Bars and points at x = i share the category of round first + i
+        axis_x = QBarCategoryAxis()
         axis_x.setTitleText("Round")
         self.chart.addAxis(axis_x, Qt.AlignBottom)
 
@@ -571,13 +1800,12 @@ class VisualizationWidget(QWidget):
             line_series = QLineSeries()
             line_series.setName(model)
             for i, time in enumerate(times):
-                line_series.append(i + 1, time)
+                line_series.append(i, time)
             line_series_list.append(line_series)
 
             max_rounds = max(max_rounds, len(times))
 
-        axis_x.setRange(1, max_rounds)
-        axis_x.setTickCount(max_rounds)
+        axis_x.append([str(first + i) for i in range(max_rounds)])
 
         self.chart.addSeries(bar_series)
         bar_series.attachAxis(axis_x)
@@ -588,10 +1816,43 @@ class VisualizationWidget(QWidget):
             line_series.attachAxis(axis_x)
             line_series.attachAxis(axis_y)
 
+        if markers:
+            swap_series = QScatterSeries()
+            swap_series.setName("Fallback swaps")
+            swap_series.setColor(QColor("#f38ba8"))
+            swap_series.setMarkerSize(12)
+            for round_index, seconds in markers:
+                swap_series.append(round_index - first, seconds)
+            self.chart.addSeries(swap_series)
+            swap_series.attachAxis(axis_x)
+            swap_series.attachAxis(axis_y)
+
         self.chart.setTitle("Model Response Times")
         self.chart_view.setChart(self.chart)
 
+class ParticipantRow(QWidget):
+    def __init__(self, model, role, parent=None):
+        super().__init__(parent)
+        self.model = model
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.model_label = QLabel(model.split(": ", 1)[1])
+        self.model_label.setToolTip(model)
+        self.role_dropdown = ModernComboBox()
+        self.role_dropdown.addItems(Role.ROLES)
+        self.role_dropdown.setCurrentText(role)
+        self.remove_button = QPushButton("✕")
+        self.remove_button.setObjectName("removeParticipant")
+        self.remove_button.setFixedWidth(28)
+
+        layout.addWidget(self.model_label, 1)
+        layout.addWidget(self.role_dropdown, 1)
+        layout.addWidget(self.remove_button)
+
 class ControlPanel(QWidget):
+    DEFAULT_ROLES = ["General Assistant", "Technical Expert", "Creative Thinker", "Debater"]
+
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
@@ -603,30 +1864,13 @@ class ControlPanel(QWidget):
         layout.setSpacing(15)
 
         self.mode_tabs = QTabWidget()
-        self.mode_tabs.setStyleSheet("""
-            QTabWidget::pane {
-                border: 1px solid #6c7086;
-                background: #1e1e2e;
-                border-radius: 8px;
-            }
-            QTabBar::tab {
-                background: #313244;
-                color: #cdd6f4;
-                padding: 10px;
-                margin-right: 2px;
-                border-top-left-radius: 8px;
-                border-top-right-radius: 8px;
-            }
-            QTabBar::tab:selected {
-                background: #45475a;
-            }
-        """)
+        self.mode_tabs.setObjectName("modeTabs")
         layout.addWidget(self.mode_tabs)
 
         self.init_single_model_tab()
         self.init_collab_tab()
 
-        self.visualization = VisualizationWidget()
+        self.visualization = VisualizationWidget(diagnostics=self.main_window.diagnostics)
         layout.addWidget(self.visualization)
 
         self.init_control_buttons(layout)
@@ -647,46 +1891,26 @@ class ControlPanel(QWidget):
         self.anthropic_button = ProviderButton("Anthropic")
         self.groq_button = ProviderButton("Groq")
         self.ollama_button = ProviderButton("Ollama")
+        self.custom_button = ProviderButton("Custom")
 
         self.openai_button.clicked.connect(lambda: self.select_provider("OpenAI"))
         self.anthropic_button.clicked.connect(lambda: self.select_provider("Anthropic"))
         self.groq_button.clicked.connect(lambda: self.select_provider("Groq"))
         self.ollama_button.clicked.connect(lambda: self.select_provider("Ollama"))
+        self.custom_button.clicked.connect(lambda: self.select_provider("Custom"))
 
         self.provider_buttons_layout.addWidget(self.openai_button)
         self.provider_buttons_layout.addWidget(self.anthropic_button)
         self.provider_buttons_layout.addWidget(self.groq_button)
         self.provider_buttons_layout.addWidget(self.ollama_button)
+        self.provider_buttons_layout.addWidget(self.custom_button)
 
         single_model_layout.addLayout(self.provider_buttons_layout)
 
-        self.model_buttons_scroll_area = QScrollArea()
-        self.model_buttons_widget = QWidget()
-        self.model_buttons_layout = QGridLayout(self.model_buttons_widget)
-        self.model_buttons_scroll_area.setWidget(self.model_buttons_widget)
-        self.model_buttons_scroll_area.setWidgetResizable(True)
-        self.model_buttons_scroll_area.setFixedHeight(200)
-        self.model_buttons_scroll_area.setStyleSheet("""
-            QScrollArea {
-                border: 1px solid #6c7086;
-                border-radius: 8px;
-                background-color: #1e1e2e;
-            }
-            QScrollBar:vertical {
-                background: #313244;
-                width: 10px;
-                margin: 0px;
-            }
-            QScrollBar::handle:vertical {
-                background: #45475a;
-                min-height: 20px;
-                border-radius: 5px;
-            }
-            QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {
-                height: 0px;
-            }
-        """)
-        single_model_layout.addWidget(self.model_buttons_scroll_area)
+        self.model_picker = ModelPicker(self.main_window.model_catalog)
+        self.model_picker.view.setFixedHeight(160)
+        self.model_picker.model_selected.connect(self.select_model)
+        single_model_layout.addWidget(self.model_picker)
 
         single_model_layout.addWidget(QLabel("Role for the model:"))
         self.role_dropdown = ModernComboBox()
@@ -694,132 +1918,61 @@ class ControlPanel(QWidget):
         single_model_layout.addWidget(self.role_dropdown)
 
         self.chain_of_thought_checkbox = QCheckBox("Enable Chain of Thought")
-        self.chain_of_thought_checkbox.setStyleSheet("""
-            QCheckBox {
-                color: #cdd6f4;
-            }
-            QCheckBox::indicator {
-                width: 18px;
-                height: 18px;
-                border-radius: 4px;
-                border: 1px solid #6c7086;
-            }
-            QCheckBox::indicator:unchecked {
-                background-color: #313244;
-            }
-            QCheckBox::indicator:checked {
-                background-color: #cba6f7;
-            }
-        """)
         single_model_layout.addWidget(self.chain_of_thought_checkbox)
 
+        self.other_samples_button = ModernButton("Show Other Samples")
+        self.other_samples_button.setEnabled(False)
+        self.other_samples_button.clicked.connect(self.main_window.show_other_samples)
+        single_model_layout.addWidget(self.other_samples_button)
+
+        self.bypass_cache_button = ModernButton("Ask Without Cache")
+        self.bypass_cache_button.setToolTip("Send the question answered from the cache to the model")
+        self.bypass_cache_button.setEnabled(False)
+        self.bypass_cache_button.clicked.connect(self.main_window.bypass_cache)
+        single_model_layout.addWidget(self.bypass_cache_button)
+
         self.mode_tabs.addTab(single_model_widget, "Single Model")
 
     def init_collab_tab(self):
         collab_widget = QWidget()
         collab_layout = QVBoxLayout(collab_widget)
 
-        collab_layout.addWidget(QLabel("Model 1 Provider:"))
-        self.provider_buttons_layout1 = QHBoxLayout()
-        self.model1_openai_button = ProviderButton("OpenAI")
-        self.model1_anthropic_button = ProviderButton("Anthropic")
-        self.model1_groq_button = ProviderButton("Groq")
-        self.model1_ollama_button = ProviderButton("Ollama")
-
-        self.model1_openai_button.clicked.connect(lambda: self.select_provider1("OpenAI"))
-        self.model1_anthropic_button.clicked.connect(lambda: self.select_provider1("Anthropic"))
-        self.model1_groq_button.clicked.connect(lambda: self.select_provider1("Groq"))
-        self.model1_ollama_button.clicked.connect(lambda: self.select_provider1("Ollama"))
-
-        self.provider_buttons_layout1.addWidget(self.model1_openai_button)
-        self.provider_buttons_layout1.addWidget(self.model1_anthropic_button)
-        self.provider_buttons_layout1.addWidget(self.model1_groq_button)
-        self.provider_buttons_layout1.addWidget(self.model1_ollama_button)
-        collab_layout.addLayout(self.provider_buttons_layout1)
-
-        self.model1_buttons_scroll_area = QScrollArea()
-        self.model1_buttons_widget = QWidget()
-        self.model1_buttons_layout = QGridLayout(self.model1_buttons_widget)
-        self.model1_buttons_scroll_area.setWidget(self.model1_buttons_widget)
-        self.model1_buttons_scroll_area.setWidgetResizable(True)
-        self.model1_buttons_scroll_area.setFixedHeight(150)
-        self.model1_buttons_scroll_area.setStyleSheet("""
-            QScrollArea {
-                border: 1px solid #6c7086;
-                border-radius: 8px;
-                background-color: #1e1e2e;
-            }
-            QScrollBar:vertical {
-                background: #313244;
-                width: 10px;
-                margin: 0px;
-            }
-            QScrollBar::handle:vertical {
-                background: #45475a;
-                min-height: 20px;
-                border-radius: 5px;
-            }
-            QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {
-                height: 0px;
-            }
-        """)
-        collab_layout.addWidget(self.model1_buttons_scroll_area)
-
-        collab_layout.addWidget(QLabel("Model 1 Role:"))
-        self.model1_role_dropdown = ModernComboBox()
-        self.model1_role_dropdown.addItems(Role.ROLES)
-        collab_layout.addWidget(self.model1_role_dropdown)
-
-        collab_layout.addWidget(QLabel("Model 2 Provider:"))
-        self.provider_buttons_layout2 = QHBoxLayout()
-        self.model2_openai_button = ProviderButton("OpenAI")
-        self.model2_anthropic_button = ProviderButton("Anthropic")
-        self.model2_groq_button = ProviderButton("Groq")
-        self.model2_ollama_button = ProviderButton("Ollama")
-
-        self.model2_openai_button.clicked.connect(lambda: self.select_provider2("OpenAI"))
-        self.model2_anthropic_button.clicked.connect(lambda: self.select_provider2("Anthropic"))
-        self.model2_groq_button.clicked.connect(lambda: self.select_provider2("Groq"))
-        self.model2_ollama_button.clicked.connect(lambda: self.select_provider2("Ollama"))
-
-        self.provider_buttons_layout2.addWidget(self.model2_openai_button)
-        self.provider_buttons_layout2.addWidget(self.model2_anthropic_button)
-        self.provider_buttons_layout2.addWidget(self.model2_groq_button)
-        self.provider_buttons_layout2.addWidget(self.model2_ollama_button)
-        collab_layout.addLayout(self.provider_buttons_layout2)
-
-        self.model2_buttons_scroll_area = QScrollArea()
-        self.model2_buttons_widget = QWidget()
-        self.model2_buttons_layout = QGridLayout(self.model2_buttons_widget)
-        self.model2_buttons_scroll_area.setWidget(self.model2_buttons_widget)
-        self.model2_buttons_scroll_area.setWidgetResizable(True)
-        self.model2_buttons_scroll_area.setFixedHeight(150)
-        self.model2_buttons_scroll_area.setStyleSheet("""
-            QScrollArea {
-                border: 1px solid #6c7086;
-                border-radius: 8px;
-                background-color: #1e1e2e;
-            }
-            QScrollBar:vertical {
-                background: #313244;
-                width: 10px;
-                margin: 0px;
-            }
-            QScrollBar::handle:vertical {
-                background: #45475a;
-                min-height: 20px;
-                border-radius: 5px;
-            }
-            QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {
-                height: 0px;
-            }
-        """)
-        collab_layout.addWidget(self.model2_buttons_scroll_area)
-
-        collab_layout.addWidget(QLabel("Model 2 Role:"))
-        self.model2_role_dropdown = ModernComboBox()
-        self.model2_role_dropdown.addItems(Role.ROLES)
-        collab_layout.addWidget(self.model2_role_dropdown)
+        collab_layout.addWidget(QLabel("Participant Provider:"))
+        self.collab_provider_buttons_layout = QHBoxLayout()
+        self.collab_openai_button = ProviderButton("OpenAI")
+        self.collab_anthropic_button = ProviderButton("Anthropic")
+        self.collab_groq_button = ProviderButton("Groq")
+        self.collab_ollama_button = ProviderButton("Ollama")
+        self.collab_custom_button = ProviderButton("Custom")
+
+        self.collab_openai_button.clicked.connect(lambda: self.select_collab_provider("OpenAI"))
+        self.collab_anthropic_button.clicked.connect(lambda: self.select_collab_provider("Anthropic"))
+        self.collab_groq_button.clicked.connect(lambda: self.select_collab_provider("Groq"))
+        self.collab_ollama_button.clicked.connect(lambda: self.select_collab_provider("Ollama"))
+        self.collab_custom_button.clicked.connect(lambda: self.select_collab_provider("Custom"))
+
+        self.collab_provider_buttons_layout.addWidget(self.collab_openai_button)
+        self.collab_provider_buttons_layout.addWidget(self.collab_anthropic_button)
+        self.collab_provider_buttons_layout.addWidget(self.collab_groq_button)
+        self.collab_provider_buttons_layout.addWidget(self.collab_ollama_button)
+        self.collab_provider_buttons_layout.addWidget(self.collab_custom_button)
+        collab_layout.addLayout(self.collab_provider_buttons_layout)
+
+        self.collab_model_picker = ModelPicker(self.main_window.model_catalog)
+        self.collab_model_picker.view.setFixedHeight(110)
+        self.collab_model_picker.model_selected.connect(self.select_collab_model)
+        collab_layout.addWidget(self.collab_model_picker)
+
+        self.add_participant_button = ModernButton("Add Participant")
+        self.add_participant_button.clicked.connect(self.add_selected_participant)
+        collab_layout.addWidget(self.add_participant_button)
+
+        collab_layout.addWidget(QLabel("Participants:"))
+        self.participants_widget = QWidget()
+        self.participants_layout = QVBoxLayout(self.participants_widget)
+        self.participants_layout.setContentsMargins(0, 0, 0, 0)
+        self.participants_layout.setSpacing(4)
+        collab_layout.addWidget(self.participants_widget)
 
         self.start_collab_button = ModernButton("Start Collaboration")
         collab_layout.addWidget(self.start_collab_button)
@@ -839,22 +1992,10 @@ class ControlPanel(QWidget):
     def init_status_bar(self, layout):
         self.status_bar = QProgressBar()
         self.status_bar.setTextVisible(False)
-        self.status_bar.setStyleSheet("""
-            QProgressBar {
-                border: 1px solid #6c7086;
-                border-radius: 5px;
-                text-align: center;
-                background-color: #313244;
-            }
-            QProgressBar::chunk {
-                background-color: #cba6f7;
-                width: 20px;
-            }
-        """)
         layout.addWidget(self.status_bar)
 
         self.status_label = QLabel("Status: Idle")
-        self.status_label.setStyleSheet("color: #cdd6f4; font-weight: bold;")
+        self.status_label.setObjectName("statusLabel")
         layout.addWidget(self.status_label)
 
     def toggle_mode(self, index):
@@ -891,262 +2032,2869 @@ class ControlPanel(QWidget):
             self.progress_timer.stop()
         self.status_bar.setValue(0)
 
+    def provider_buttons(self, provider_name):
+        buttons = [
+            self.openai_button, self.anthropic_button, self.groq_button, self.ollama_button, self.custom_button,
+            self.collab_openai_button, self.collab_anthropic_button, self.collab_groq_button, self.collab_ollama_button,
+            self.collab_custom_button
+        ]
+        return [button for button in buttons if button.text() == provider_name]
+
+    def set_provider_enabled(self, provider_name, enabled, tooltip=""):
+        for button in self.provider_buttons(provider_name):
+            button.setEnabled(enabled)
+            button.setToolTip(tooltip)
+
     def select_provider(self, provider_name):
         self.main_window.selected_provider = provider_name
-        self.update_models_buttons(provider_name)
+        self.model_picker.set_provider(provider_name)
         self.highlight_selected_provider(provider_name)
 
     def highlight_selected_provider(self, provider_name):
-        for button in [self.openai_button, self.anthropic_button, self.groq_button, self.ollama_button]:
+        for button in [self.openai_button, self.anthropic_button, self.groq_button, self.ollama_button, self.custom_button]:
             if button.text() == provider_name:
                 button.setChecked(True)
             else:
                 button.setChecked(False)
 
-    def update_models_buttons(self, provider_name):
-        for i in reversed(range(self.model_buttons_layout.count())):
-            widget_to_remove = self.model_buttons_layout.itemAt(i).widget()
-            self.model_buttons_layout.removeWidget(widget_to_remove)
-            widget_to_remove.setParent(None)
-        models = self.main_window.models.get(provider_name, [])
-        columns = 2
-        for index, model in enumerate(models):
-            row = index // columns
-            col = index % columns
-            model_button = ModelButton(model)
-            model_button.clicked.connect(lambda checked, m=model: self.select_model(m))
-            self.model_buttons_layout.addWidget(model_button, row, col)
-
     def select_model(self, model_name):
         self.main_window.selected_model = model_name
-        self.highlight_selected_model(model_name)
-
-    def highlight_selected_model(self, model_name):
-        for i in range(self.model_buttons_layout.count()):
-            button = self.model_buttons_layout.itemAt(i).widget()
-            if button.model_name == model_name:
-                button.setChecked(True)
-            else:
-                button.setChecked(False)
+        self.model_picker.select(model_name)
 
-    def select_provider1(self, provider_name):
-        self.main_window.selected_provider1 = provider_name
-        self.update_models_buttons1(provider_name)
-        self.highlight_selected_provider1(provider_name)
+    def select_collab_provider(self, provider_name):
+        self.main_window.selected_collab_provider = provider_name
+        self.collab_model_picker.set_provider(provider_name)
+        self.highlight_selected_collab_provider(provider_name)
 
-    def highlight_selected_provider1(self, provider_name):
-        for button in [self.model1_openai_button, self.model1_anthropic_button, self.model1_groq_button, self.model1_ollama_button]:
+    def highlight_selected_collab_provider(self, provider_name):
+        for button in [self.collab_openai_button, self.collab_anthropic_button, self.collab_groq_button,
+                       self.collab_ollama_button, self.collab_custom_button]:
             if button.text() == provider_name:
                 button.setChecked(True)
             else:
                 button.setChecked(False)
 
-    def update_models_buttons1(self, provider_name):
-        for i in reversed(range(self.model1_buttons_layout.count())):
-            widget_to_remove = self.model1_buttons_layout.itemAt(i).widget()
-            self.model1_buttons_layout.removeWidget(widget_to_remove)
-            widget_to_remove.setParent(None)
-        models = self.main_window.models.get(provider_name, [])
-        columns = 2
-        for index, model in enumerate(models):
-            row = index // columns
-            col = index % columns
-            model_button = ModelButton(model)
-            model_button.clicked.connect(lambda checked, m=model: self.select_model1(m))
-            self.model1_buttons_layout.addWidget(model_button, row, col)
-
-    def select_model1(self, model_name):
-        self.main_window.selected_model1 = model_name
-        self.highlight_selected_model1(model_name)
-
-    def highlight_selected_model1(self, model_name):
-        for i in range(self.model1_buttons_layout.count()):
-            button = self.model1_buttons_layout.itemAt(i).widget()
-            if button.model_name == model_name:
-                button.setChecked(True)
-            else:
-                button.setChecked(False)
-
-    def select_provider2(self, provider_name):
-        self.main_window.selected_provider2 = provider_name
-        self.update_models_buttons2(provider_name)
-        self.highlight_selected_provider2(provider_name)
+    def select_collab_model(self, model_name):
+        self.main_window.selected_collab_model = model_name
+        self.collab_model_picker.select(model_name)
 
-    def highlight_selected_provider2(self, provider_name):
-        for button in [self.model2_openai_button, self.model2_anthropic_button, self.model2_groq_button, self.model2_ollama_button]:
-            if button.text() == provider_name:
-                button.setChecked(True)
-            else:
-                button.setChecked(False)
+    def add_selected_participant(self):
+        provider = self.main_window.selected_collab_provider
+        model = self.main_window.selected_collab_model
+        if provider and model:
+            self.add_participant(f"{provider}: {model}")
+        else:
+            self.main_window.show_error_message("Please select a provider and model to add.")
+
+    def add_participant(self, model, role=None):
+        index = self.participants_layout.count()
+        row = ParticipantRow(model, role or self.DEFAULT_ROLES[index % len(self.DEFAULT_ROLES)])
+        row.remove_button.clicked.connect(lambda: self.remove_participant(row))
+        self.participants_layout.addWidget(row)
+        return row
+
+    def remove_participant(self, row):
+        self.participants_layout.removeWidget(row)
+        row.setParent(None)
+        row.deleteLater()
+
+    def participants(self):
+        rows = [self.participants_layout.itemAt(i).widget() for i in range(self.participants_layout.count())]
+        return [(row.model, row.role_dropdown.currentText()) for row in rows]
+
+class OllamaHost:
+    def __init__(self, url, max_concurrency):
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.models = set()
+        self.resident = set()  # Models currently loaded in memory on this host
+        self.healthy = True
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error = ""
+        self.probing = False  # A trial request is in flight to this unhealthy host
+
+    def is_available(self, now):
+        # Unhealthy hosts get a single trial request once their retry delay has passed
+        return self.healthy or (not self.probing and now >= self.retry_at)
+
+class RateLimiter:
+    # Requests per minute per provider, shared by every session; 0 means unlimited
+    LIMITS = {"OpenAI": 500, "Anthropic": 50, "Groq": 30, "Ollama": 0, "Custom": 0}
+    BURST = 10
+
+    def __init__(self, limits=None):
+        self.limits = dict(self.LIMITS, **(limits or {}))
+        self.tokens = {}
+        self.updated = {}
+        self.condition = threading.Condition()
+
+    def acquire(self, provider, should_stop=None):
+        rate = self.limits.get(provider, 0) / 60.0
+        if rate <= 0:
+            return True
+        capacity = min(self.BURST, max(1, self.limits[provider]))
+        with self.condition:
+            while True:
+                now = time.time()
+                tokens = self.tokens.get(provider, capacity)
+                tokens = min(capacity, tokens + (now - self.updated.get(provider, now)) * rate)
+                self.updated[provider] = now
+                if tokens >= 1:
+                    self.tokens[provider] = tokens - 1
+                    return True
+                self.tokens[provider] = tokens
+                if should_stop and should_stop():
+                    return False
+                self.condition.wait(min(0.25, (1 - tokens) / rate))
+
+class StreamRecorder:
+    # One gzipped JSON line per request: its parameters, every streamed chunk with its
+    # arrival offset in milliseconds, the reported usage and the error, if any
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = gzip.open(path, "at", encoding="utf-8")
+        self.count = 0
+
+    def record(self, call, error=None):
+        entry = {
+            "model": call.model,
+            "prompt": call.prompt,
+            "max_tokens": call.max_tokens,
+            "temperature": call.temperature,
+            "started": round(call.start_time, 3),
+            "chunks": call.recorded or [],
+            "usage": list(call.reported_usage) if call.reported_usage else None,
+            "error": str(error) if error is not None else ""
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(line + "\n")
+            self.file.flush()  # A sync flush keeps the file readable if the app dies mid-session
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class StreamReplayer:
+    # Serves recorded streams in place of the provider adapters, matching on model and prompt
+    # first, then cycling through the model's recordings, then through all of them
+    SPEEDS = {"1x": 1.0, "2x": 2.0, "10x": 10.0, "Maximum": 0.0}
+
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed  # 0 replays without any delay
+        self.lock = threading.Lock()
+        self.entries = []
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            try:
+                for line in file:
+                    if line.strip():
+                        self.entries.append(json.loads(line))
+            except (EOFError, json.JSONDecodeError):
+                pass  # A recording cut off by a crash still replays up to its last complete request
+        if not self.entries:
+            raise ValueError(f"No recorded requests in {path}")
+        self.by_prompt = defaultdict(list)
+        self.by_model = defaultdict(list)
+        for entry in self.entries:
+            self.by_prompt[(entry["model"], entry["prompt"])].append(entry)
+            self.by_model[entry["model"]].append(entry)
+        self.next_index = defaultdict(int)
+
+    def models(self):
+        models = defaultdict(list)
+        for model in self.by_model:
+            provider, name = model.split(": ", 1)
+            models[provider].append(name)
+        return {provider: sorted(names) for provider, names in models.items()}
+
+    def take(self, model, prompt):
+        with self.lock:
+            for key, entries in [((model, prompt), self.by_prompt.get((model, prompt))),
+                                 (model, self.by_model.get(model)), (None, self.entries)]:
+                if entries:
+                    index = self.next_index[key]
+                    self.next_index[key] = index + 1
+                    return entries[index % len(entries)]
+
+    def replay(self, call):
+        entry = self.take(call.model, call.prompt)
+        call.dispatch_time = call.first_byte_time = time.time()
+        for offset, text in entry["chunks"]:
+            if self.speed > 0:
+                delay = call.start_time + offset / 1000.0 / self.speed - time.time()
+                if delay > 0 and call.stop_event.wait(delay):
+                    return
+            elif call.stop_event.is_set():
+                return
+            call.emit_token(text)
+        if entry["usage"]:
+            call.reported_usage = tuple(entry["usage"])
+        if entry["error"]:
+            raise RuntimeError(entry["error"])
+
+class CompatibleEndpoint:
+    # Any server speaking the OpenAI chat completions API (vLLM, llama.cpp, LM Studio, TGI, ...)
+    DEFAULT_PORT = 8000
+
+    def __init__(self, url="", api_key=""):
+        self.base_url = self.parse_url(url)
+        self.api_key = api_key
+
+    @staticmethod
+    def parse_url(value):
+        # A bare host gets the default port; a URL without a path gets the usual /v1
+        url = (value or "").strip().rstrip("/")
+        if not url:
+            return ""
+        if "://" not in url:
+            host, _, path = url.partition("/")
+            if not re.search(r":\d+$", host):
+                host = f"{host}:{CompatibleEndpoint.DEFAULT_PORT}"
+            url = f"http://{host}/{path}".rstrip("/")
+        if "/" not in url.split("://", 1)[1]:
+            url = f"{url}/v1"
+        return url
+
+    def headers(self):
+        # Local servers usually run without a key; sending an empty bearer token can still be rejected
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def models(self, http):
+        response = http.get(f"{self.base_url}/models", headers=self.headers(), timeout=Timeouts.REQUEST)
+        response.raise_for_status()
+        return sorted(model["id"] for model in response.json().get("data", []))
+
+class OllamaPool:
+    DEFAULT_PORT = 11434
+    DEFAULT_MAX_CONCURRENCY = 2
+    FAILURE_THRESHOLD = 3
+    RETRY_DELAY = 30.0
+    PROBE_TIMEOUT = Timeouts.REQUEST
+
+    def __init__(self, urls=None, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.condition = threading.Condition()
+        self.hosts = []
+        self.waiting = 0
+        self.resident_hits = 0  # Requests routed to a host that already had the model loaded
+        self.resident_misses = 0
+        self.set_hosts(urls or [], max_concurrency)
+
+    @staticmethod
+    def parse_hosts(value):
+        urls = []
+        for entry in re.split(r"[,;\s]+", value or ""):
+            entry = entry.strip().rstrip("/")
+            if not entry:
+                continue
+            if "://" not in entry:
+                entry = f"http://{entry}"
+            if not re.search(r":\d+$", entry):
+                entry = f"{entry}:{OllamaPool.DEFAULT_PORT}"
+            if entry not in urls:
+                urls.append(entry)
+        return urls
+
+    def set_hosts(self, urls, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        with self.condition:
+            existing = {host.url: host for host in self.hosts}
+            self.hosts = [existing.get(url) or OllamaHost(url, max_concurrency) for url in urls]
+            for host in self.hosts:
+                host.max_concurrency = max_concurrency
+            self.condition.notify_all()
+
+    def refresh(self):
+        with self.condition:
+            hosts = list(self.hosts)
+        if not hosts:
+            return []
+        with ThreadPoolExecutor(max_workers=len(hosts)) as executor:
+            list(executor.map(self.probe, hosts))
+        return self.models()
 
-    def update_models_buttons2(self, provider_name):
-        for i in reversed(range(self.model2_buttons_layout.count())):
-            widget_to_remove = self.model2_buttons_layout.itemAt(i).widget()
-            self.model2_buttons_layout.removeWidget(widget_to_remove)
-            widget_to_remove.setParent(None)
-        models = self.main_window.models.get(provider_name, [])
-        columns = 2
-        for index, model in enumerate(models):
-            row = index // columns
-            col = index % columns
-            model_button = ModelButton(model)
-            model_button.clicked.connect(lambda checked, m=model: self.select_model2(m))
-            self.model2_buttons_layout.addWidget(model_button, row, col)
-
-    def select_model2(self, model_name):
-        self.main_window.selected_model2 = model_name
-        self.highlight_selected_model2(model_name)
-
-    def highlight_selected_model2(self, model_name):
-        for i in range(self.model2_buttons_layout.count()):
-            button = self.model2_buttons_layout.itemAt(i).widget()
-            if button.model_name == model_name:
-                button.setChecked(True)
-            else:
-                button.setChecked(False)
+    def probe(self, host):
+        try:
+            response = requests.get(f"{host.url}/api/tags", timeout=self.PROBE_TIMEOUT)
+            response.raise_for_status()
+            models = {model['name'] for model in response.json().get('models', [])}
+            try:
+                response = requests.get(f"{host.url}/api/ps", timeout=self.PROBE_TIMEOUT)
+                response.raise_for_status()
+                resident = {model['name'] for model in response.json().get('models', [])}
+            except Exception:
+                resident = set()  # Older Ollama versions have no /api/ps
+            with self.condition:
+                host.models = models
+                host.resident = resident
+                self.mark_healthy(host)
+        except Exception as e:
+            with self.condition:
+                self.mark_failure(host, str(e), immediate=True)
+
+    def models(self):
+        with self.condition:
+            merged = set()
+            for host in self.hosts:
+                merged.update(host.models)
+        return sorted(merged)
+
+    def acquire(self, model, should_stop=None):
+        with self.condition:
+            while True:
+                now = time.time()
+                serving = [host for host in self.hosts if model in host.models]
+                if not serving:
+                    raise RuntimeError(f"No Ollama host serves {model}")
+                candidates = [host for host in serving if host.is_available(now)]
+                if not candidates:
+                    raise requests.ConnectionError(f"All Ollama hosts serving {model} are down")
+                free = [host for host in candidates if host.in_flight < host.max_concurrency]
+                if free:
+                    # Prefer hosts that already have the model loaded, then the least loaded one
+                    host = min(free, key=lambda h: (model not in h.resident, h.in_flight / h.max_concurrency, h.in_flight))
+                    host.in_flight += 1
+                    if not host.healthy:
+                        host.probing = True
+                    if model in host.resident:
+                        self.resident_hits += 1
+                    else:
+                        self.resident_misses += 1
+                    host.resident.add(model)
+                    return host
+                if should_stop and should_stop():
+                    return None
+                self.waiting += 1
+                self.condition.wait(0.25)
+                self.waiting -= 1
+
+    def release(self, host, error=None):
+        with self.condition:
+            host.in_flight = max(0, host.in_flight - 1)
+            host.probing = False
+            if isinstance(error, (requests.ConnectionError, requests.Timeout, TimeoutError)):
+                self.mark_failure(host, str(error))
+            elif error is None:
+                self.mark_healthy(host)
+            self.condition.notify_all()
+
+    def mark_healthy(self, host):
+        host.healthy = True
+        host.failures = 0
+        host.last_error = ""
+
+    def mark_failure(self, host, message, immediate=False):
+        host.failures += 1
+        host.last_error = message
+        if immediate or host.failures >= self.FAILURE_THRESHOLD:
+            host.healthy = False
+            host.retry_at = time.time() + self.RETRY_DELAY
+
+    def healthy_count(self):
+        with self.condition:
+            return sum(1 for host in self.hosts if host.healthy)
+
+    def describe(self):
+        with self.condition:
+            lines = []
+            for host in self.hosts:
+                state = "healthy" if host.healthy else f"down ({host.last_error})"
+                lines.append(f"{host.url}: {state}, {host.in_flight}/{host.max_concurrency} in flight, {len(host.models)} models")
+        return "\n".join(lines)
+
+class StreamTruncated(Exception):
+    pass
+
+class ClientDisconnected(Exception):
+    pass
+
+class Cancelled(Exception):
+    pass
+
+class CircuitOpen(Exception):
+    pass
+
+class DeadlineExceeded(Exception):
+    pass
+
+class RepetitionDetector:
+    NGRAM = 8
+    WINDOW = 400
+    MIN_NGRAMS = 80
+    THRESHOLD = 0.5
+    BASE = 1000003
+    MODULUS = (1 << 61) - 1
 
-class WorkerThread(QThread):
-    response_received = pyqtSignal(str, bool)
-    response_finished = pyqtSignal(float)
+    def __init__(self):
+        self.partial = ""
+        self.offset = 0  # Characters fed before the partial word
+        self.word_hashes = deque()
+        self.word_starts = deque()
+        self.rolling = 0
+        self.drop_factor = pow(self.BASE, self.NGRAM - 1, self.MODULUS)
+        self.window = deque()
+        self.counts = {}
+        self.streak_start = None
+        self.keep_chars = 0
+
+    def feed(self, text):
+        text = self.partial + text
+        words = list(re.finditer(r"\S+", text))
+        if words and words[-1].end() == len(text):
+            # The last word may continue in the next token
+            self.partial = text[words[-1].start():]
+            consumed = words[-1].start()
+            words = words[:-1]
+        else:
+            self.partial = ""
+            consumed = len(text)
+        degenerate = False
+        for word in words:
+            degenerate = self.add_word(word.group(), self.offset + word.start()) or degenerate
+        self.offset += consumed
+        return degenerate
+
+    def add_word(self, word, start):
+        word_hash = zlib.crc32(word.encode("utf-8"))
+        if len(self.word_hashes) == self.NGRAM:
+            self.rolling = (self.rolling - self.word_hashes.popleft() * self.drop_factor) % self.MODULUS
+            self.word_starts.popleft()
+        self.rolling = (self.rolling * self.BASE + word_hash) % self.MODULUS
+        self.word_hashes.append(word_hash)
+        self.word_starts.append(start)
+        if len(self.word_hashes) < self.NGRAM:
+            return False
+
+        ngram = self.rolling
+        if self.counts.get(ngram):
+            if self.streak_start is None:
+                self.streak_start = self.word_starts[0]
+        else:
+            self.streak_start = None
+        self.counts[ngram] = self.counts.get(ngram, 0) + 1
+        self.window.append(ngram)
+        if len(self.window) > self.WINDOW:
+            oldest = self.window.popleft()
+            self.counts[oldest] -= 1
+            if not self.counts[oldest]:
+                del self.counts[oldest]
+
+        if len(self.window) < self.MIN_NGRAMS or self.streak_start is None:
+            return False
+        repeated = 1 - len(self.counts) / len(self.window)
+        if repeated >= self.THRESHOLD:
+            # Keep the text up to where the loop started repeating
+            self.keep_chars = self.streak_start
+            return True
+        return False
+
+class SectionParser:
+    # Splits a streamed chain-of-thought reply into sections as tokens arrive, even when a tag spans chunks
+    HIDDEN = ("thinking", "reflection")  # Shown as collapsed panels and kept out of the history
+    TAG = re.compile(r"</?(thinking|reflection|output)>", re.IGNORECASE)
+    TAGS = [f"<{slash}{name}>" for name in ("thinking", "reflection", "output") for slash in ("", "/")]
+    INSTRUCTIONS = (
+        "\n\nPlease use the following structure for your response:\n"
+        "<thinking>\n- Break down the problem\n- Outline your approach\n- Consider alternatives\n</thinking>\n\n"
+        "<reflection>\n- Review your reasoning\n- Identify potential issues\n- Suggest improvements\n</reflection>\n\n"
+        "<output>\nYour final response here.\n</output>"
+    )
 
-    def __init__(self, main_window, model, prompt, max_tokens, temperature):
-        super().__init__()
+    def __init__(self):
+        self.section = None
+        self.pending = ""  # A trailing "<..." that may still turn into a tag
+        self.hidden = []
+        self.raw = []
+        self.visible_started = False
+
+    def feed(self, text):
+        self.raw.append(text)
+        buffer = self.pending + text
+        events = []
+        position = 0
+        for match in self.TAG.finditer(buffer):
+            self.emit(buffer[position:match.start()], events)
+            name = match.group(1).lower()
+            if not match.group(0).startswith("</"):
+                self.close_section(events)
+                self.section = name
+                if name in self.HIDDEN:
+                    events.append(("open", name))
+            elif name == self.section:
+                self.close_section(events)
+            position = match.end()
+        rest = buffer[position:]
+        start = rest.rfind("<")
+        if start != -1 and any(tag.startswith(rest[start:].lower()) for tag in self.TAGS):
+            self.pending = rest[start:]
+            rest = rest[:start]
+        else:
+            self.pending = ""
+        self.emit(rest, events)
+        return events
+
+    def finish(self):
+        events = []
+        self.emit(self.pending, events)
+        self.pending = ""
+        self.close_section(events)
+        return events
+
+    def emit(self, text, events):
+        if self.section in self.HIDDEN:
+            self.hidden.append(text)
+            return
+        if not self.visible_started:
+            text = text.lstrip()
+        if text:
+            self.visible_started = True
+            events.append(("text", text))
+
+    def close_section(self, events):
+        if self.section in self.HIDDEN:
+            events.append(("panel", self.section.title(), "".join(self.hidden).strip()))
+            self.hidden = []
+        self.section = None
+
+    @classmethod
+    def visible_length(cls, text):
+        parser = cls()
+        return sum(len(event[1]) for event in parser.feed(text) + parser.finish() if event[0] == "text")
+
+class ProviderCall:
+    # One request to a provider: the adapters, first-token watchdog, loop cut-off and usage accounting.
+    # WorkerThread streams one into a session; CompletionSample collects one on a pool thread.
+    def __init__(self, main_window, model, prompt, max_tokens, temperature, stop_event=None,
+                 on_token=None, on_first_token=None, on_notice=None):
         self.main_window = main_window
+        self.stop_event = stop_event or threading.Event()
         self.model = model
+        self.provider = model.split(": ", 1)[0]
         self.prompt = prompt
         self.max_tokens = max_tokens
         self.temperature = temperature
-
-    def run(self):
-        start_time = time.time()
-        try:
-            if self.model.startswith("Groq: "):
-                self.get_groq_response()
-            elif self.model.startswith("Ollama: "):
-                self.get_ollama_response()
-            elif self.model.startswith("Anthropic: "):
-                self.get_anthropic_response()
-            elif self.model.startswith("OpenAI: "):
-                self.get_openai_response()
-            else:
-                self.response_received.emit("Invalid model selected.", False)
-        except Exception as e:
-            self.response_received.emit(f"Error: {str(e)}", False)
-        finally:
-            end_time = time.time()
-            self.response_finished.emit(end_time - start_time)
+        self.on_token = on_token
+        self.on_first_token = on_first_token
+        self.on_notice = on_notice  # Messages shown instead of a response, such as a missing API key
+        self.ollama_host = None
+        self.active_stream = None
+        self.watchdog = None
+        self.dispatch_time = None  # When the request went out, after rate limiting and host selection
+        self.first_byte_time = None
+        self.first_token_time = None
+        self.last_token_time = None
+        self.timeout_reason = None
+        self.deadline_reason = None  # Set by WorkerThread when a latency deadline is missed
+        self.repetition = RepetitionDetector()
+        self.start_time = None
+        self.completion_chars = 0
+        self.reported_usage = None
+        self.recorded = None  # [offset ms, chunk] pairs while a StreamRecorder is active
+        self.cache_prefix = 0  # Characters of the prompt to mark as an Anthropic cache breakpoint
+        self.cached_tokens = 0  # Prompt tokens the provider reports reading from its prefix cache
+
+    def request(self):
+        if self.main_window.replayer is not None:
+            self.main_window.replayer.replay(self)
+            return
+        if not self.main_window.rate_limiter.acquire(self.provider, self.stop_event.is_set):
+            raise Cancelled("stopped by user")
+        adapters = {
+            "Groq": self.get_groq_response,
+            "Ollama": self.get_ollama_response,
+            "Anthropic": self.get_anthropic_response,
+            "OpenAI": self.get_openai_response,
+            "Custom": self.get_custom_response
+        }
+        adapter = adapters.get(self.provider)
+        if adapter is None:
+            self.notice("Invalid model selected.")
+        else:
+            adapter()
+
+    def usage(self):
+        if self.reported_usage:
+            return self.reported_usage[0], self.reported_usage[1], False
+        return TokenBudget.estimate_tokens(len(self.prompt)), TokenBudget.estimate_tokens(self.completion_chars), True
+
+    @staticmethod
+    def is_provider_failure(error):
+        if isinstance(error, (requests.ConnectionError, requests.Timeout, TimeoutError)):
+            return True
+        status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+        if status:
+            return status >= 500
+        return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+    def notice(self, text):
+        if self.on_notice:
+            self.on_notice(text)
+
+    def start_watchdog(self):
+        self.watchdog = threading.Timer(Timeouts.FIRST_TOKEN, self.handle_first_token_timeout)
+        self.watchdog.daemon = True
+        self.watchdog.start()
+
+    def handle_first_token_timeout(self):
+        if self.first_token_time is None:
+            self.timeout_reason = f"No response from {self.model} within {Timeouts.FIRST_TOKEN}s"
+            self.close_stream()
+
+    def close_stream(self):
+        stream = self.active_stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def emit_token(self, token):
+        if self.stop_event.is_set():
+            # A stop that came before the stream opened had nothing to close
+            raise Cancelled("stopped by user")
+        if self.deadline_reason:
+            raise DeadlineExceeded(self.deadline_reason)
+        if self.timeout_reason:
+            raise TimeoutError(self.timeout_reason)
+        if self.first_token_time is None:
+            self.first_token_time = time.time()
+            self.watchdog.cancel()
+            if self.on_first_token:
+                self.on_first_token(self.first_token_time - self.start_time)
+        self.completion_chars += len(token)
+        self.last_token_time = time.time()
+        if self.recorded is not None:
+            self.recorded.append([round((self.last_token_time - self.start_time) * 1000, 1), token])
+        if self.on_token:
+            self.on_token(token)
+        if self.repetition.feed(token):
+            raise StreamTruncated("repeating output detected")
+
+    def cleanup(self):
+        if self.watchdog is not None:
+            self.watchdog.cancel()
+        self.active_stream = None
+        self.release_ollama_host()
 
     def get_groq_response(self):
-        headers = self.main_window.HEADERS['groq']
-        response = requests.post(
-            self.main_window.API_URLS['groq_llm'],
+        self.stream_chat_completions(self.main_window.API_URLS['groq_llm'], self.main_window.HEADERS['groq'])
+
+    def get_custom_response(self):
+        endpoint = self.main_window.custom_endpoint
+        if endpoint.base_url:
+            self.stream_chat_completions(f"{endpoint.base_url}/chat/completions", endpoint.headers(),
+                                         stream_options={"include_usage": True})
+        else:
+            self.notice("Custom server URL not provided.")
+
+    def stream_chat_completions(self, url, headers, **extra):
+        # Raw SSE over the shared pool, for Groq and any other OpenAI-compatible server
+        self.dispatch_time = time.time()
+        response = self.main_window.http.post(
+            url,
             headers=headers,
             json={
-                "model": self.model.replace("Groq: ", ""),
+                "model": self.model.split(": ", 1)[1],
                 "messages": [{"role": "user", "content": self.prompt}],
                 "max_tokens": self.max_tokens,
                 "temperature": self.temperature,
-                "stream": True
+                "stream": True,
+                **extra
             },
-            stream=True
+            stream=True,
+            timeout=Timeouts.REQUEST
         )
+        self.first_byte_time = time.time()
+        self.active_stream = response
         response.raise_for_status()
         for line in response.iter_lines():
-            if line:
-                try:
-                    data_line = line.decode('utf-8')
-                    if data_line.startswith("data: "):
-                        chunk = json.loads(data_line[6:])
-                        if 'choices' in chunk:
-                            delta = chunk['choices'][0]['delta']
-                            if 'content' in delta:
-                                token = delta['content']
-                                self.response_received.emit(token, True)
-                except json.JSONDecodeError:
-                    print(f"Error decoding JSON: {line}")
-                except Exception as e:
-                    print(f"Error processing chunk: {e}")
+            if not line.startswith(b"data: "):
+                continue
+            if line == b"data: [DONE]":
+                break
+            try:
+                chunk = json.loads(line[6:])
+                usage = chunk.get('usage') or chunk.get('x_groq', {}).get('usage')
+                if usage:
+                    self.reported_usage = (usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+                    self.cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+                choices = chunk.get('choices')
+                token = (choices[0].get('delta') or {}).get('content') if choices else None
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                continue  # A malformed or unexpected chunk carries no text; errors from emit_token must not land here
+            if token:
+                self.emit_token(token)
 
     def get_ollama_response(self):
-        response = requests.post(
-            self.main_window.API_URLS['ollama_llm'],
-            json={
-                'model': self.model.replace("Ollama: ", ""),
-                'prompt': self.prompt,
-                'options': {
-                    'num_predict': self.max_tokens,
-                    'temperature': self.temperature
-                }
-            },
-            stream=True
-        )
-        response.raise_for_status()
-        for line in response.iter_lines():
-            if line:
+        model = self.model.replace("Ollama: ", "")
+        self.ollama_host = self.main_window.ollama_pool.acquire(model, self.stop_event.is_set)
+        if self.ollama_host is None:
+            raise Cancelled("stopped by user")
+        error = None
+        try:
+            self.dispatch_time = time.time()
+            response = self.main_window.http.post(
+                f"{self.ollama_host.url}/api/generate",
+                json={
+                    'model': model,
+                    'prompt': self.prompt,
+                    'options': {
+                        'num_predict': self.max_tokens,
+                        'temperature': self.temperature
+                    }
+                },
+                stream=True,
+                timeout=Timeouts.REQUEST
+            )
+            self.first_byte_time = time.time()
+            self.active_stream = response
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
                 try:
                     json_line = json.loads(line)
-                    if 'done' in json_line and json_line['done']:
-                        break
-                    if 'response' in json_line:
-                        self.response_received.emit(json_line['response'], True)
                 except json.JSONDecodeError:
-                    print(f"Error decoding JSON: {line}")
+                    continue  # A malformed line carries no text
+                if json_line.get('done'):
+                    self.reported_usage = (json_line.get('prompt_eval_count', 0), json_line.get('eval_count', 0))
+                    break
+                if 'response' in json_line:
+                    self.emit_token(json_line['response'])
+        except (StreamTruncated, DeadlineExceeded):
+            raise
+        except Exception as e:
+            if self.stop_event.is_set() or self.deadline_reason or self.timeout_reason:
+                # The stream was closed from this side, so the read error says nothing about the host
+                error = Cancelled("stream closed")
+            else:
+                error = e
+            raise
+        finally:
+            self.release_ollama_host(error)
+
+    def release_ollama_host(self, error=None):
+        host, self.ollama_host = self.ollama_host, None
+        if host is not None:
+            self.main_window.ollama_pool.release(host, error)
 
     def get_anthropic_response(self):
         if self.main_window.anthropic_client:
-            try:
-                with self.main_window.anthropic_client.messages.stream(
-                    model=self.model.replace("Anthropic: ", ""),
-                    max_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                    messages=[
-                        {"role": "user", "content": self.prompt}
-                    ]
-                ) as stream:
-                    for text in stream.text_stream:
-                        self.response_received.emit(text, True)
-            except Exception as e:
-                self.response_received.emit(f"Error: {str(e)}", False)
+            content = self.prompt
+            if self.cache_prefix:
+                # Same breakpoint as the prewarm request, so the primed prefix is read from the cache
+                content = [{"type": "text", "text": self.prompt[:self.cache_prefix], "cache_control": {"type": "ephemeral"}}]
+                if self.prompt[self.cache_prefix:]:
+                    content.append({"type": "text", "text": self.prompt[self.cache_prefix:]})
+            self.dispatch_time = time.time()
+            with self.main_window.anthropic_client.messages.stream(
+                model=self.model.replace("Anthropic: ", ""),
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                messages=[
+                    {"role": "user", "content": content}
+                ]
+            ) as stream:
+                self.first_byte_time = time.time()
+                self.active_stream = stream
+                for text in stream.text_stream:
+                    self.emit_token(text)
+                usage = stream.get_final_message().usage
+                self.cached_tokens = getattr(usage, "cache_read_input_tokens", 0) or 0
+                cache_written = getattr(usage, "cache_creation_input_tokens", 0) or 0
+                self.reported_usage = (usage.input_tokens + self.cached_tokens + cache_written, usage.output_tokens)
         else:
-            self.response_received.emit("Anthropic API key not provided.", False)
+            self.notice("Anthropic API key not provided.")
 
     def get_openai_response(self):
         if self.main_window.openai_client:
-            try:
-                stream = self.main_window.openai_client.chat.completions.create(
-                    model=self.model.replace("OpenAI: ", ""),
-                    messages=[{"role": "user", "content": self.prompt}],
-                    max_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                    stream=True
-                )
-                for chunk in stream:
-                    if chunk.choices[0].delta.content is not None:
-                        self.response_received.emit(chunk.choices[0].delta.content, True)
-            except Exception as e:
-                self.response_received.emit(f"Error: {str(e)}", False)
+            self.dispatch_time = time.time()
+            stream = self.main_window.openai_client.chat.completions.create(
+                model=self.model.replace("OpenAI: ", ""),
+                messages=[{"role": "user", "content": self.prompt}],
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            self.first_byte_time = time.time()
+            self.active_stream = stream
+            for chunk in stream:
+                if chunk.usage:
+                    self.reported_usage = (chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+                    details = getattr(chunk.usage, "prompt_tokens_details", None)
+                    self.cached_tokens = getattr(details, "cached_tokens", 0) or 0
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    self.emit_token(chunk.choices[0].delta.content)
         else:
-            self.response_received.emit("OpenAI API key not provided.", False)
+            self.notice("OpenAI API key not provided.")
 
-class MainWindow(QMainWindow):
-    update_chat_signal = pyqtSignal(str, bool, bool)
-    update_status_signal = pyqtSignal(str, int)
+class WorkerThread(QThread):
+    # Disconnected when the session abandons the worker; usage is still reported so the spend stays right
+    SESSION_SIGNALS = ("response_received", "response_truncated", "deadline_missed", "response_finished", "first_token_received")
+    response_received = pyqtSignal(str, bool)
+    response_finished = pyqtSignal(float)
+    response_truncated = pyqtSignal(int, str)
+    deadline_missed = pyqtSignal(str, float)
+    first_token_received = pyqtSignal(float)
+    usage_reported = pyqtSignal(int, int, bool)  # prompt tokens, completion tokens, estimated locally
 
-    def __init__(self):
+    def __init__(self, main_window, model, prompt, max_tokens, temperature, ttft_deadline=0, turn_deadline=0, stop_event=None):
         super().__init__()
-        self.setWindowTitle("Enhanced LLM Collaboration App")
-        self.setGeometry(100, 100, 1200, 800)
+        self.main_window = main_window
+        self.call = ProviderCall(
+            main_window, model, prompt, max_tokens, temperature, stop_event,
+            on_token=lambda token: self.response_received.emit(token, True),
+            on_first_token=self.first_token_received.emit,
+            on_notice=lambda text: self.response_received.emit(text, False)
+        )
+        self.model = model
+        self.provider = self.call.provider
+        self.prompt = prompt
+        self.ttft_deadline = ttft_deadline
+        self.turn_deadline = turn_deadline
+        self.deadline_timers = []
+        self.sections = None  # SectionParser for chain-of-thought turns
+        self.prompt_started = None  # Set by the session for collaboration turns, for tracing
+        self.queued_time = None
+        self.prewarm = None  # The Prewarm that primed this turn's prompt prefix, if any
 
-        self.api_keys = self.get_api_keys()
-        self.init_clients()
+    def run(self):
+        call = self.call
+        start_time = call.start_time = time.time()
+        recorder = self.main_window.recorder
+        call.recorded = [] if recorder is not None else None
+        breaker = self.main_window.circuit_breakers.get(self.provider)
+        error = None
+        call.start_watchdog()
+        self.start_deadline_timers()
+        try:
+            if breaker is not None and not breaker.allow():
+                error = CircuitOpen(f"{self.provider} is unavailable")
+                self.response_received.emit(f"Error: {self.provider} is unavailable, retrying in the background.", False)
+            else:
+                call.request()
+            if breaker is not None and breaker.allow():
+                breaker.record_success()
+        except StreamTruncated as e:
+            call.close_stream()
+            self.response_truncated.emit(call.repetition.keep_chars, str(e))
+        except Exception as e:
+            error = e
+            if call.deadline_reason:
+                # Closing the stream on a missed deadline surfaces as an arbitrary read error
+                error = DeadlineExceeded(call.deadline_reason)
+                return
+            if call.stop_event.is_set():
+                # Closing the stream on a stop surfaces as a read error that is not the provider's fault
+                error = Cancelled("stopped by user")
+                return
+            if call.timeout_reason:
+                e = TimeoutError(call.timeout_reason)
+            if breaker is not None and call.is_provider_failure(e):
+                breaker.record_failure(e)
+            self.response_received.emit(f"Error: {str(e)}", False)
+        finally:
+            self.cleanup()
+            self.usage_reported.emit(*call.usage())
+            end_time = time.time()
+            self.main_window.metrics.observe_request(call, end_time - start_time, error)
+            if recorder is not None:
+                recorder.record(call, error)
+            self.response_finished.emit(end_time - start_time)
 
-        self.API_URLS = {
-            "groq_models": "https://api.groq.com/openai/v1/models",
-            "groq_llm": "https://api.groq.com/openai/v1/chat/completions",
-            "ollama_models": f"http://{self.api_keys.get('ollama_ip', '')}:11434/api/tags",
-            "ollama_llm": f"http://{self.api_keys.get('ollama_ip', '')}:11434/api/generate",
-            "openai_llm": "https://api.openai.com/v1/chat/completions",
-            "anthropic_llm": "https://api.anthropic.com/v1/messages"
+    def start_deadline_timers(self):
+        if self.ttft_deadline > 0:
+            self.deadline_timers.append(threading.Timer(self.ttft_deadline, self.handle_ttft_deadline))
+        if self.turn_deadline > 0:
+            self.deadline_timers.append(threading.Timer(
+                self.turn_deadline, self.miss_deadline, [f"turn took longer than {self.turn_deadline:g}s"]
+            ))
+        for timer in self.deadline_timers:
+            timer.daemon = True
+            timer.start()
+
+    def handle_ttft_deadline(self):
+        if self.call.first_token_time is None:
+            self.miss_deadline(f"no first token within {self.ttft_deadline:g}s")
+
+    def miss_deadline(self, reason):
+        # Reported right away: a blocked socket read may only notice the closed stream much later
+        call = self.call
+        if call.deadline_reason is None:
+            call.deadline_reason = reason
+            self.deadline_missed.emit(reason, time.time() - call.start_time)
+            call.close_stream()
+
+    def stop(self):
+        # Cooperative: terminate() could kill the thread while it holds a lock shared with other sessions.
+        # The stop event ends queue waits and closing the stream ends a blocked read; closing waits for
+        # that read to return, so it happens off the GUI thread.
+        self.call.stop_event.set()
+        threading.Thread(target=self.call.close_stream, daemon=True).start()
+
+    def cleanup(self):
+        for timer in self.deadline_timers:
+            timer.cancel()
+        self.call.cleanup()
+
+class CompletionSample(ProviderCall):
+    # Runs one request synchronously on a pool thread and collects its text instead of streaming it
+    def __init__(self, main_window, model, prompt, max_tokens, temperature, on_token=None, stop_event=None):
+        super().__init__(main_window, model, prompt, max_tokens, temperature, stop_event, on_token=self.add_chunk, on_notice=self.set_error)
+        self.forward_token = on_token
+        self.chunks = []
+        self.error = ""
+        self.truncated = False
+        self.elapsed = 0.0
+
+    def add_chunk(self, token):
+        self.chunks.append(token)
+        if self.forward_token:
+            self.forward_token(token)
+
+    def set_error(self, text):
+        self.error = text
+
+    def collect(self):
+        self.start_time = time.time()
+        recorder = self.main_window.recorder
+        self.recorded = [] if recorder is not None else None
+        breaker = self.main_window.circuit_breakers.get(self.provider)
+        error = None
+        self.start_watchdog()
+        try:
+            if breaker is not None and not breaker.allow():
+                self.error = f"{self.provider} is unavailable"
+                error = CircuitOpen(self.error)
+            else:
+                self.request()
+                if breaker is not None and breaker.allow():
+                    breaker.record_success()
+        except StreamTruncated:
+            self.close_stream()
+            self.chunks = ["".join(self.chunks)[:self.repetition.keep_chars]]
+            self.truncated = True
+        except ClientDisconnected as e:
+            self.close_stream()
+            error = e
+            raise
+        except Exception as e:
+            if self.stop_event.is_set():
+                e = Cancelled("stopped by user")
+            elif self.timeout_reason:
+                e = TimeoutError(self.timeout_reason)
+            if breaker is not None and self.is_provider_failure(e):
+                breaker.record_failure(e)
+            self.error = str(e)
+            error = e
+        finally:
+            self.cleanup()
+            self.elapsed = time.time() - self.start_time
+            self.main_window.metrics.observe_request(self, self.elapsed, error)
+            if recorder is not None:
+                recorder.record(self, error)
+        return self
+
+    def result(self):
+        prompt_tokens, completion_tokens, estimated = self.usage()
+        return {
+            "model": self.model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "estimated": estimated,
+            "temperature": self.temperature,
+            "text": "".join(self.chunks),
+            "error": self.error,
+            "truncated": self.truncated,
+            "elapsed": self.elapsed,
+            "score": 0.0
+        }
+
+class SampleRanker:
+    # Display name -> scoring method; each returns one score in [0, 1] per usable sample
+    METHODS = {
+        "Agreement vote": "score_agreement",
+        "Format checks": "score_format",
+        "Judge model": "score_judge"
+    }
+
+    def __init__(self, main_window, method, prompt, judge_model=""):
+        self.main_window = main_window
+        self.method = method
+        self.prompt = prompt
+        self.judge_model = judge_model
+        self.judge_results = []
+
+    def rank(self, samples):
+        usable = [sample for sample in samples if sample["text"].strip()]
+        scorer = getattr(self, self.METHODS.get(self.method, "score_agreement"))
+        for sample, score in zip(usable, scorer(usable) if usable else []):
+            sample["score"] = float(score)
+        for sample in samples:
+            if not sample["text"].strip():
+                sample["score"] = -1.0
+        return sorted(samples, key=lambda sample: sample["score"], reverse=True)
+
+    def score_format(self, samples):
+        lengths = sorted(len(sample["text"]) for sample in samples)
+        median = lengths[len(lengths) // 2] or 1
+        scores = []
+        for sample in samples:
+            text = sample["text"].rstrip()
+            score = 1.0
+            if sample["truncated"] or sample["error"]:
+                score -= 0.4
+            if text.count("```") % 2:
+                score -= 0.2
+            if text and text[-1] not in ".!?)`\"*|":
+                score -= 0.1
+            score -= 0.3 * max(0.0, 1.0 - len(text) / (0.5 * median))
+            scores.append(max(0.0, score))
+        return scores
+
+    def score_agreement(self, samples):
+        # Self-consistency: the sample closest to all the others wins, format breaks ties
+        format_scores = self.score_format(samples)
+        if len(samples) < 2:
+            return format_scores
+        detector = ConvergenceDetector(0, 1)
+        vectors = [detector.vectorize(sample["text"]) for sample in samples]
+        vectors = np.stack([vector if vector is not None else np.zeros(detector.DIMENSIONS, np.float32) for vector in vectors])
+        similarity = vectors @ vectors.T
+        agreement = (similarity.sum(axis=1) - np.diag(similarity)) / (len(samples) - 1)
+        return [0.9 * float(agree) + 0.1 * fmt for agree, fmt in zip(agreement, format_scores)]
+
+    def score_judge(self, samples):
+        if not self.judge_model or len(samples) < 2:
+            return self.score_agreement(samples)
+        candidates = "\n\n".join(f"Answer {index}:\n{sample['text']}" for index, sample in enumerate(samples, 1))
+        judge = CompletionSample(
+            self.main_window, self.judge_model,
+            f"Question:\n{self.prompt}\n\n{candidates}\n\nWhich answer is best? Reply with the answer number only.",
+            16, 0.0
+        ).collect()
+        self.judge_results.append(judge.result())
+        match = re.search(r"\d+", "".join(judge.chunks))
+        if not match or not 1 <= int(match.group()) <= len(samples):
+            return self.score_agreement(samples)
+        choice = int(match.group()) - 1
+        return [1.0 if index == choice else 0.5 * fmt for index, fmt in enumerate(self.score_format(samples))]
+
+class BestOfNWorker(QThread):
+    SESSION_SIGNALS = ("samples_ranked", "response_finished")
+
+    samples_ranked = pyqtSignal(list)
+    response_finished = pyqtSignal(float)
+
+    def __init__(self, main_window, models, prompt, count, max_tokens, temperature, ranker, stop_event=None):
+        super().__init__()
+        self.main_window = main_window
+        self.stop_event = stop_event or threading.Event()
+        self.models = models
+        self.prompt = prompt
+        self.count = count
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.ranker = ranker
+        self.samples = []
+
+    def temperatures(self):
+        if self.count == 1:
+            return [self.temperature]
+        low, high = max(0.0, self.temperature - 0.3), min(1.0, self.temperature + 0.3)
+        return [round(float(value), 2) for value in np.linspace(low, high, self.count)]
+
+    def run(self):
+        start_time = time.time()
+        self.samples = [
+            CompletionSample(self.main_window, self.models[index % len(self.models)], self.prompt, self.max_tokens, temperature,
+                             stop_event=self.stop_event)
+            for index, temperature in enumerate(self.temperatures())
+        ]
+        # All samples are in flight at once, so the batch takes about as long as its slowest call
+        with ThreadPoolExecutor(max_workers=len(self.samples)) as executor:
+            results = [sample.result() for sample in executor.map(CompletionSample.collect, self.samples)]
+        self.samples_ranked.emit(self.ranker.rank(results))
+        self.response_finished.emit(time.time() - start_time)
+
+    def stop(self):
+        self.stop_event.set()
+        for sample in self.samples:
+            threading.Thread(target=sample.close_stream, daemon=True).start()
+
+class Prewarm:
+    def __init__(self, participant, model, prefix):
+        self.participant = participant
+        self.model = model
+        self.provider = model.split(": ", 1)[0]
+        self.prefix = prefix
+        self.dispatched = None
+        self.finished = None
+        self.error = ""
+        self.usage = None  # (prompt tokens, completion tokens) as reported by the provider
+
+    def ready_by(self, when):
+        return not self.error and self.finished is not None and self.finished <= when
+
+class PromptPrewarmer(QObject):
+    # Fills a provider's prompt prefix cache for the next speaker while the current one streams,
+    # with a one-token request on the prefix its prompt is certain to start with
+    PROVIDERS = ("Anthropic", "OpenAI", "Ollama", "Custom")  # Groq has no prefix cache to fill
+    REPORTS_CACHE_READS = ("Anthropic", "OpenAI")  # Always report cached prompt tokens, so a miss is known
+    MAX_WORKERS = 2
+
+    primed = pyqtSignal(object)
+
+    def __init__(self, main_window):
+        super().__init__()
+        self.main_window = main_window
+        self.slots = threading.Semaphore(self.MAX_WORKERS)
+        self.closed = threading.Event()
+
+    def supports(self, model):
+        return model.split(": ", 1)[0] in self.PROVIDERS and self.main_window.replayer is None
+
+    def start(self, participant, model, prefix):
+        prewarm = Prewarm(participant, model, prefix)
+        # Daemon threads: a prime can wait up to Timeouts.REQUEST on its provider and must not hold up exit
+        threading.Thread(target=self.run, args=(prewarm,), name="prewarm", daemon=True).start()
+        return prewarm
+
+    def run(self, prewarm):
+        with self.slots:
+            if not self.closed.is_set():
+                self.prime(prewarm)
+
+    def prime(self, prewarm):
+        main_window = self.main_window
+        breaker = main_window.circuit_breakers.get(prewarm.provider)
+        try:
+            # Never wait: a prime that has to queue for capacity would only delay the real turn
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpen(f"{prewarm.provider} is unavailable")
+            if not main_window.rate_limiter.acquire(prewarm.provider, lambda: True):
+                raise RuntimeError("rate limited")
+            primers = {
+                "Anthropic": self.prime_anthropic,
+                "OpenAI": self.prime_openai,
+                "Ollama": self.prime_ollama,
+                "Custom": self.prime_custom
+            }
+            primers[prewarm.provider](prewarm, prewarm.model.split(": ", 1)[1])
+        except Exception as e:
+            prewarm.error = str(e) or type(e).__name__
+        finally:
+            prewarm.finished = time.time()
+            if not self.closed.is_set():
+                self.primed.emit(prewarm)
+
+    def prime_anthropic(self, prewarm, model):
+        # Anthropic only caches up to an explicit breakpoint; the real turn marks the same one
+        client = self.main_window.anthropic_client
+        if client is None:
+            raise RuntimeError("Anthropic API key not provided")
+        prewarm.dispatched = time.time()
+        message = client.messages.create(model=model, max_tokens=1, messages=[{"role": "user", "content": [
+            {"type": "text", "text": prewarm.prefix, "cache_control": {"type": "ephemeral"}}
+        ]}])
+        usage = message.usage
+        prewarm.usage = (usage.input_tokens + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+                         + (getattr(usage, "cache_read_input_tokens", 0) or 0), usage.output_tokens)
+
+    def prime_openai(self, prewarm, model):
+        # Caching is automatic for prompts of 1024 tokens or more
+        client = self.main_window.openai_client
+        if client is None:
+            raise RuntimeError("OpenAI API key not provided")
+        prewarm.dispatched = time.time()
+        completion = client.chat.completions.create(model=model, max_tokens=1,
+                                                    messages=[{"role": "user", "content": prewarm.prefix}])
+        prewarm.usage = (completion.usage.prompt_tokens, completion.usage.completion_tokens)
+
+    def prime_ollama(self, prewarm, model):
+        # The runner keeps the KV cache of its last prompt, so the real request only evaluates the new tail
+        pool = self.main_window.ollama_pool
+        host = pool.acquire(model, lambda: True)
+        if host is None:
+            raise RuntimeError("no free Ollama slot")
+        error = None
+        try:
+            prewarm.dispatched = time.time()
+            response = self.main_window.http.post(f"{host.url}/api/generate", json={
+                "model": model, "prompt": prewarm.prefix, "stream": False, "options": {"num_predict": 1}
+            }, timeout=Timeouts.REQUEST)
+            response.raise_for_status()
+            result = response.json()
+            prewarm.usage = (result.get("prompt_eval_count", 0), result.get("eval_count", 0))
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            pool.release(host, error)
+
+    def prime_custom(self, prewarm, model):
+        # vLLM's automatic prefix caching and llama.cpp's slot cache both match on the prompt prefix
+        endpoint = self.main_window.custom_endpoint
+        prewarm.dispatched = time.time()
+        response = self.main_window.http.post(f"{endpoint.base_url}/chat/completions", headers=endpoint.headers(), json={
+            "model": model, "messages": [{"role": "user", "content": prewarm.prefix}], "max_tokens": 1, "stream": False
+        }, timeout=Timeouts.REQUEST)
+        response.raise_for_status()
+        usage = response.json().get("usage") or {}
+        prewarm.usage = (usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+    def shutdown(self):
+        # Queued primes are dropped and running ones finish unreported
+        self.closed.set()
+
+class OpenAIBatch:
+    # Batch API: upload a JSONL file of chat requests, poll the batch, then download its output file
+    BASE_URL = "https://api.openai.com/v1"
+    FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+    def __init__(self, http, api_key, base_url=""):
+        self.http = http
+        self.base_url = (base_url or self.BASE_URL).rstrip("/")
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+
+    def call(self, method, url, **kwargs):
+        if url.startswith("/"):
+            url = f"{self.base_url}{url}"
+        response = self.http.request(method, url, headers=self.headers, timeout=Timeouts.REQUEST, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def submit(self, items, max_tokens, temperature):
+        lines = [
+            json.dumps({
+                "custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions",
+                "body": {"model": model, "messages": [{"role": "user", "content": prompt}],
+                         "max_tokens": max_tokens, "temperature": temperature}
+            })
+            for custom_id, model, prompt in items
+        ]
+        upload = self.call("POST", "/files", data={"purpose": "batch"},
+                           files={"file": ("batch.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")}).json()
+        batch = self.call("POST", "/batches", json={
+            "input_file_id": upload["id"], "endpoint": "/v1/chat/completions", "completion_window": "24h"
+        }).json()
+        return batch["id"]
+
+    def poll(self, batch_id):
+        batch = self.call("GET", f"/batches/{batch_id}").json()
+        counts = batch.get("request_counts") or {}
+        status = f"{batch['status']}, {counts.get('completed', 0)} of {counts.get('total', 0)} done"
+        return batch["status"] in self.FINAL_STATES, status, batch
+
+    def results(self, batch):
+        results = {}
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if not file_id:
+                continue
+            for line in self.call("GET", f"/files/{file_id}/content").text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                body = response.get("body") or {}
+                if entry.get("error") or response.get("status_code", 200) >= 400:
+                    error = entry.get("error") or body.get("error") or {}
+                    results[entry["custom_id"]] = ("", 0, 0, error.get("message") or str(error))
+                else:
+                    usage = body.get("usage") or {}
+                    text = body["choices"][0]["message"].get("content") or ""
+                    results[entry["custom_id"]] = (text, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), "")
+        return results
+
+    def cancel(self, batch_id):
+        self.call("POST", f"/batches/{batch_id}/cancel")
+
+class AnthropicBatch(OpenAIBatch):
+    # Message Batches API: requests go inline, results are a JSONL download from results_url
+    BASE_URL = "https://api.anthropic.com/v1"
+
+    def __init__(self, http, api_key, base_url=""):
+        super().__init__(http, api_key, base_url)
+        self.headers = {"x-api-key": api_key, "anthropic-version": "2023-06-01"}
+
+    def submit(self, items, max_tokens, temperature):
+        batch = self.call("POST", "/messages/batches", json={"requests": [
+            {"custom_id": custom_id, "params": {"model": model, "max_tokens": max_tokens, "temperature": temperature,
+                                                "messages": [{"role": "user", "content": prompt}]}}
+            for custom_id, model, prompt in items
+        ]}).json()
+        return batch["id"]
+
+    def poll(self, batch_id):
+        batch = self.call("GET", f"/messages/batches/{batch_id}").json()
+        counts = batch.get("request_counts") or {}
+        finished = sum(counts.get(key, 0) for key in ("succeeded", "errored", "canceled", "expired"))
+        status = f"{batch['processing_status']}, {finished} of {finished + counts.get('processing', 0)} done"
+        return batch["processing_status"] == "ended", status, batch
+
+    def results(self, batch):
+        results = {}
+        if not batch.get("results_url"):
+            return results
+        for line in self.call("GET", batch["results_url"]).text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            result = entry.get("result") or {}
+            if result.get("type") == "succeeded":
+                message = result["message"]
+                text = "".join(block.get("text", "") for block in message.get("content", []) if block.get("type") == "text")
+                usage = message.get("usage") or {}
+                results[entry["custom_id"]] = (text, usage.get("input_tokens", 0), usage.get("output_tokens", 0), "")
+            else:
+                error = (result.get("error") or {}).get("error") or result.get("error") or {}
+                results[entry["custom_id"]] = ("", 0, 0, error.get("message") or result.get("type", "failed"))
+        return results
+
+    def cancel(self, batch_id):
+        self.call("POST", f"/messages/batches/{batch_id}/cancel")
+
+class BatchWorker(QThread):
+    # Runs many independent prompts through a provider's asynchronous Batch API at the batch discount
+    CLIENTS = {"OpenAI": OpenAIBatch, "Anthropic": AnthropicBatch}
+    POLL_INTERVAL = 30
+
+    progress = pyqtSignal(str)
+    results_ready = pyqtSignal(list, float)
+    failed = pyqtSignal(str)
+
+    def __init__(self, main_window, model, prompts, max_tokens, temperature, base_url="", poll_interval=POLL_INTERVAL):
+        super().__init__()
+        self.main_window = main_window
+        self.model = model
+        self.provider = model.split(": ", 1)[0]
+        self.prompts = prompts
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.base_url = base_url
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        started = time.time()
+        client = self.CLIENTS[self.provider](self.main_window.http, self.main_window.api_keys.get(self.provider.lower(), ""), self.base_url)
+        name = self.model.split(": ", 1)[1]
+        try:
+            batch_id = client.submit([(f"request-{index}", name, prompt) for index, prompt in enumerate(self.prompts)],
+                                     self.max_tokens, self.temperature)
+            self.progress.emit(f"Batch {batch_id} submitted with {len(self.prompts)} prompts")
+            while True:
+                finished, status, batch = client.poll(batch_id)
+                self.progress.emit(f"Batch {batch_id}: {status}")
+                if finished:
+                    break
+                if self.stop_event.wait(self.poll_interval):
+                    client.cancel(batch_id)
+                    self.failed.emit(f"Batch {batch_id} cancelled")
+                    return
+            answers = client.results(batch)
+        except Exception as e:
+            self.failed.emit(f"Batch failed: {str(e)}")
+            return
+        results = []
+        for index, prompt in enumerate(self.prompts):
+            text, prompt_tokens, completion_tokens, error = answers.get(f"request-{index}", ("", 0, 0, "no result returned"))
+            results.append({"prompt": prompt, "text": text, "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens, "error": error})
+        self.results_ready.emit(results, time.time() - started)
+
+class ApiServer:
+    # OpenAI-compatible /v1/chat/completions on localhost, served by the same adapters as the GUI
+    HOST = "127.0.0.1"
+    PORT = 8765
+    MAX_CONCURRENT = 8  # Requests running against providers at once
+    MAX_PER_CLIENT = 2  # Running plus queued requests per client
+    QUEUE_SIZE = 64
+    QUEUE_TIMEOUT = 120
+    COLLABORATION_MODEL = "collaboration"
+    MAX_ROUNDS = 10  # An API request never runs an unbounded collaboration
+
+    def __init__(self, main_window, participants, settings):
+        self.main_window = main_window
+        self.participants = participants  # Default (model, role) pairs for the "collaboration" model
+        self.settings = settings
+        self.slots = threading.Semaphore(self.MAX_CONCURRENT)
+        self.lock = threading.Lock()
+        self.clients = defaultdict(int)
+        self.queued = 0
+        self.running = 0
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer((self.HOST, self.PORT), ApiRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.api = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def url(self):
+        return f"http://{self.HOST}:{self.PORT}/v1"
+
+    def models(self):
+        names = [f"{provider}: {model}" for provider, models in self.main_window.models.items() for model in models]
+        return names + [self.COLLABORATION_MODEL]
+
+    def admit(self, client):
+        with self.lock:
+            if self.clients[client] >= self.MAX_PER_CLIENT:
+                return 429, "Too many concurrent requests for this client"
+            if self.queued >= self.QUEUE_SIZE:
+                return 503, "Request queue is full"
+            self.clients[client] += 1
+            self.queued += 1
+        if not self.slots.acquire(timeout=self.QUEUE_TIMEOUT):
+            self.leave(client, queued=True)
+            return 503, "Timed out waiting in the request queue"
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        return 200, ""
+
+    def leave(self, client, queued=False):
+        with self.lock:
+            self.clients[client] -= 1
+            if not self.clients[client]:
+                del self.clients[client]
+            if queued:
+                self.queued -= 1
+                return
+            self.running -= 1
+        self.slots.release()
+
+    @staticmethod
+    def flatten_messages(messages):
+        if len(messages) == 1:
+            return str(messages[0].get("content", ""))
+        return "\n".join(f"{message.get('role', 'user')}: {message.get('content', '')}" for message in messages)
+
+    def turns(self, body):
+        participants = [
+            (entry["model"], entry.get("role", "General Assistant")) for entry in body.get("participants", [])
+        ] or self.participants
+        if body.get("model") != self.COLLABORATION_MODEL:
+            return [(body.get("model", ""), "")], 1
+        if len(participants) < 2:
+            raise ValueError("The collaboration model needs at least two participants")
+        rounds = body.get("rounds") or self.settings.get("rounds") or 1
+        return participants, min(int(rounds), self.MAX_ROUNDS)
+
+    def complete(self, body, on_token=None):
+        turns, rounds = self.turns(body)
+        max_tokens = int(body.get("max_tokens") or self.settings.get("max_tokens", 1000))
+        temperature = float(body.get("temperature", self.settings.get("temperature", 0.7)))
+        prompt = self.flatten_messages(body.get("messages", []))
+        results = []
+        if len(turns) == 1:
+            results.append(CompletionSample(self.main_window, turns[0][0], prompt, max_tokens, temperature, on_token).collect().result())
+            return results
+        history = ConversationStore()
+        history.append("system", ChatSession.COLLAB_SYSTEM_PROMPT)
+        history.append("user", prompt)
+        for _ in range(rounds):
+            for model, role in turns:
+                name = model.split(": ", 1)[-1]
+                if on_token:
+                    on_token(f"{name}: " if not results else f"\n\n{name}: ")
+                role_prompt = self.main_window.role_prompts.get(role, "")
+                result = CompletionSample(
+                    self.main_window, model, f"{role_prompt}\n{history.view().format()}", max_tokens, temperature, on_token
+                ).collect().result()
+                results.append(result)
+                if result["error"]:
+                    return results
+                history.append("assistant", result["text"], name)
+        return results
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def client_id(self):
+        # Clients are told apart by their bearer token, falling back to their address
+        authorization = self.headers.get("Authorization", "")
+        return authorization[7:] if authorization.startswith("Bearer ") else self.client_address[0]
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {"error": {"message": message, "type": "server_error" if status >= 500 else "invalid_request_error"}})
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/v1/models":
+            self.send_json(200, {"object": "list", "data": [
+                {"id": model, "object": "model", "owned_by": model.split(": ", 1)[0]} for model in self.server.api.models()
+            ]})
+        else:
+            self.send_error_json(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_error_json(404, f"Unknown path {self.path}")
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            self.server.api.turns(body)
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error_json(400, str(e))
+            return
+        api = self.server.api
+        client = self.client_id()
+        status, message = api.admit(client)
+        if status != 200:
+            self.send_error_json(status, message)
+            return
+        try:
+            if body.get("stream"):
+                self.stream_completion(api, body)
+            else:
+                self.send_completion(api, body)
+        finally:
+            api.leave(client)
+
+    def completion_id(self):
+        return f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+    @staticmethod
+    def usage(results):
+        prompt_tokens = sum(result["prompt_tokens"] for result in results)
+        completion_tokens = sum(result["completion_tokens"] for result in results)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    @staticmethod
+    def finish_reason(results):
+        return "length" if results and results[-1]["truncated"] else "stop"
+
+    def send_completion(self, api, body):
+        results = api.complete(body)
+        errors = [result["error"] for result in results if result["error"]]
+        if errors and len(results) == 1:
+            self.send_error_json(502, errors[0])
+            return
+        if len(results) == 1:
+            content = results[0]["text"]
+        else:
+            content = "\n\n".join(f"{result['model'].split(': ', 1)[-1]}: {result['text']}" for result in results)
+        self.send_json(200, {
+            "id": self.completion_id(),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": self.finish_reason(results)}],
+            "usage": self.usage(results)
+        })
+
+    def stream_completion(self, api, body):
+        completion_id = self.completion_id()
+        created = int(time.time())
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send_event(delta, finish_reason=None, **extra):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": body.get("model", ""),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            chunk.update(extra)
+            try:
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except OSError as e:
+                # The client went away: abandon the provider stream instead of finishing it
+                raise ClientDisconnected(str(e))
+
+        send_event({"role": "assistant"})
+        try:
+            results = api.complete(body, lambda token: send_event({"content": token}))
+        except ClientDisconnected:
+            return
+        errors = [result["error"] for result in results if result["error"]]
+        try:
+            if errors:
+                send_event({"content": f"\n\nError: {errors[0]}"})
+            send_event({}, self.finish_reason(results), usage=self.usage(results))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (ClientDisconnected, OSError):
+            pass
+
+class ConvergenceDetector:
+    DIMENSIONS = 1 << 14
+    NGRAM = 4  # Character n-grams within words, so "cache" and "caching" still overlap
+
+    def __init__(self, threshold, patience, window=2):
+        self.threshold = threshold
+        self.patience = patience
+        self.window = window  # How many previous turns a new turn is compared against
+        self.recent = deque(maxlen=window)
+        self.round_novelty = []
+        self.low_rounds = 0
+        self.last_novelty = 1.0
+
+    @classmethod
+    def ngram_counts(cls, text, dimensions=DIMENSIONS):
+        hashes = []
+        for word in re.findall(r"\w+", text.lower()):
+            padded = f" {word} "
+            hashes.extend(
+                zlib.crc32(padded[i:i + cls.NGRAM].encode("utf-8")) % dimensions
+                for i in range(max(1, len(padded) - cls.NGRAM + 1))
+            )
+        if not hashes:
+            return None
+        return np.log1p(np.bincount(np.array(hashes, dtype=np.int64), minlength=dimensions).astype(np.float32))
+
+    def vectorize(self, text):
+        vector = self.ngram_counts(text, self.DIMENSIONS)
+        if vector is None:
+            return None
+        return vector / np.linalg.norm(vector)
+
+    def observe_turn(self, text):
+        vector = self.vectorize(text)
+        if vector is None:
+            return 1.0
+        if self.recent:
+            similarity = max(float(np.dot(vector, previous)) for previous in self.recent)
+            novelty = 1.0 - similarity
+            self.round_novelty.append(novelty)
+        else:
+            novelty = 1.0
+        self.recent.append(vector)
+        return novelty
+
+    def round_finished(self):
+        if not self.round_novelty:
+            return False
+        self.last_novelty = sum(self.round_novelty) / len(self.round_novelty)
+        self.round_novelty = []
+        if self.threshold > 0 and self.last_novelty < self.threshold:
+            self.low_rounds += 1
+        else:
+            self.low_rounds = 0
+        return self.threshold > 0 and self.low_rounds >= self.patience
+
+    def stop_reason(self):
+        return (f"Collaboration converged: novelty {self.last_novelty:.2f} stayed below "
+                f"{self.threshold:.2f} for {self.low_rounds} round(s)")
+
+class SemanticIndex:
+    # Hashed n-gram term frequencies of earlier questions, weighted by IDF at query time
+    def __init__(self, dimensions, capacity):
+        self.capacity = capacity
+        self.vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self.document_frequency = np.zeros(dimensions, dtype=np.float32)
+        self.entries = []
+
+    def add(self, vector, entry):
+        if len(self.entries) >= self.capacity:
+            self.document_frequency -= self.vectors[0] > 0
+            self.vectors = self.vectors[1:]
+            self.entries.pop(0)
+        self.vectors = np.vstack([self.vectors, vector])
+        self.document_frequency += vector > 0
+        self.entries.append(entry)
+
+    def search(self, vector):
+        if not self.entries:
+            return None, 0.0
+        idf = np.log((1 + len(self.entries)) / (1 + self.document_frequency)) + 1
+        matrix = self.vectors * idf
+        query = vector * idf
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-9)
+        best = int(np.argmax(scores))
+        return self.entries[best], float(scores[best])
+
+class ResponseCache:
+    # Answers to single-model questions per model and role, shared by every session
+    MODES = ("Off", "Exact", "Semantic")
+    DIMENSIONS = 1 << 12
+    CAPACITY = 500  # Entries per model and role; the oldest go first
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.exact = {}  # (model, role, normalized question) -> entry
+        self.indexes = {}  # (model, role) -> SemanticIndex
+        self.hits = defaultdict(int)  # "exact" / "semantic" -> count
+        self.misses = 0
+
+    @staticmethod
+    def normalize(question):
+        return " ".join(question.split()).casefold()
+
+    def lookup(self, mode, model, role, question, threshold):
+        if mode not in self.MODES[1:]:
+            return None
+        with self.lock:
+            entry = self.exact.get((model, role, self.normalize(question)))
+            if entry is not None:
+                self.hits["exact"] += 1
+                return dict(entry, kind="exact", similarity=1.0)
+            index = self.indexes.get((model, role))
+            vector = ConvergenceDetector.ngram_counts(question, self.DIMENSIONS)
+            if mode == "Semantic" and index is not None and vector is not None:
+                entry, similarity = index.search(vector)
+                if entry is not None and similarity >= threshold:
+                    self.hits["semantic"] += 1
+                    return dict(entry, kind="semantic", similarity=similarity)
+            self.misses += 1
+        return None
+
+    def store(self, model, role, question, answer):
+        entry = {"question": question, "answer": answer, "time": time.time()}
+        with self.lock:
+            key = (model, role, self.normalize(question))
+            if key in self.exact:
+                self.exact[key].update(entry)  # The index row shares this dict, so it sees the fresh answer too
+                return
+            index = self.indexes.get((model, role))
+            if index is None:
+                index = self.indexes[(model, role)] = SemanticIndex(self.DIMENSIONS, self.CAPACITY)
+            if len(index.entries) >= index.capacity:
+                oldest = index.entries[0]
+                self.exact.pop((model, role, self.normalize(oldest["question"])), None)
+            self.exact[key] = entry
+            vector = ConvergenceDetector.ngram_counts(question, self.DIMENSIONS)
+            if vector is not None:
+                index.add(vector, entry)
+
+class Message:
+    __slots__ = ("role_id", "model_id", "content", "flags")
+
+    TRUNCATED = 1
+
+    def __init__(self, role_id, model_id, content, flags=0):
+        self.role_id = role_id
+        self.model_id = model_id
+        self.content = content
+        self.flags = flags
+
+class ConversationView:
+    __slots__ = ("store", "messages", "start", "stop")
+
+    def __init__(self, store, start=0, stop=None):
+        # Holds the message list itself so the view stays valid after the store is cleared
+        self.store = store
+        self.messages = store.messages
+        self.start = start
+        self.stop = len(self.messages) if stop is None else min(stop, len(self.messages))
+
+    def __len__(self):
+        return max(0, self.stop - self.start)
+
+    def __iter__(self):
+        messages = self.messages
+        for index in range(self.start, self.stop):
+            yield messages[index]
+
+    def parts(self):
+        prefixes = ConversationStore.PROMPT_PREFIXES
+        model_names = self.store.model_names
+        for message in self:
+            yield prefixes[message.role_id]
+            if message.model_id:
+                yield model_names[message.model_id]
+                yield ": "
+            yield message.content
+            yield "\n\n"
+
+    def format(self):
+        return "".join(self.parts())
+
+class ConversationStore:
+    ROLES = ("system", "user", "assistant")
+    ROLE_IDS = {role: role_id for role_id, role in enumerate(ROLES)}
+    PROMPT_PREFIXES = ("System: ", "Human: ", "AI: ")
+
+    def __init__(self):
+        self.messages = []
+        self.model_names = [""]
+        self.model_ids = {"": 0}
+        self.chunks = []
+        self.turn_flags = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def model_id(self, name):
+        model_id = self.model_ids.get(name)
+        if model_id is None:
+            model_id = len(self.model_names)
+            name = sys.intern(name)
+            self.model_ids[name] = model_id
+            self.model_names.append(name)
+        return model_id
+
+    def role(self, message):
+        return self.ROLES[message.role_id]
+
+    def model(self, message):
+        return self.model_names[message.model_id]
+
+    def opening_length(self):
+        # The system prompt and the question, everything before the first reply
+        assistant = self.ROLE_IDS["assistant"]
+        return next((index for index, message in enumerate(self.messages) if message.role_id == assistant), len(self.messages))
+
+    def append(self, role, content, model="", flags=0):
+        message = Message(self.ROLE_IDS[role], self.model_id(model), content, flags)
+        self.messages.append(message)
+        return message
+
+    def begin_turn(self, text=""):
+        self.chunks = [text] if text else []
+        self.turn_flags = 0
+
+    def add_chunk(self, text):
+        self.chunks.append(text)
+
+    def current_text(self):
+        return "".join(self.chunks)
+
+    def truncate_turn(self, length):
+        self.chunks = ["".join(self.chunks)[:length]]
+        self.turn_flags |= Message.TRUNCATED
+
+    def finish_turn(self, model):
+        content = "".join(self.chunks)
+        flags = self.turn_flags
+        self.chunks = []
+        self.turn_flags = 0
+        return self.append("assistant", content, model, flags)
+
+    def clear(self):
+        self.messages = []
+        self.chunks = []
+
+    def view(self, start=0, stop=None):
+        return ConversationView(self, start, stop)
+
+class TurnScheduler:
+    POLICIES = ("Round robin", "Parallel fan-out", "First idle")
+
+    def __init__(self, policy, participants):
+        self.policy = policy if policy in self.POLICIES else self.POLICIES[0]
+        self.participants = participants
+        self.running = set()
+        self.new_round()
+
+    def new_round(self):
+        self.started_in_round = 0
+        self.finished_in_round = set()
+
+    def next_turns(self):
+        if self.policy == "Round robin":
+            # One speaker at a time, in order
+            if self.running or self.started_in_round >= self.participants:
+                return []
+            return [self.started_in_round]
+        if self.policy == "Parallel fan-out":
+            # Everyone answers the same history at once; the round ends when all have answered
+            if self.started_in_round:
+                return []
+            return list(range(self.participants))
+        # First idle: whoever finishes speaks again right away instead of waiting for slower models
+        return [index for index in range(self.participants) if index not in self.running]
+
+    def start(self, index):
+        self.running.add(index)
+        self.started_in_round += 1
+
+    def turn_finished(self, index):
+        self.running.discard(index)
+        # Under first idle a fast model can speak several times in a round, which ends once everyone has spoken
+        self.finished_in_round.add(index)
+        return len(self.finished_in_round) >= self.participants
+
+class TokenBudget:
+    # Dollars per million (input, output) tokens; the first matching prefix wins, then the provider default
+    PRICES = {
+        "gpt-4o-mini": (0.15, 0.6),
+        "gpt-4o": (2.5, 10.0),
+        "gpt-4-turbo": (10.0, 30.0),
+        "gpt-3.5-turbo": (0.5, 1.5),
+        "claude-3-5-sonnet": (3.0, 15.0),
+        "claude-3-opus": (15.0, 75.0),
+        "claude-3-haiku": (0.25, 1.25),
+        "llama-3.1-8b": (0.05, 0.08),
+        "llama3-8b": (0.05, 0.08),
+        "mixtral-8x7b": (0.24, 0.24)
+    }
+    PROVIDER_PRICES = {"OpenAI": (2.5, 10.0), "Anthropic": (3.0, 15.0), "Groq": (0.59, 0.79), "Ollama": (0.0, 0.0), "Custom": (0.0, 0.0)}
+    CHARS_PER_TOKEN = 4  # Local estimate when a provider reports no usage
+    SHRINK_BELOW = 0.25  # Fraction of budget left at which max_tokens starts shrinking
+    THROTTLE_BELOW = 0.1
+    THROTTLE_DELAY = 10  # Seconds between rounds once throttled
+    MIN_TURN_TOKENS = 32
+    BURN_WINDOW = 60
+    BATCH_DISCOUNT = 0.5  # Batch API requests are billed at half price
+
+    def __init__(self, settings=None):
+        self.configure(settings or {})
+        self.reset()
+
+    def configure(self, settings):
+        self.token_limit = settings.get("budget_tokens", 0)
+        self.dollar_limit = settings.get("budget_dollars", 0)
+        self.model_token_limit = settings.get("budget_model_tokens", 0)
+
+    def reset(self):
+        self.tokens = 0
+        self.dollars = 0.0
+        self.estimated_tokens = 0
+        self.model_tokens = defaultdict(int)
+        self.recent = deque()  # (time, tokens, dollars) inside the burn-rate window
+        self.started = time.time()
+
+    @classmethod
+    def estimate_tokens(cls, chars):
+        return (chars + cls.CHARS_PER_TOKEN - 1) // cls.CHARS_PER_TOKEN
+
+    @classmethod
+    def price(cls, model):
+        provider, name = model.split(": ", 1)
+        for prefix, price in cls.PRICES.items():
+            if name.startswith(prefix):
+                return price
+        return cls.PROVIDER_PRICES.get(provider, (0.0, 0.0))
+
+    def record(self, model, prompt_tokens, completion_tokens, estimated=False, discount=1.0):
+        input_price, output_price = self.price(model)
+        tokens = prompt_tokens + completion_tokens
+        cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1e6 * discount
+        self.tokens += tokens
+        self.dollars += cost
+        self.model_tokens[model] += tokens
+        if estimated:
+            self.estimated_tokens += tokens
+        now = time.time()
+        self.recent.append((now, tokens, cost))
+        while self.recent and self.recent[0][0] < now - self.BURN_WINDOW:
+            self.recent.popleft()
+
+    def limited(self):
+        return bool(self.token_limit or self.dollar_limit or self.model_token_limit)
+
+    def remaining_tokens(self, model=None, prompt_tokens=0):
+        # Completion tokens left once a prompt of prompt_tokens has been paid for
+        limits = []
+        if self.token_limit:
+            limits.append(self.token_limit - self.tokens - prompt_tokens)
+        if self.model_token_limit and model:
+            limits.append(self.model_token_limit - self.model_tokens[model] - prompt_tokens)
+        if self.dollar_limit and model:
+            input_price, output_price = self.price(model)
+            if output_price:
+                dollars_left = self.dollar_limit - self.dollars - prompt_tokens * input_price / 1e6
+                limits.append(int(dollars_left * 1e6 / output_price))
+        return min(limits) if limits else None
+
+    def remaining_fraction(self):
+        fractions = [1.0]
+        if self.token_limit:
+            fractions.append(1 - self.tokens / self.token_limit)
+        if self.dollar_limit:
+            fractions.append(1 - self.dollars / self.dollar_limit)
+        if self.model_token_limit and self.model_tokens:
+            fractions.append(1 - max(self.model_tokens.values()) / self.model_token_limit)
+        return max(0.0, min(fractions))
+
+    def max_tokens(self, model, requested, prompt=""):
+        remaining = self.remaining_tokens(model, self.estimate_tokens(len(prompt)))
+        if remaining is None:
+            return requested
+        fraction = self.remaining_fraction()
+        if fraction < self.SHRINK_BELOW:
+            requested = int(requested * fraction / self.SHRINK_BELOW)
+        return max(self.MIN_TURN_TOKENS, min(requested, remaining))
+
+    def exhausted(self, model=None):
+        if self.dollar_limit and self.dollars >= self.dollar_limit:
+            return True
+        remaining = self.remaining_tokens(model)
+        return remaining is not None and remaining < self.MIN_TURN_TOKENS
+
+    def round_delay(self):
+        if self.limited() and self.remaining_fraction() < self.THROTTLE_BELOW:
+            return self.THROTTLE_DELAY
+        return 0
+
+    def burn_rate(self):
+        if not self.recent:
+            return 0.0, 0.0
+        minutes = max(time.time() - max(self.recent[0][0], self.started), 1.0) / 60
+        return sum(entry[1] for entry in self.recent) / minutes, sum(entry[2] for entry in self.recent) / minutes
+
+    def summary(self):
+        tokens_per_minute, dollars_per_minute = self.burn_rate()
+        text = (f"Spent {self.tokens:,} tokens (${self.dollars:.4f}) · "
+                f"burn {tokens_per_minute:,.0f} tok/min (${dollars_per_minute:.4f}/min)")
+        if self.estimated_tokens:
+            text += f" · {self.estimated_tokens:,} estimated"
+        if self.limited():
+            text += f" · {self.remaining_fraction():.0%} of budget left"
+        return text
+
+class ChatSession(QObject):
+    COLLAB_SYSTEM_PROMPT = "You are participating in a collaborative discussion. Please engage with the other models and the user in a constructive manner."
+    PARTICIPANT_COLORS = ["#cba6f7", "#89b4fa", "#a6e3a1", "#fab387", "#f9e2af", "#94e2d5", "#f5c2e7", "#eba0ac"]
+    UNPRIMED_HISTORY = 20  # Unprimed first-token times kept per model as the prewarm baseline
+
+    DEFAULT_SETTINGS = {
+        "rounds": 0,  # 0 indicates infinite rounds
+        "max_tokens": 1000,
+        "temperature": 0.7,
+        "mode": "Discussion",  # or "Draft and Refine": model 1 drafts, model 2 refines
+        "refine_after_chars": 0,  # Start the refiner on a partial draft, 0 waits for the full draft
+        "scheduler": "Round robin",  # How participants take turns, see TurnScheduler
+        "context_messages": 40,  # Latest history messages in each prompt after the opening ones, 0 for all
+        "chain_of_thought": False,  # Ask for reasoning sections and keep them out of the shared history
+        "prewarm_next_speaker": False,  # Prime the next speaker's prompt prefix cache during the current turn
+        "novelty_threshold": 0.25,  # 0 disables convergence detection
+        "convergence_rounds": 2,
+        "ttft_deadline": 0,  # Seconds, 0 disables
+        "turn_deadline": 0,
+        "fallback_model": "",  # "Provider: model" re-issued when a deadline is missed
+        "best_of_n": 1,  # Concurrent samples per single-model question, 1 disables
+        "best_of_models": [],  # Extra "Provider: model" entries the samples rotate through
+        "best_of_ranker": "Agreement vote",
+        "judge_model": "",
+        "response_cache": "Off",  # Off, Exact or Semantic reuse of earlier single-model answers
+        "cache_similarity": 0.8,  # Minimum TF-IDF cosine similarity for a semantic hit
+        "budget_tokens": 0,  # Per session, 0 for unlimited
+        "budget_dollars": 0,
+        "budget_model_tokens": 0  # Per model per session
+    }
+
+    update_chat_signal = pyqtSignal(str, bool, bool)
+    update_status_signal = pyqtSignal(str, int)
+
+    def __init__(self, main_window, name, settings=None):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.name = name
+        self.chat_box = ChatBox(main_window)
+        self.chat_box.session = self
+        self.status = ("Idle", 0)
+
+        self.stop_event = threading.Event()
+        self.collaboration_models = []
+        self.collaboration_roles = []
+        self.conversation_history = ConversationStore()
+        self.model_colors = {}
+        self.response_times = defaultdict(list)
+        self.model_swaps = []  # (round, missed model, fallback model, reason)
+        self.swap_markers = []  # [round index, seconds] points plotted on the response-time chart
+        self.abandoned_workers = set()
+        self.active_workers = set()
+        self.display_owner = None  # The worker whose turn is streaming into the chat and history
+        self.held_events = {}  # Other running workers -> transcript events queued until they get the display
+        self.refine_started = False
+        self.draft_context = ""
+        self.draft_chars = 0
+        self.draft_started = 0
+        self.draft_first_token = None
+        self.best_of_samples = []
+        self.cache_candidate = None  # (model, role key, question) of the single turn in flight
+        self.cache_hit = None  # Arguments to re-ask the last question answered from the cache
+        self.batch_worker = None
+        self.prewarmer = PromptPrewarmer(main_window)
+        self.prewarmer.primed.connect(self.handle_prewarm_finished)
+        self.prewarms = {}  # Participant index -> Prewarm waiting for that participant's turn
+        self.prewarm_stats = defaultdict(float)
+        self.unprimed_first_token = defaultdict(lambda: deque(maxlen=self.UNPRIMED_HISTORY))  # Model -> recent unprimed TTFTs
+
+        self.collab_settings = copy.deepcopy(settings or self.DEFAULT_SETTINGS)
+        self.budget = TokenBudget(self.collab_settings)
+
+        self.worker_thread = None
+        self.collab_round = 1  # Initialize collaboration round
+        self.collab_stop_reason = ""
+        self.collaborating = False
+        self.scheduler = TurnScheduler("Round robin", 0)
+        self.convergence = ConvergenceDetector(0, 1)
+        self.current_collab_model_index = 0  # For managing model sequence
+        self.round_started = None
+
+        self.update_chat_signal.connect(self.chat_box.display_message)
+        self.update_status_signal.connect(self.show_status)
+        # A child of the session, so a closed tab's pending reset never fires
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(2000)
+        self.idle_timer.timeout.connect(lambda: self.update_status_signal.emit("Idle", 0))
+
+    def is_current(self):
+        return self.main_window.session_tabs.currentWidget() is self.chat_box
+
+    def show_status(self, status, progress):
+        self.status = (status, progress)
+        if self.is_current():
+            self.main_window.control_panel.update_status(status, progress)
+
+    def start_progress(self):
+        if self.is_current():
+            self.main_window.control_panel.start_progress_animation()
+
+    def stop_progress(self):
+        if self.is_current():
+            self.main_window.control_panel.stop_progress_animation()
+
+    def refresh_chart(self):
+        if self.is_current():
+            self.main_window.control_panel.visualization.update_chart(self.response_times, self.swap_markers)
+
+    def refresh_spend(self):
+        if self.is_current():
+            self.main_window.control_panel.visualization.update_spend(self.budget.summary())
+
+    def refresh_samples_button(self):
+        if self.is_current():
+            self.main_window.control_panel.other_samples_button.setEnabled(len(self.best_of_samples) > 1)
+
+    def refresh_cache_button(self):
+        if self.is_current():
+            self.main_window.control_panel.bypass_cache_button.setEnabled(self.cache_hit is not None)
+
+    def handle_message(self, message):
+        self.chat_box.display_message(message, is_user=True)
+        self.start_progress()
+        self.update_status_signal.emit("Processing", 0)
+        self.stop_event.clear()
+
+        if self.budget.exhausted():
+            self.stop_progress()
+            self.update_status_signal.emit("Token budget exhausted", 100)
+            self.update_chat_signal.emit(f"Token budget exhausted. {self.budget.summary()}", False, False)
+            return
+
+        if self.main_window.current_mode == "collaboration" and self.collaboration_models:
+            self.conversation_history.append("user", message)
+            self.collaborative_interaction(message)
+        else:
+            selected_model = self.main_window.selected_model
+            if selected_model:
+                selected_role = self.main_window.control_panel.role_dropdown.currentText()
+                chain_of_thought = self.main_window.control_panel.chain_of_thought_checkbox.isChecked()
+                self.single_model_response(selected_model, selected_role, message, chain_of_thought)
+            else:
+                self.main_window.show_error_message("Please select a provider and model.")
+
+    def single_model_response(self, model, role, user_message, chain_of_thought, provider=None, use_cache=True):
+        role_prompt = self.main_window.role_prompts.get(role, "You are a general assistant. 😊")
+
+        full_prompt = f"{role_prompt}\n{user_message}"
+
+        if chain_of_thought:
+            full_prompt += SectionParser.INSTRUCTIONS
+
+        display_model_name = model  # Since model names are now without provider prefixes
+        self.model_colors = {display_model_name: QColor("#cba6f7")}  # Assign default color
+        self.chat_box.model_colors = self.model_colors
+
+        provider = provider or self.main_window.selected_provider
+        full_model_name = f"{provider}: {model}"
+        role_key = f"{role} (chain of thought)" if chain_of_thought else role
+        self.cache_hit = None
+        if use_cache and self.answer_from_cache(full_model_name, role_key, user_message):
+            self.cache_hit = (model, role, user_message, chain_of_thought, provider)
+            self.refresh_cache_button()
+            return
+        self.refresh_cache_button()
+        self.cache_candidate = None
+        if self.collab_settings.get("response_cache", "Off") != "Off":
+            self.cache_candidate = (full_model_name, role_key, user_message)
+        if self.collab_settings.get("best_of_n", 1) > 1:
+            self.best_of_n_response(full_model_name, full_prompt, chain_of_thought)
+        else:
+            self.start_turn(full_model_name, full_prompt, collaborative=False, chain_of_thought=chain_of_thought)
+
+    def answer_from_cache(self, model, role_key, question):
+        hit = self.main_window.response_cache.lookup(
+            self.collab_settings.get("response_cache", "Off"), model, role_key, question,
+            self.collab_settings.get("cache_similarity", 0.8)
+        )
+        if hit is None:
+            return False
+        model_name = model.split(": ", 1)[1]
+        match = "Same question" if hit["kind"] == "exact" else f"{hit['similarity']:.0%} similar question"
+        age = time.time() - hit["time"]
+        age = f"{age / 60:.0f} min" if age >= 60 else f"{age:.0f}s"
+        # No model name here: display_message would split an Ollama tag such as "llama3:latest" at its colon
+        self.update_chat_signal.emit(f"[From cache] {match} answered {age} ago", False, False)
+        self.chat_box.append_response(hit["answer"], model_name)
+        self.chat_box.finish_response()
+        self.stop_progress()
+        self.update_status_signal.emit("Answered from cache", 100)
+        self.idle_timer.start()
+        return True
+
+    def bypass_cache(self):
+        if self.cache_hit is None:
+            return
+        model, role, question, chain_of_thought, provider = self.cache_hit
+        self.start_progress()
+        self.update_status_signal.emit("Processing", 0)
+        self.stop_event.clear()
+        self.single_model_response(model, role, question, chain_of_thought, provider, use_cache=False)
+
+    def run_batch(self, model, prompts, base_url="", poll_interval=BatchWorker.POLL_INTERVAL):
+        if self.batch_worker is not None and self.batch_worker.isRunning():
+            self.main_window.show_error_message("A batch is already running in this session.")
+            return
+        self.batch_worker = BatchWorker(
+            self.main_window, model, prompts,
+            self.budget.max_tokens(model, self.collab_settings["max_tokens"], max(prompts, key=len)),
+            self.collab_settings["temperature"], base_url, poll_interval
+        )
+        self.batch_worker.progress.connect(lambda status: self.update_status_signal.emit(status, 50))
+        self.batch_worker.failed.connect(self.handle_batch_failed)
+        self.batch_worker.results_ready.connect(lambda results, elapsed: self.handle_batch_results(model, results, elapsed))
+        self.start_progress()
+        self.update_chat_signal.emit(f"Submitting {len(prompts)} prompts to the {model.split(': ', 1)[0]} Batch API", False, False)
+        self.batch_worker.start()
+
+    def handle_batch_results(self, model, results, elapsed):
+        model_name = model.split(": ", 1)[1]
+        self.model_colors.setdefault(model_name, QColor(self.PARTICIPANT_COLORS[1]))
+        self.chat_box.model_colors = self.model_colors
+        answered = 0
+        for result in results:
+            self.chat_box.display_message(result["prompt"], is_user=True)
+            if result["error"]:
+                self.update_chat_signal.emit(f"{model_name}: Error: {result['error']}", False, False)
+            else:
+                answered += 1
+                self.chat_box.append_response(result["text"], model_name)
+                self.chat_box.finish_response()
+            self.budget.record(model, result["prompt_tokens"], result["completion_tokens"], discount=TokenBudget.BATCH_DISCOUNT)
+        # Batches report no per-request timing, so each batch adds its turnaround once
+        self.response_times[f"{model_name} (batch)"].append(elapsed)
+        self.main_window.metrics.inc("llm_requests", len(results), provider=model.split(": ", 1)[0], model=model_name)
+        self.refresh_chart()
+        self.refresh_spend()
+        self.stop_progress()
+        summary = f"Batch finished in {elapsed:.0f}s with {answered} of {len(results)} prompts answered at the batch discount"
+        self.update_chat_signal.emit(summary, False, False)
+        self.update_status_signal.emit(summary, 100)
+
+    def handle_batch_failed(self, message):
+        self.stop_progress()
+        self.update_chat_signal.emit(message, False, False)
+        self.update_status_signal.emit(message, 100)
+
+    def best_of_n_response(self, model, prompt, chain_of_thought=False):
+        models = [model] + [extra for extra in self.collab_settings.get("best_of_models", []) if extra != model]
+        for extra in models[1:]:
+            self.model_colors.setdefault(extra.split(": ", 1)[1], QColor("#89b4fa"))
+        ranker = SampleRanker(self.main_window, self.collab_settings.get("best_of_ranker", "Agreement vote"), prompt, self.collab_settings.get("judge_model", ""))
+        self.worker_thread = BestOfNWorker(
+            self.main_window, models, prompt,
+            self.collab_settings["best_of_n"],
+            self.budget.max_tokens(model, self.collab_settings["max_tokens"], prompt),
+            self.collab_settings["temperature"],
+            ranker,
+            self.stop_event
+        )
+        worker = self.worker_thread
+        # Bound to this worker: another message may replace self.worker_thread before ranking finishes
+        worker.samples_ranked.connect(lambda samples, worker=worker: self.handle_samples_ranked(samples, worker.ranker.judge_results, chain_of_thought))
+        worker.response_finished.connect(self.handle_response_finished)
+        worker.finished.connect(lambda: self.abandoned_workers.discard(worker))
+        worker.start()
+
+    def handle_samples_ranked(self, samples, judge_results=(), chain_of_thought=False):
+        for sample in samples + list(judge_results):
+            self.handle_usage(sample["model"], sample["prompt_tokens"], sample["completion_tokens"], sample["estimated"])
+        self.best_of_samples = samples
+        self.refresh_samples_button()
+        winner = samples[0]
+        model_name = winner["model"].split(": ", 1)[1]
+        candidate, self.cache_candidate = self.cache_candidate, None
+        if not winner["text"]:
+            self.update_chat_signal.emit(f"{model_name}: Error: {winner['error']}", False, False)
+            return
+        answer = winner["text"]
+        if chain_of_thought:
+            sections = SectionParser()
+            events = sections.feed(winner["text"]) + sections.finish()
+            answer = "".join(event[1] for event in events if event[0] == "text")
+            self.show_sections(events, model_name, record=False)
+        else:
+            self.chat_box.append_response(winner["text"], model_name)
+        if candidate is not None and not winner["truncated"] and answer.strip():
+            self.main_window.response_cache.store(*candidate, answer)
+        self.chat_box.finish_response()
+        ranker = self.collab_settings.get("best_of_ranker", "Agreement vote").lower()
+        self.update_chat_signal.emit(
+            f"Best of {len(samples)}: {model_name} at temperature {winner['temperature']:.2f} won by {ranker} "
+            f"with score {winner['score']:.2f}, slowest sample {max(sample['elapsed'] for sample in samples):.2f}s",
+            False, False
+        )
+
+    def show_other_samples(self):
+        if self.best_of_samples:
+            SamplesDialog(self.best_of_samples, self.main_window).show()
+
+    def start_turn(self, model, prompt, collaborative, stage="", participant=0, chain_of_thought=False):
+        display_model_name = model.split(": ", 1)[1]
+        finished_model = display_model_name if collaborative else ""
+        series = f"{stage}: {display_model_name}" if stage else display_model_name
+        worker = WorkerThread(
+            self.main_window, model, prompt,
+            self.budget.max_tokens(model, self.collab_settings["max_tokens"], prompt),
+            self.collab_settings["temperature"],
+            self.collab_settings.get("ttft_deadline", 0),
+            self.collab_settings.get("turn_deadline", 0),
+            self.stop_event
+        )
+        if chain_of_thought:
+            worker.sections = SectionParser()
+        worker.response_received.connect(lambda text, append: self.deliver(worker, self.handle_model_response, text, append, display_model_name, worker.sections))
+        worker.response_truncated.connect(lambda keep_chars, reason: self.deliver(worker, self.handle_response_truncated, keep_chars, reason, display_model_name, worker.sections))
+        worker.deadline_missed.connect(lambda reason, elapsed: self.handle_deadline_missed(worker, reason, elapsed, model, prompt, collaborative, stage, participant))
+        worker.finished.connect(lambda: self.abandoned_workers.discard(worker))
+        worker.finished.connect(lambda: self.active_workers.discard(worker))
+        worker.usage_reported.connect(lambda prompt_tokens, completion_tokens, estimated: self.handle_usage(model, prompt_tokens, completion_tokens, estimated))
+        worker.response_finished.connect(lambda time: self.handle_response_finished(time, finished_model, series, participant, worker))
+        if stage:
+            worker.first_token_received.connect(lambda elapsed: self.handle_stage_first_token(stage, series, elapsed))
+        if stage == "Draft":
+            worker.response_received.connect(self.handle_draft_progress)
+        if collaborative:
+            self.take_prewarm(worker, participant)
+        self.worker_thread = worker
+        self.active_workers.add(worker)
+        worker.queued_time = time.time()
+        worker.start()
+        return worker
+
+    def deliver(self, worker, handler, *args):
+        # Turns may run concurrently, but only one streams into the chat and history at a time
+        if self.display_owner is None:
+            self.acquire_display(worker)
+        if worker is self.display_owner:
+            handler(*args)
+        else:
+            self.held_events.setdefault(worker, []).append((handler, args))
+
+    def acquire_display(self, worker):
+        self.display_owner = worker
+        self.conversation_history.begin_turn()
+
+    def release_display(self, worker):
+        if worker is not self.display_owner:
+            return
+        self.display_owner = None
+        if self.held_events:
+            next_worker = next(iter(self.held_events))
+            events = self.held_events.pop(next_worker)
+            self.acquire_display(next_worker)
+            for handler, args in events:
+                handler(*args)
+
+    def collaborative_interaction(self, user_message):
+        self.current_collab_model_index = 0
+        self.collab_round = 1
+        self.round_started = None
+        self.collab_stop_reason = ""
+        self.collaborating = True
+        self.refine_started = False
+        self.prewarms = {}
+        self.prewarm_stats = defaultdict(float)
+        self.scheduler = TurnScheduler(self.collab_settings.get("scheduler", "Round robin"), len(self.collaboration_models))
+        self.convergence = ConvergenceDetector(
+            self.collab_settings.get("novelty_threshold", 0),
+            self.collab_settings.get("convergence_rounds", 2),
+            window=len(self.collaboration_models)
+        )
+        self.process_next_collab_model()
+
+    def process_next_collab_model(self):
+        if not self.collaborating or self.stop_event.is_set():
+            return
+        if self.round_started is None:
+            self.round_started = time.time()
+        if self.collab_settings.get("mode") == "Draft and Refine":
+            self.process_draft_refine_stage()
+            return
+        for index in self.scheduler.next_turns():
+            model = self.collaboration_models[index]
+            if self.budget.exhausted(model):
+                self.stop_progress()
+                self.end_collaboration(f"Token budget exhausted. {self.budget.summary()}")
+                return
+            prompt_started = time.time()
+            role_prompt = self.main_window.role_prompts.get(self.collaboration_roles[index], "")
+            history = self.format_conversation_history()
+            prompt = f"{role_prompt}\n{history}"
+            chain_of_thought = self.collab_settings.get("chain_of_thought", False)
+            if chain_of_thought:
+                prompt += SectionParser.INSTRUCTIONS
+            self.scheduler.start(index)
+            worker = self.start_turn(model, prompt, collaborative=True, participant=index, chain_of_thought=chain_of_thought)
+            worker.prompt_started = prompt_started
+            self.prewarm_next_speaker(index, history)
+
+    def prewarm_next_speaker(self, index, history):
+        # Only round robin has a speaker waiting on this turn; the history so far is the start of its prompt
+        if self.scheduler.policy != "Round robin":
+            return
+        count = len(self.collaboration_models)
+        rounds = self.collab_settings["rounds"]
+        if index == count - 1 and rounds and self.collab_round >= rounds:
+            return
+        next_index = (index + 1) % count
+        role_prompt = self.main_window.role_prompts.get(self.collaboration_roles[next_index], "")
+        self.prewarm_participant(next_index, f"{role_prompt}\n{history}")
+
+    def prewarm_participant(self, participant, prefix):
+        model = self.collaboration_models[participant]
+        if self.collab_settings.get("prewarm_next_speaker") and self.prewarmer.supports(model):
+            self.prewarms[participant] = self.prewarmer.start(participant, model, prefix)
+            self.prewarm_stats["requests"] += 1
+
+    def take_prewarm(self, worker, participant):
+        prewarm = self.prewarms.pop(participant, None)
+        if prewarm is None or prewarm.model != worker.model or not worker.prompt.startswith(prewarm.prefix):
+            return
+        worker.prewarm = prewarm
+        if worker.provider == "Anthropic" and not prewarm.error:
+            worker.call.cache_prefix = len(prewarm.prefix)
+
+    def handle_prewarm_finished(self, prewarm):
+        if prewarm.usage:
+            self.budget.record(prewarm.model, *prewarm.usage)
+            self.refresh_spend()
+        if prewarm.error:
+            self.prewarm_stats["failed"] += 1
+        self.main_window.metrics.inc("llm_prewarm_requests", provider=prewarm.provider, outcome="failed" if prewarm.error else "primed")
+        if self.main_window.tracer.enabled and prewarm.dispatched is not None:
+            self.main_window.tracer.complete("prewarm", "prewarm", prewarm.dispatched, prewarm.finished,
+                                             f"{self.name}: prewarm {prewarm.participant + 1}", model=prewarm.model,
+                                             prefix_chars=len(prewarm.prefix), error=prewarm.error)
+
+    def record_prewarm_saving(self, worker, first_token):
+        # A prime only helps if the turn read the prefix from the provider's cache. Where the provider reports
+        # cache reads a miss is known; Ollama and most Custom servers don't say, so their savings are unverified.
+        # The saving is an estimate: the primed turn's time to first token against the median of the model's
+        # recent unprimed turns, counted as none when the primed turn was no faster.
+        prewarm = worker.prewarm
+        if not prewarm.ready_by(worker.call.dispatch_time):
+            self.prewarm_stats["late"] += 1
+            return
+        self.prewarm_stats["primed"] += 1
+        if worker.provider in PromptPrewarmer.REPORTS_CACHE_READS and not worker.call.cached_tokens:
+            self.prewarm_stats["missed"] += 1
+            return
+        self.prewarm_stats["cached_tokens"] += worker.call.cached_tokens
+        unprimed = self.unprimed_first_token[worker.model]
+        if not unprimed:
+            return
+        saved = max(0.0, float(np.median(unprimed)) - first_token)
+        verified = worker.call.cached_tokens > 0
+        key = "verified" if verified else "unverified"
+        self.prewarm_stats[key] += 1
+        self.prewarm_stats[f"{key}_saved"] += saved
+        self.main_window.metrics.observe("llm_prewarm_saved_seconds", saved, provider=worker.provider,
+                                         model=worker.model.split(": ", 1)[1], verified=str(verified).lower())
+
+    def prewarm_summary(self):
+        stats = self.prewarm_stats
+        primed = int(stats["primed"])
+        # Primes for a turn that never came after an early stop are left out
+        summary = f"Prewarmed {primed} of {int(stats['requests']) - len(self.prewarms)} turns in time"
+        if stats["missed"]:
+            summary += f", {int(stats['missed'])} missed the provider's cache"
+        if stats["verified"]:
+            verified = int(stats["verified"])
+            summary += (f", first token about {stats['verified_saved']:.2f}s sooner in total than the median unprimed turn"
+                        f" on {verified} cache hits ({stats['verified_saved'] / verified:.2f}s per turn)")
+        if stats["unverified"]:
+            unverified = int(stats["unverified"])
+            summary += (f", about {stats['unverified_saved']:.2f}s sooner on {unverified} turns whose provider doesn't"
+                        f" report cache hits (unverified)")
+        if stats["late"]:
+            summary += f", {int(stats['late'])} primed too late"
+        if stats["failed"]:
+            summary += f", {int(stats['failed'])} failed"
+        if stats["cached_tokens"]:
+            summary += f", {int(stats['cached_tokens'])} prompt tokens read from provider caches"
+        return summary
+
+    def finish_collab_turn(self, participant):
+        if not self.collaborating:
+            return
+        if not self.scheduler.turn_finished(participant):
+            self.process_next_collab_model()
+            return
+        # Collaboration round finished
+        self.trace_round()
+        self.stop_progress()
+        self.update_status_signal.emit("Collaboration round finished", 100)
+        self.main_window.diagnostics.round_finished(self.collab_round)
+        self.idle_timer.start()
+        # Reset for next round if applicable
+        if self.convergence.round_finished():
+            self.end_collaboration(self.convergence.stop_reason())
+        elif self.collab_settings["rounds"] == 0 or self.collab_round < self.collab_settings["rounds"]:
+            self.collab_round += 1
+            self.scheduler.new_round()
+            delay = self.budget.round_delay()
+            if delay:
+                self.update_status_signal.emit(f"Budget low, next round in {delay}s", 0)
+                QTimer.singleShot(delay * 1000, self.process_next_collab_model)
+            else:
+                self.process_next_collab_model()
+        else:
+            self.end_collaboration(f"Collaboration finished after {self.collab_round} round(s)")
+
+    def process_draft_refine_stage(self):
+        drafter, refiner = self.collaboration_models[:2]
+        if self.current_collab_model_index == 0:
+            self.draft_context = self.format_conversation_history()
+            self.draft_chars = 0
+            self.draft_started = time.time()
+            self.draft_first_token = None
+            role_prompt = self.main_window.role_prompts.get(self.collaboration_roles[0], "")
+            self.start_turn(drafter, f"{role_prompt}\n{self.draft_context}", collaborative=True, stage="Draft")
+            refiner_role_prompt = self.main_window.role_prompts.get(self.collaboration_roles[1], "")
+            self.prewarm_participant(1, f"{refiner_role_prompt}\n{self.draft_context}")
+        elif self.current_collab_model_index == 1:
+            # An early refiner is already running; its queued output takes the display next
+            if not self.refine_started:
+                self.refine_started = True
+                draft = self.conversation_history.messages[-1].content
+                self.start_turn(refiner, self.refine_prompt(draft, partial=False), collaborative=True, stage="Refine", participant=1)
+        else:
+            self.trace_round()
+            self.stop_progress()
+            self.main_window.diagnostics.round_finished(self.collab_round)
+            self.idle_timer.start()
+            first_text = f"{self.draft_first_token:.2f}s" if self.draft_first_token is not None else "n/a"
+            self.end_collaboration(
+                f"Draft and refine finished: first text after {first_text}, "
+                f"refined answer after {time.time() - self.draft_started:.2f}s"
+            )
+
+    def refine_prompt(self, draft, partial):
+        role_prompt = self.main_window.role_prompts.get(self.collaboration_roles[1], "")
+        note = " The draft is still being written, so complete any unfinished parts." if partial else ""
+        return (
+            f"{role_prompt}\n{self.draft_context}"
+            f"A faster model drafted the answer below.{note} Correct, complete and improve it, "
+            f"then reply with the final answer only.\n\nDraft:\n{draft}"
+        )
+
+    def handle_draft_progress(self, text, append):
+        threshold = self.collab_settings.get("refine_after_chars", 0)
+        if not append or threshold <= 0 or self.refine_started or self.current_collab_model_index != 0:
+            return
+        self.draft_chars += len(text)
+        if self.draft_chars >= threshold:
+            # Overlap the refiner's request with the rest of the draft; its output is shown once the draft ends
+            self.refine_started = True
+            draft = self.conversation_history.current_text()
+            self.start_turn(self.collaboration_models[1], self.refine_prompt(draft, partial=True), collaborative=True, stage="Refine", participant=1)
+
+    def handle_usage(self, model, prompt_tokens, completion_tokens, estimated):
+        self.budget.record(model, prompt_tokens, completion_tokens, estimated)
+        self.refresh_spend()
+
+    def handle_stage_first_token(self, stage, series, elapsed):
+        self.response_times[f"{series} (first token)"].append(elapsed)
+        self.refresh_chart()
+        if stage == "Draft" and self.draft_first_token is None:
+            self.draft_first_token = time.time() - self.draft_started
+            self.update_status_signal.emit(f"Draft streaming after {self.draft_first_token:.2f}s", 50)
+
+    def end_collaboration(self, reason):
+        # Turns already in flight still finish, but no new ones start
+        self.collaborating = False
+        self.collab_stop_reason = reason
+        self.update_chat_signal.emit(reason, False, False)
+        self.update_status_signal.emit(reason, 100)
+        if self.prewarm_stats["requests"]:
+            self.update_chat_signal.emit(self.prewarm_summary(), False, False)
+        self.prewarms = {}
+
+    def handle_model_response(self, text, append, model="", sections=None):
+        if not append:
+            self.cache_candidate = None  # Errors and notices are never cached
+            self.conversation_history.begin_turn(text)
+            # Start new message with model name
+            self.update_chat_signal.emit(f"{model}: {text}", False, False)
+        elif sections is not None:
+            self.show_sections(sections.feed(text), model)
+        else:
+            self.conversation_history.add_chunk(text)
+            # Append text without model name
+            self.chat_box.append_response(text, model)
+
+    def show_sections(self, events, model, record=True):
+        # Only the answer reaches the history and later prompts; reasoning stays in the chat as panels
+        for event in events:
+            if event[0] == "text":
+                if record:
+                    self.conversation_history.add_chunk(event[1])
+                self.chat_box.append_response(event[1], model)
+            elif event[0] == "panel":
+                self.chat_box.add_panel(event[1], event[2], model)
+            else:
+                self.update_status_signal.emit(f"{model} is {event[1]}", 50)
+
+    def handle_response_truncated(self, keep_chars, reason, model="", sections=None):
+        if sections is not None:
+            self.show_sections([event for event in sections.finish() if event[0] == "panel"], model)
+            keep_chars = SectionParser.visible_length("".join(sections.raw)[:keep_chars])
+        # Drop the looping tail so it does not bloat later prompts
+        self.cache_candidate = None
+        self.conversation_history.truncate_turn(keep_chars)
+        self.chat_box.finish_response()
+        self.update_chat_signal.emit(f"{model}: [Generation cut: {reason}]", False, False)
+
+    def handle_deadline_missed(self, worker, reason, elapsed, model, prompt, collaborative, stage="", participant=0):
+        display_model_name = model.split(": ", 1)[1]
+        fallback = self.collab_settings.get("fallback_model")
+        self.cache_candidate = None
+        if worker is self.display_owner:
+            self.chat_box.finish_response()
+        if not fallback or fallback == model:
+            # The stream is already closed; the turn finishes with whatever arrived
+            self.update_chat_signal.emit(f"{display_model_name}: [Deadline missed: {reason}]", False, False)
+            return
+        self.abandon_worker(worker)
+        self.main_window.metrics.inc("llm_retries", provider=worker.provider, reason="deadline")
+        fallback_name = fallback.split(": ", 1)[1]
+        self.model_swaps.append((self.collab_round, display_model_name, fallback_name, reason))
+        self.response_times[display_model_name].append(elapsed)
+        self.swap_markers.append([len(self.response_times[display_model_name]), elapsed])
+        self.refresh_chart()
+        self.update_chat_signal.emit(f"{display_model_name}: [Deadline missed: {reason}. Switching to {fallback_name}]", False, False)
+        self.start_turn(fallback, prompt, collaborative, stage, participant, worker.sections is not None)
+
+    def abandon_worker(self, worker):
+        # Let a cancelled worker wind down on its own without its late signals reaching the session
+        for name in worker.SESSION_SIGNALS:
+            try:
+                getattr(worker, name).disconnect()
+            except TypeError:
+                pass  # Nothing was connected
+        if worker.isRunning():
+            self.abandoned_workers.add(worker)
+        self.active_workers.discard(worker)
+        self.held_events.pop(worker, None)
+        self.release_display(worker)
+
+    def handle_response_finished(self, response_time, model="", series="", participant=0, worker=None):
+        # Only the transcript waits for the display; a model's next turn waits only on its own answer
+        if worker is not None:
+            self.deliver(worker, self.show_finished_turn, model, participant, worker)
+        else:
+            self.show_finished_turn(model, participant, worker)
+        if not model:
+            return
+        # Record the response time
+        self.response_times[series or model].append(response_time)
+        self.refresh_chart()
+        if worker is not None and worker.call.first_token_time is not None and worker.call.dispatch_time is not None:
+            first_token = worker.call.first_token_time - worker.call.dispatch_time
+            if worker.prewarm is None or worker.prewarm.error:
+                self.unprimed_first_token[worker.model].append(first_token)
+            else:
+                self.record_prewarm_saving(worker, first_token)
+        if self.collab_settings.get("mode") == "Draft and Refine":
+            return
+        if worker in self.held_events:
+            # Its answer reaches the history only with the display; rescheduling now would re-answer the same history
+            self.held_events[worker].append((self.finish_collab_turn, (participant,)))
+        else:
+            self.finish_collab_turn(participant)
+
+    def show_finished_turn(self, model, participant, worker):
+        if worker is not None and worker.sections is not None:
+            self.show_sections(worker.sections.finish(), worker.model.split(": ", 1)[1])
+        self.chat_box.finish_response()
+        if model:
+            append_started = time.time()
+            message = self.conversation_history.finish_turn(model)
+            self.convergence.observe_turn(message.content)
+            if worker is not None and self.main_window.tracer.enabled:
+                self.trace_turn(worker, participant, (append_started, time.time()))
+            if self.collab_settings.get("mode") == "Draft and Refine":
+                # The refiner reads the draft from the history, so the stages follow the transcript
+                self.current_collab_model_index += 1
+                self.process_next_collab_model()
+        else:
+            # Single model response finished
+            if worker is not None and self.main_window.tracer.enabled:
+                self.trace_turn(worker)
+            if self.cache_candidate is not None:
+                answer = self.conversation_history.current_text()
+                if answer.strip():
+                    self.main_window.response_cache.store(*self.cache_candidate, answer)
+                self.cache_candidate = None
+            self.stop_progress()
+            self.update_status_signal.emit("Response received", 100)
+            self.main_window.diagnostics.round_finished(1)
+            self.idle_timer.start()
+        self.release_display(worker)
+
+    def trace_turn(self, worker, participant=None, appended=None):
+        # Each phase is named after the event that ends it and nests inside the turn span
+        tracer = self.main_window.tracer
+        track = f"{self.name}: participant {participant + 1}" if participant is not None else f"{self.name}: turns"
+        call = worker.call
+        started = worker.prompt_started or worker.queued_time or call.start_time
+        finished = appended[1] if appended else time.time()
+        prompt_tokens, completion_tokens, estimated = call.usage()
+        tracer.complete(worker.model.split(": ", 1)[1], "turn", started, finished, track, model=worker.model,
+                        round=self.collab_round, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        phases = [
+            ("prompt build", worker.prompt_started, worker.queued_time),
+            ("request dispatch", worker.queued_time, call.dispatch_time),
+            ("first byte", call.dispatch_time, call.first_byte_time),
+            ("first token", call.first_byte_time, call.first_token_time),
+            ("last token", call.first_token_time, call.last_token_time),
+            ("history append",) + (appended or (None, None))
+        ]
+        for name, start, end in phases:
+            if start is not None and end is not None:
+                tracer.complete(name, "turn", start, end, track)
+
+    def trace_round(self):
+        if self.round_started is not None and self.main_window.tracer.enabled:
+            self.main_window.tracer.complete(f"Round {self.collab_round}", "round", self.round_started, time.time(), f"{self.name}: rounds")
+        self.round_started = None
+
+    def format_conversation_history(self):
+        history = self.conversation_history
+        latest = self.collab_settings.get("context_messages", 0)
+        opening = history.opening_length()
+        if not latest or len(history) - opening <= latest:
+            return history.view().format()
+        # Older turns drop out half a window at a time, so the prompt prefix (and the provider's cache of it)
+        # holds between steps
+        step = max(1, latest // 2)
+        start = opening + -(-(len(history) - opening - latest) // step) * step
+        return history.view(0, opening).format() + history.view(start).format()
+
+    def start_collaboration(self):
+        participants = self.main_window.control_panel.participants()
+        if len(participants) >= 2:
+            self.collaboration_models = [model for model, role in participants]
+            self.collaboration_roles = [role for model, role in participants]
+            self.conversation_history.clear()
+            self.budget.reset()
+            self.refresh_spend()
+            # Assign colors to models
+            self.model_colors = {
+                model.split(": ", 1)[1]: QColor(self.PARTICIPANT_COLORS[index % len(self.PARTICIPANT_COLORS)])
+                for index, model in enumerate(self.collaboration_models)
+            }
+            self.chat_box.model_colors = self.model_colors
+
+            system_prompt = self.COLLAB_SYSTEM_PROMPT
+
+            self.update_chat_signal.emit(f"Starting collaboration between models with prompt: {system_prompt}", False, False)
+            self.update_status_signal.emit("Collaboration started", 0)
+            self.conversation_history.append("system", system_prompt)
+        else:
+            self.main_window.show_error_message("Please add at least two participants to the collaboration.")
+
+    def stop_chat(self):
+        self.stop_event.set()
+        self.collaborating = False
+        self.cache_candidate = None
+        self.prewarms = {}
+        if self.batch_worker is not None:
+            self.batch_worker.stop_event.set()  # Cancels the remote batch at the next poll
+        self.display_owner = None
+        self.held_events = {}
+        for worker in self.active_workers | {self.worker_thread}:
+            if worker and worker.isRunning():
+                worker.stop()
+                self.abandon_worker(worker)
+        self.active_workers.clear()
+        self.chat_box.finish_response()
+        self.stop_progress()
+        self.update_status_signal.emit("Chat stopped", 0)
+        self.update_chat_signal.emit("Chat stopped by user.", False, False)
+        self.idle_timer.start()
+
+    def clear_chat(self):
+        self.chat_box.clear_chat()
+        self.conversation_history.clear()
+        self.budget.reset()
+        self.refresh_spend()
+        self.update_status_signal.emit("Chat cleared", 0)
+        self.idle_timer.start()
+
+    def shutdown(self):
+        # Stopped workers exit promptly, so they can be joined before the session goes away
+        self.stop_chat()
+        for worker in list(self.abandoned_workers):
+            worker.wait()
+        if self.batch_worker is not None:
+            self.batch_worker.wait()
+        self.prewarmer.shutdown()
+        self.chat_box.shutdown_renderer()
+
+class MainWindow(QMainWindow):
+    HTTP_POOL_SIZE = 32
+
+    update_status_signal = pyqtSignal(str, int)
+    provider_state_signal = pyqtSignal(str, bool)
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Enhanced LLM Collaboration App")
+        self.setGeometry(100, 100, 1200, 800)
+
+        self.api_keys = self.get_api_keys()
+        self.init_clients()
+
+        self.API_URLS = {
+            "groq_models": "https://api.groq.com/openai/v1/models",
+            "groq_llm": "https://api.groq.com/openai/v1/chat/completions",
+            "openai_models": "https://api.openai.com/v1/models",
+            "openai_llm": "https://api.openai.com/v1/chat/completions",
+            "anthropic_models": "https://api.anthropic.com/v1/models",
+            "anthropic_llm": "https://api.anthropic.com/v1/messages"
         }
 
         self.HEADERS = {
@@ -1158,9 +4906,18 @@ class MainWindow(QMainWindow):
                 "x-api-key": f"{self.api_keys.get('anthropic', '')}",
                 "content-type": "application/json",
                 "anthropic-version": "2023-06-01"
+            },
+            "openai": {
+                "Authorization": f"Bearer {self.api_keys.get('openai', '')}"
             }
         }
 
+        self.circuit_breakers = {
+            provider: CircuitBreaker(provider, lambda p=provider: self.probe_provider(p), self.provider_state_signal.emit)
+            for provider in ["OpenAI", "Anthropic", "Groq", "Ollama", "Custom"]
+        }
+        self.provider_state_signal.connect(self.handle_provider_state)
+
         self.current_theme = Theme.DARK
 
         central_widget = QWidget()
@@ -1168,11 +4925,29 @@ class MainWindow(QMainWindow):
         main_layout.setContentsMargins(0, 0, 0, 0)
         main_layout.setSpacing(0)
 
-        self.chat_box = ChatBox(self)
+        self.diagnostics = Diagnostics(self)
+        self.diagnostics_dialog = None
+        self.tracer = self.diagnostics.tracer
+        self.metrics = Metrics(self)
+        self.metrics.collectors.append(self.collect_metrics)
+        self.metrics_exporter = None
+        self.api_server = None
+        self.recorder = None
+        self.replayer = None
+        self.model_catalog = ModelCatalog(self)
+        self.response_cache = ResponseCache()
+        self.session_tabs = QTabWidget()
+        self.session_tabs.setTabsClosable(True)
+        self.session_tabs.setMovable(True)
+        self.session_tabs.tabCloseRequested.connect(self.close_session)
+        new_session_button = QPushButton("+")
+        new_session_button.setToolTip("New session")
+        new_session_button.clicked.connect(lambda: self.new_session())
+        self.session_tabs.setCornerWidget(new_session_button)
         self.control_panel = ControlPanel(self)
 
         splitter = QSplitter(Qt.Horizontal)
-        splitter.addWidget(self.chat_box)
+        splitter.addWidget(self.session_tabs)
         splitter.addWidget(self.control_panel)
         splitter.setStretchFactor(0, 7)
         splitter.setStretchFactor(1, 3)
@@ -1181,20 +4956,8 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(central_widget)
 
         self.current_mode = "single"
-        self.stop_event = threading.Event()
-        self.collaboration_models = []
-        self.conversation_history = []
-        self.current_response = ""
-        self.model_colors = {}
-        self.response_times = defaultdict(list)
-
-        self.collab_settings = {
-            "rounds": 0,  # 0 indicates infinite rounds
-            "max_tokens": 1000,
-            "temperature": 0.7,
-            "model1_role": "General Assistant",
-            "model2_role": "Technical Expert"
-        }
+        self.sessions = []
+        self.session_count = 0
 
         self.role_prompts = {
             "General Assistant": "You are a helpful assistant. 😊",
@@ -1226,20 +4989,15 @@ class MainWindow(QMainWindow):
 
         self.statusBar().showMessage("Ready")
 
-        self.update_chat_signal.connect(self.chat_box.display_message)
         self.update_status_signal.connect(self.control_panel.update_status)
-
-        self.worker_thread = None
-        self.collab_round = 1  # Initialize collaboration round
-        self.current_collab_model_index = 0  # For managing model sequence
+        self.session_tabs.currentChanged.connect(self.switch_session)
+        self.new_session()
 
         self.selected_provider = None
-        self.selected_provider1 = None
-        self.selected_provider2 = None
+        self.selected_collab_provider = None
 
         self.selected_model = None
-        self.selected_model1 = None
-        self.selected_model2 = None
+        self.selected_collab_model = None
 
     def get_api_keys(self):
         dialog = APIKeyDialog(self)
@@ -1250,36 +5008,36 @@ class MainWindow(QMainWindow):
 
     def init_clients(self):
         if self.api_keys.get('anthropic'):
-            self.anthropic_client = anthropic.Anthropic(api_key=self.api_keys['anthropic'])
+            self.anthropic_client = anthropic.Anthropic(api_key=self.api_keys['anthropic'], timeout=Timeouts.READ)
         else:
             self.anthropic_client = None
 
         if self.api_keys.get('openai'):
-            self.openai_client = openai.OpenAI(api_key=self.api_keys['openai'])
+            self.openai_client = openai.OpenAI(api_key=self.api_keys['openai'], timeout=Timeouts.READ)
         else:
             self.openai_client = None
 
+        if not hasattr(self, 'http'):
+            # One connection pool and rate limiter shared by every session
+            self.http = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=self.HTTP_POOL_SIZE)
+            self.http.mount("http://", adapter)
+            self.http.mount("https://", adapter)
+            self.rate_limiter = RateLimiter()
+
+        ollama_hosts = OllamaPool.parse_hosts(self.api_keys.get('ollama_ip', ''))
+        ollama_max_concurrency = int(self.api_keys.get('ollama_max_concurrency', OllamaPool.DEFAULT_MAX_CONCURRENCY))
+        if hasattr(self, 'ollama_pool'):
+            self.ollama_pool.set_hosts(ollama_hosts, ollama_max_concurrency)
+        else:
+            self.ollama_pool = OllamaPool(ollama_hosts, ollama_max_concurrency)
+
+        self.custom_endpoint = CompatibleEndpoint(self.api_keys.get('custom_url', ''), self.api_keys.get('custom_key', ''))
+
     def create_toolbar(self):
         toolbar = QToolBar()
         toolbar.setMovable(False)
         toolbar.setIconSize(QSize(24, 24))
-        toolbar.setStyleSheet("""
-            QToolBar {
-                background-color: #1e1e2e;
-                border: none;
-                spacing: 10px;
-            }
-            QToolButton {
-                background-color: #45475a;
-                color: #cdd6f4;
-                border: none;
-                padding: 5px;
-                border-radius: 5px;
-            }
-            QToolButton:hover {
-                background-color: #585b70;
-            }
-        """)
 
         start_action = QAction("Start", self)
         start_action.triggered.connect(self.start_collaboration)
@@ -1297,102 +5055,136 @@ class MainWindow(QMainWindow):
         settings_action.triggered.connect(self.show_settings_dialog)
         toolbar.addAction(settings_action)
 
+        self.diagnostics_action = QAction("Diagnostics", self)
+        self.diagnostics_action.setCheckable(True)
+        self.diagnostics_action.toggled.connect(self.toggle_diagnostics)
+        toolbar.addAction(self.diagnostics_action)
+
+        self.api_server_action = QAction("API Server", self)
+        self.api_server_action.setCheckable(True)
+        self.api_server_action.setToolTip(f"Serve an OpenAI-compatible API on http://{ApiServer.HOST}:{ApiServer.PORT}/v1")
+        self.api_server_action.toggled.connect(self.toggle_api_server)
+        toolbar.addAction(self.api_server_action)
+
+        self.metrics_action = QAction("Metrics", self)
+        self.metrics_action.setCheckable(True)
+        self.metrics_action.setToolTip(f"Export Prometheus metrics on http://{MetricsExporter.HOST}:{MetricsExporter.PORT}/metrics")
+        self.metrics_action.toggled.connect(self.toggle_metrics)
+        toolbar.addAction(self.metrics_action)
+
+        batch_action = QAction("Batch", self)
+        batch_action.setToolTip("Run many prompts through the OpenAI or Anthropic Batch API at half price")
+        batch_action.triggered.connect(self.show_batch_dialog)
+        toolbar.addAction(batch_action)
+
+        self.record_action = QAction("Record", self)
+        self.record_action.setCheckable(True)
+        self.record_action.setToolTip("Record every request and streamed chunk with its timing")
+        self.record_action.toggled.connect(self.toggle_recording)
+        toolbar.addAction(self.record_action)
+
+        self.replay_action = QAction("Replay", self)
+        self.replay_action.setCheckable(True)
+        self.replay_action.setToolTip("Answer requests from a recording instead of the providers")
+        self.replay_action.toggled.connect(self.toggle_replay)
+        toolbar.addAction(self.replay_action)
+
         self.addToolBar(toolbar)
 
     def apply_theme(self, theme):
-        self.setStyleSheet(f"""
-            QMainWindow, QWidget {{
-                background-color: {theme['bg']};
-                color: {theme['text']};
-            }}
-            QPushButton {{
-                background-color: {theme['button']};
-                color: {theme['text']};
-                border: none;
-                padding: 5px 10px;
-                border-radius: 5px;
-            }}
-            QPushButton:hover {{
-                background-color: {theme['button_hover']};
-            }}
-            QLineEdit, QTextEdit, QComboBox {{
-                background-color: {theme['input']};
-                color: {theme['text']};
-                border: 1px solid {theme['border']};
-                padding: 5px;
-                border-radius: 5px;
-            }}
-            QScrollBar:vertical {{
-                background: {theme['scroll_bg']};
-                width: 12px;
-                margin: 0px;
-            }}
-            QScrollBar::handle:vertical {{
-                background: {theme['scroll_handle']};
-                min-height: 20px;
-                border-radius: 6px;
-            }}
-            QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {{
-                height: 0px;
-            }}
-        """)
+        # One application-wide sheet; a switch repolishes every widget, so it costs more than a per-widget sheet did
+        self.current_theme = theme
+        app = QApplication.instance()
+        sheet = Theme.stylesheet(theme)
+        if app.styleSheet() != sheet:
+            app.setStyleSheet(sheet)
 
     def fetch_all_models(self):
         self.control_panel.start_progress_animation()
         self.update_status_signal.emit("Fetching models...", 0)
 
         try:
-            if self.api_keys.get('groq'):
-                groq_models = self.fetch_groq_models()
-                self.models['Groq'] = groq_models
-            else:
-                self.control_panel.groq_button.setEnabled(False)
-                self.control_panel.model1_groq_button.setEnabled(False)
-                self.control_panel.model2_groq_button.setEnabled(False)
-
-            if self.api_keys.get('ollama_ip'):
-                ollama_models = self.fetch_ollama_models()
-                self.models['Ollama'] = ollama_models
-            else:
-                self.control_panel.ollama_button.setEnabled(False)
-                self.control_panel.model1_ollama_button.setEnabled(False)
-                self.control_panel.model2_ollama_button.setEnabled(False)
-
-            if self.api_keys.get('anthropic'):
-                anthropic_models = self.fetch_anthropic_models()
-                self.models['Anthropic'] = anthropic_models
-            else:
-                self.control_panel.anthropic_button.setEnabled(False)
-                self.control_panel.model1_anthropic_button.setEnabled(False)
-                self.control_panel.model2_anthropic_button.setEnabled(False)
-
-            if self.api_keys.get('openai'):
-                openai_models = self.fetch_openai_models()
-                self.models['OpenAI'] = openai_models
-            else:
-                self.control_panel.openai_button.setEnabled(False)
-                self.control_panel.model1_openai_button.setEnabled(False)
-                self.control_panel.model2_openai_button.setEnabled(False)
-
-        except Exception as e:
-            self.show_error_message(f"Error fetching models: {str(e)}")
+            for provider in ["Groq", "Ollama", "Anthropic", "OpenAI", "Custom"]:
+                if self.provider_configured(provider):
+                    self.fetch_provider_models(provider)
+                else:
+                    self.control_panel.set_provider_enabled(provider, False)
         finally:
             self.control_panel.stop_progress_animation()
             self.update_status_signal.emit("Models fetched", 100)
             QTimer.singleShot(2000, lambda: self.update_status_signal.emit("Idle", 0))
 
+    def provider_configured(self, provider):
+        if provider == "Ollama":
+            return bool(self.ollama_pool.hosts)
+        if provider == "Custom":
+            return bool(self.custom_endpoint.base_url)
+        return bool(self.api_keys.get(provider.lower()))
+
+    def fetch_provider_models(self, provider):
+        fetchers = {
+            "Groq": self.fetch_groq_models,
+            "Ollama": self.fetch_ollama_models,
+            "Anthropic": self.fetch_anthropic_models,
+            "OpenAI": self.fetch_openai_models,
+            "Custom": self.fetch_custom_models
+        }
+        try:
+            self.models[provider] = fetchers[provider]()
+            self.model_catalog.set_models(provider, self.models[provider])
+        except Exception as e:
+            self.statusBar().showMessage(f"Error fetching {provider} models: {str(e)}", 5000)
+            if ProviderCall.is_provider_failure(e):
+                # Fail fast: grey the provider out and let the breaker probe it in the background
+                self.circuit_breakers[provider].trip(e)
+            else:
+                # A rejected key or request won't recover on its own; probing would only re-trip it
+                self.control_panel.set_provider_enabled(provider, False, f"Error fetching {provider} models: {e}")
+            return
+        tooltip = {"Ollama": self.ollama_pool.describe(), "Custom": self.custom_endpoint.base_url}.get(provider, "")
+        self.control_panel.set_provider_enabled(provider, True, tooltip)
+
+    def probe_provider(self, provider):
+        if provider == "Ollama":
+            self.ollama_pool.refresh()
+            if not self.ollama_pool.healthy_count():
+                raise requests.ConnectionError("No Ollama host reachable")
+            return
+        url, headers = {
+            "Groq": (self.API_URLS['groq_models'], self.HEADERS['groq']),
+            "Anthropic": (self.API_URLS['anthropic_models'], self.HEADERS['anthropic']),
+            "OpenAI": (self.API_URLS['openai_models'], self.HEADERS['openai']),
+            "Custom": (f"{self.custom_endpoint.base_url}/models", self.custom_endpoint.headers())
+        }[provider]
+        response = requests.get(url, headers=headers, timeout=Timeouts.REQUEST)
+        if response.status_code >= 500:
+            response.raise_for_status()
+
+    @pyqtSlot(str, bool)
+    def handle_provider_state(self, provider, available):
+        if available:
+            self.fetch_provider_models(provider)
+            self.statusBar().showMessage(f"{provider} is reachable again", 3000)
+        else:
+            breaker = self.circuit_breakers[provider]
+            self.control_panel.set_provider_enabled(provider, False, f"{provider} unavailable, retrying in the background: {breaker.last_error}")
+            self.statusBar().showMessage(f"{provider} unavailable, retrying in the background", 5000)
+
     def fetch_groq_models(self):
         headers = self.HEADERS['groq']
-        response = requests.get(self.API_URLS['groq_models'], headers=headers)
+        response = requests.get(self.API_URLS['groq_models'], headers=headers, timeout=Timeouts.REQUEST)
         response.raise_for_status()
         models_data = response.json()
         return [f"{model.get('id', 'Unknown')}" for model in models_data.get("data", [])]
 
+    def fetch_custom_models(self):
+        return self.custom_endpoint.models(self.http)
+
     def fetch_ollama_models(self):
-        response = requests.get(self.API_URLS['ollama_models'])
-        response.raise_for_status()
-        data = response.json()
-        return [f"{model['name']}" for model in data.get('models', [])]
+        models = self.ollama_pool.refresh()
+        if not self.ollama_pool.healthy_count():
+            raise requests.ConnectionError(f"No Ollama host reachable:\n{self.ollama_pool.describe()}")
+        return models
 
     def fetch_anthropic_models(self):
         return [
@@ -1406,184 +5198,206 @@ class MainWindow(QMainWindow):
 
     def fetch_openai_models(self):
         if self.openai_client:
-            try:
-                models = self.openai_client.models.list()
-                return [f"{model.id}" for model in models.data if "gpt" in model.id.lower()]
-            except Exception as e:
-                self.show_error_message(f"Error fetching OpenAI models: {str(e)}")
-                return []
+            models = self.openai_client.models.list()
+            return [f"{model.id}" for model in models.data if "gpt" in model.id.lower()]
         else:
             return []
 
     @pyqtSlot()
     def handle_message(self, message):
-        self.chat_box.display_message(message, is_user=True)
-        self.control_panel.start_progress_animation()
-        self.update_status_signal.emit("Processing", 0)
-        self.stop_event.clear()
-
-        if self.current_mode == "collaboration" and self.collaboration_models:
-            self.conversation_history.append({"role": "user", "content": message})
-            self.collaborative_interaction(message)
-        else:
-            selected_model = self.selected_model
-            if selected_model:
-                selected_role = self.control_panel.role_dropdown.currentText()
-                chain_of_thought = self.control_panel.chain_of_thought_checkbox.isChecked()
-                self.single_model_response(selected_model, selected_role, message, chain_of_thought)
-            else:
-                self.show_error_message("Please select a provider and model.")
-
-    def single_model_response(self, model, role, user_message, chain_of_thought):
-        role_prompt = self.role_prompts.get(role, "You are a general assistant. 😊")
-
-        full_prompt = f"{role_prompt}\n{user_message}"
-
-        if chain_of_thought:
-            full_prompt += "\n\nPlease use the following structure for your response:\n"
-            full_prompt += "<thinking>\n- Break down the problem\n- Outline your approach\n- Consider alternatives\n</thinking>\n\n"
-            full_prompt += "<reflection>\n- Review your reasoning\n- Identify potential issues\n- Suggest improvements\n</reflection>\n\n"
-            full_prompt += "<output>\nYour final response here.\n</output>"
-
-        self.current_response = ""  # Reset current_response
-        display_model_name = model  # Since model names are now without provider prefixes
-        self.model_colors = {display_model_name: QColor("#cba6f7")}  # Assign default color
-        self.chat_box.model_colors = self.model_colors
-
-        full_model_name = f"{self.selected_provider}: {model}"
-
-        self.worker_thread = WorkerThread(
-            self, full_model_name, full_prompt,
-            self.collab_settings["max_tokens"],
-            self.collab_settings["temperature"]
-        )
-        self.worker_thread.response_received.connect(lambda text, append: self.handle_model_response(text, append, display_model_name))
-        self.worker_thread.response_finished.connect(self.handle_response_finished)
-        self.worker_thread.start()
-
-    def collaborative_interaction(self, user_message):
-        self.current_collab_model_index = 0
-        self.collab_round = 1
-        self.process_next_collab_model()
-
-    def process_next_collab_model(self):
-        if self.current_collab_model_index < len(self.collaboration_models):
-            model = self.collaboration_models[self.current_collab_model_index]
-            role_dropdown = self.control_panel.model1_role_dropdown if self.current_collab_model_index == 0 else self.control_panel.model2_role_dropdown
-            role = role_dropdown.currentText()
-            role_prompt = self.role_prompts.get(role, "")
-            prompt = f"{role_prompt}\n{self.format_conversation_history()}"
-            self.current_response = ""  # Reset current_response
-
-            display_model_name = model.split(": ")[1]
-            self.worker_thread = WorkerThread(
-                self, model, prompt,
-                self.collab_settings["max_tokens"],
-                self.collab_settings["temperature"]
-            )
-            self.worker_thread.response_received.connect(lambda text, append: self.handle_model_response(text, append, display_model_name))
-            self.worker_thread.response_finished.connect(lambda time: self.handle_response_finished(time, display_model_name))
-            self.worker_thread.start()
-        else:
-            # Collaboration round finished
-            self.control_panel.stop_progress_animation()
-            self.update_status_signal.emit("Collaboration round finished", 100)
-            QTimer.singleShot(2000, lambda: self.update_status_signal.emit("Idle", 0))
-            # Reset for next round if applicable
-            if self.collab_settings["rounds"] == 0 or self.collab_round < self.collab_settings["rounds"]:
-                self.collab_round += 1
-                self.current_collab_model_index = 0
-                self.process_next_collab_model()
-
-    def handle_model_response(self, text, append, model=""):
-        if not append:
-            self.current_response = ""
-            self.current_response += text
-            # Start new message with model name
-            self.update_chat_signal.emit(f"{model}: {text}", False, False)
-        else:
-            self.current_response += text
-            # Append text without model name
-            self.update_chat_signal.emit(text, False, True)
-
-    def handle_response_finished(self, response_time, model=""):
-        if model:
-            # Record the response time
-            self.response_times[model].append(response_time)
-            self.control_panel.visualization.update_chart(self.response_times)
-
-            self.conversation_history.append({"role": "assistant", "content": f"{model}: {self.current_response}"})
-            self.current_response = ""
-            # Proceed to next model
-            self.current_collab_model_index += 1
-            self.process_next_collab_model()
-        else:
-            # Single model response finished
-            self.control_panel.stop_progress_animation()
-            self.update_status_signal.emit("Response received", 100)
-            QTimer.singleShot(2000, lambda: self.update_status_signal.emit("Idle", 0))
-
-    def format_conversation_history(self):
-        formatted_history = ""
-        for message in self.conversation_history:
-            if message['role'] == 'system':
-                formatted_history += f"System: {message['content']}\n\n"
-            elif message['role'] == 'user':
-                formatted_history += f"Human: {message['content']}\n\n"
-            elif message['role'] == 'assistant':
-                formatted_history += f"AI: {message['content']}\n\n"
-        return formatted_history
+        self.session.handle_message(message)
 
     @pyqtSlot()
     def start_collaboration(self):
-        model1_provider = self.selected_provider1
-        model2_provider = self.selected_provider2
-        model1_name = self.selected_model1
-        model2_name = self.selected_model2
-        if model1_provider and model1_name and model2_provider and model2_name:
-            model1_full = f"{model1_provider}: {model1_name}"
-            model2_full = f"{model2_provider}: {model2_name}"
-            self.collaboration_models = [model1_full, model2_full]
-            self.conversation_history = []
-            # Assign colors to models
-            self.model_colors = {
-                model1_name: QColor("#cba6f7"),  # Purple
-                model2_name: QColor("#89b4fa"),  # Blue
-            }
-            self.chat_box.model_colors = self.model_colors
-
-            system_prompt = "You are participating in a collaborative discussion. Please engage with the other model and the user in a constructive manner."
-
-            self.update_chat_signal.emit(f"Starting collaboration between models with prompt: {system_prompt}", False, False)
-            self.update_status_signal.emit("Collaboration started", 0)
-            self.conversation_history.append({"role": "system", "content": system_prompt})
-        else:
-            self.show_error_message("Please select providers and models for both Model 1 and Model 2.")
+        self.session.start_collaboration()
 
     @pyqtSlot()
     def stop_chat(self):
-        self.stop_event.set()
-        if self.worker_thread and self.worker_thread.isRunning():
-            self.worker_thread.terminate()
-            self.worker_thread.wait()
-        self.control_panel.stop_progress_animation()
-        self.update_status_signal.emit("Chat stopped", 0)
-        self.update_chat_signal.emit("Chat stopped by user.", False, False)
-        QTimer.singleShot(2000, lambda: self.update_status_signal.emit("Idle", 0))
+        self.session.stop_chat()
 
     @pyqtSlot()
     def clear_chat(self):
-        self.chat_box.clear_chat()
-        self.conversation_history = []
-        self.update_status_signal.emit("Chat cleared", 0)
-        QTimer.singleShot(2000, lambda: self.update_status_signal.emit("Idle", 0))
+        self.session.clear_chat()
+
+    def show_other_samples(self):
+        self.session.show_other_samples()
+
+    def bypass_cache(self):
+        self.session.bypass_cache()
+
+    @property
+    def session(self):
+        return self.session_tabs.currentWidget().session
+
+    def new_session(self, settings=None):
+        self.session_count += 1
+        session = ChatSession(self, f"Session {self.session_count}", settings or (self.session.collab_settings if self.sessions else None))
+        self.sessions.append(session)
+        index = self.session_tabs.addTab(session.chat_box, session.name)
+        self.session_tabs.setCurrentIndex(index)
+        return session
+
+    def close_session(self, index):
+        if self.session_tabs.count() == 1:
+            return
+        session = self.session_tabs.widget(index).session
+        session.shutdown()
+        self.sessions.remove(session)
+        self.session_tabs.removeTab(index)
+        session.chat_box.deleteLater()
+        session.deleteLater()
+
+    def switch_session(self, index):
+        if index < 0:
+            return
+        current = self.session_tabs.widget(index).session
+        # Background sessions keep running but queue their transcript until shown
+        for session in self.sessions:
+            session.chat_box.set_live(session is current)
+        current.refresh_chart()
+        current.refresh_spend()
+        current.refresh_samples_button()
+        current.refresh_cache_button()
+        self.control_panel.update_status(current.status[0], current.status[1])
+
+    def toggle_diagnostics(self, enabled):
+        self.diagnostics.set_enabled(enabled)
+        if enabled:
+            if self.diagnostics_dialog is None:
+                self.diagnostics_dialog = DiagnosticsDialog(self.diagnostics, self)
+                self.diagnostics_dialog.finished.connect(lambda result: self.diagnostics_action.setChecked(False))
+            self.diagnostics_dialog.show()
+        elif self.diagnostics_dialog is not None:
+            self.diagnostics_dialog.hide()
+
+    def toggle_api_server(self, enabled):
+        if enabled:
+            # Requests for the "collaboration" model use the participants and settings at start
+            self.api_server = ApiServer(self, self.control_panel.participants(), copy.deepcopy(self.session.collab_settings))
+            try:
+                self.api_server.start()
+            except OSError as e:
+                self.api_server = None
+                self.api_server_action.setChecked(False)
+                self.show_error_message(f"Could not start the API server: {str(e)}")
+                return
+            self.statusBar().showMessage(f"API server listening on {self.api_server.url()}")
+        elif self.api_server is not None:
+            self.api_server.stop()
+            self.api_server = None
+            self.statusBar().showMessage("API server stopped", 3000)
+
+    def toggle_metrics(self, enabled):
+        if enabled:
+            self.metrics_exporter = MetricsExporter(self.metrics)
+            try:
+                self.metrics_exporter.start()
+            except OSError as e:
+                self.metrics_exporter = None
+                self.metrics_action.setChecked(False)
+                self.show_error_message(f"Could not start the metrics exporter: {str(e)}")
+                return
+            self.statusBar().showMessage(f"Metrics exported on {self.metrics_exporter.url()}")
+        elif self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+            self.metrics_exporter = None
+            self.statusBar().showMessage("Metrics exporter stopped", 3000)
+
+    def toggle_recording(self, enabled):
+        if enabled:
+            default = time.strftime("recording-%Y%m%d-%H%M%S.jsonl.gz")
+            path, _ = QFileDialog.getSaveFileName(self, "Record Streams", default, "Stream recordings (*.jsonl.gz)")
+            if not path:
+                self.record_action.setChecked(False)
+                return
+            self.start_recording(path)
+        elif self.recorder is not None:
+            recorder, self.recorder = self.recorder, None
+            recorder.close()
+            self.statusBar().showMessage(f"Recorded {recorder.count} requests to {recorder.path}", 5000)
+
+    def start_recording(self, path):
+        self.recorder = StreamRecorder(path)
+        self.statusBar().showMessage(f"Recording streams to {path}")
+
+    def toggle_replay(self, enabled):
+        if enabled:
+            path, _ = QFileDialog.getOpenFileName(self, "Replay Streams", "", "Stream recordings (*.jsonl.gz)")
+            speed = None
+            if path:
+                speed, accepted = QInputDialog.getItem(self, "Replay Speed", "Speed:", list(StreamReplayer.SPEEDS), 0, False)
+                speed = StreamReplayer.SPEEDS[speed] if accepted else None
+            if speed is None:
+                self.replay_action.setChecked(False)
+                return
+            try:
+                self.start_replay(path, speed)
+            except (OSError, ValueError) as e:
+                self.replay_action.setChecked(False)
+                self.show_error_message(f"Could not load the recording: {str(e)}")
+        elif self.replayer is not None:
+            self.replayer = None
+            self.fetch_all_models()
+            self.statusBar().showMessage("Replay stopped", 3000)
+
+    def start_replay(self, path, speed=1.0):
+        # Recorded models become selectable even without API keys or a reachable host
+        self.replayer = StreamReplayer(path, speed)
+        for provider, names in self.replayer.models().items():
+            self.models[provider] = sorted(set(self.models.get(provider, [])) | set(names))
+            self.model_catalog.set_models(provider, self.models[provider])
+            self.control_panel.set_provider_enabled(provider, True, f"Replaying {path}")
+        self.statusBar().showMessage(f"Replaying {len(self.replayer.entries)} recorded requests from {path}")
+
+    def collect_metrics(self):
+        # Runs on the scrape thread; only reads counters the owners already maintain
+        api = self.api_server
+        pool = self.ollama_pool
+        cache = self.response_cache
+        return [
+            ("llm_queue_depth", "gauge", "Requests waiting for capacity", [
+                ({"queue": "api"}, api.queued if api else 0),
+                ({"queue": "ollama"}, pool.waiting)
+            ]),
+            ("llm_in_flight", "gauge", "Requests currently running", [
+                ({"source": "api"}, api.running if api else 0),
+                ({"source": "sessions"}, sum(len(session.active_workers) for session in list(self.sessions))),
+                ({"source": "ollama"}, sum(host.in_flight for host in list(pool.hosts)))
+            ]),
+            ("llm_cache_hits_total", "counter", "Requests served from a warm cache", [
+                ({"cache": "ollama_resident"}, pool.resident_hits),
+                ({"cache": "response_exact"}, cache.hits["exact"]),
+                ({"cache": "response_semantic"}, cache.hits["semantic"])
+            ]),
+            ("llm_cache_misses_total", "counter", "Requests that missed a warm cache", [
+                ({"cache": "ollama_resident"}, pool.resident_misses),
+                ({"cache": "response"}, cache.misses)
+            ]),
+            ("llm_sessions", "gauge", "Open chat sessions", [({}, len(self.sessions))])
+        ]
 
     def show_collaboration_settings(self):
-        dialog = CollaborationSettingsDialog(self)
+        models = [f"{provider}: {model}" for provider, names in self.models.items() for model in names]
+        session = self.session
+        dialog = CollaborationSettingsDialog(self, session.collab_settings, models)
         if dialog.exec_() == QDialog.Accepted:
-            self.collab_settings = dialog.get_settings()
+            session.collab_settings = dialog.get_settings()
+            session.budget.configure(session.collab_settings)
             self.statusBar().showMessage("Collaboration settings updated", 3000)
 
+    def show_batch_dialog(self):
+        models = [f"{provider}: {model}" for provider in BatchWorker.CLIENTS for model in self.models.get(provider, [])]
+        dialog = BatchDialog(models, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        model, prompts, base_url, poll_interval = dialog.get_batch()
+        if model.split(": ", 1)[0] not in BatchWorker.CLIENTS or ": " not in model:
+            self.show_error_message("Batch runs need an \"OpenAI: model\" or \"Anthropic: model\" name.")
+        elif not prompts:
+            self.show_error_message("Please enter at least one prompt.")
+        else:
+            self.session.run_batch(model, prompts, base_url, poll_interval)
+
     def show_settings_dialog(self):
         dialog = SettingsDialog(self, api_keys=self.api_keys)
         if dialog.exec_() == QDialog.Accepted:
@@ -1592,30 +5406,23 @@ class MainWindow(QMainWindow):
             self.fetch_all_models()
             self.statusBar().showMessage("Settings updated", 3000)
 
+    def closeEvent(self, event):
+        if self.api_server is not None:
+            self.api_server.stop()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        # Destroying a running QThread aborts the process, so every session's threads are stopped and joined
+        for session in self.sessions:
+            session.shutdown()
+        super().closeEvent(event)
+
     def show_error_message(self, message):
         msg_box = QMessageBox()
         msg_box.setIcon(QMessageBox.Critical)
         msg_box.setWindowTitle("Error")
         msg_box.setText(message)
-        msg_box.setStyleSheet("""
-            QMessageBox {
-                background-color: #1e1e2e;
-                color: #cdd6f4;
-            }
-            QMessageBox QLabel {
-                color: #cdd6f4;
-            }
-            QPushButton {
-                background-color: #45475a;
-                color: #cdd6f4;
-                border: none;
-                padding: 5px 15px;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #585b70;
-            }
-        """)
         msg_box.exec_()
 
 if __name__ == "__main__":
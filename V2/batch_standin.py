@@ -0,0 +1,165 @@
+import argparse
+import email.parser
+import email.policy
+import itertools
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# In-memory OpenAI files/batches and Anthropic message batches, for running the Batch mode without an account
+STATE = {"files": {}, "batches": {}, "lock": threading.Lock(), "ids": itertools.count(1)}
+
+def answer(model, prompt):
+    text = f"Batch answer from {model} to \"{prompt[:60]}\""
+    return text, max(1, len(prompt) // 4), max(1, len(text) // 4)
+
+class BatchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 5.0
+
+    def log_message(self, *args):
+        pass
+
+    def next_id(self, prefix):
+        with STATE["lock"]:
+            return f"{prefix}_{next(STATE['ids'])}"
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send_body(self, data, content_type="application/json", status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, payload, status=200):
+        self.send_body(json.dumps(payload).encode("utf-8"), status=status)
+
+    def not_found(self):
+        self.send_json({"error": {"message": f"No route for {self.command} {self.path}"}}, 404)
+
+    def finished(self, batch):
+        return batch["cancelled"] or time.time() - batch["created"] >= self.delay
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        if parts == ["v1", "files"]:
+            self.upload_file()
+        elif parts == ["v1", "batches"]:
+            self.create_openai_batch()
+        elif parts == ["v1", "messages", "batches"]:
+            self.create_anthropic_batch()
+        elif len(parts) >= 4 and parts[-1] == "cancel" and parts[-2] in STATE["batches"]:
+            STATE["batches"][parts[-2]]["cancelled"] = True
+            self.send_json({"id": parts[-2], "status": "cancelling", "processing_status": "canceling"})
+        else:
+            self.not_found()
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 3 and parts[:2] == ["v1", "batches"] and parts[2] in STATE["batches"]:
+            self.send_json(self.openai_batch(STATE["batches"][parts[2]]))
+        elif len(parts) == 4 and parts[:2] == ["v1", "files"] and parts[3] == "content" and parts[2] in STATE["files"]:
+            self.send_body(STATE["files"][parts[2]], "application/jsonl")
+        elif len(parts) >= 4 and parts[:3] == ["v1", "messages", "batches"] and parts[3] in STATE["batches"]:
+            batch = STATE["batches"][parts[3]]
+            if parts[4:] == ["results"] and self.finished(batch):
+                self.send_body(self.anthropic_results(batch), "application/jsonl")
+            elif not parts[4:]:
+                self.send_json(self.anthropic_batch(batch))
+            else:
+                self.not_found()
+        else:
+            self.not_found()
+
+    def upload_file(self):
+        # The OpenAI upload is multipart/form-data with a "purpose" field and the JSONL "file"
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(header + self.read_body())
+        content = next(part.get_payload(decode=True) for part in message.iter_parts() if part.get_filename())
+        file_id = self.next_id("file")
+        STATE["files"][file_id] = content
+        self.send_json({"id": file_id, "object": "file", "bytes": len(content), "purpose": "batch"})
+
+    def create_openai_batch(self):
+        body = json.loads(self.read_body())
+        lines = STATE["files"][body["input_file_id"]].decode("utf-8").splitlines()
+        requests = [json.loads(line) for line in lines if line.strip()]
+        batch_id = self.next_id("batch")
+        STATE["batches"][batch_id] = {"id": batch_id, "created": time.time(), "cancelled": False, "output_file_id": None, "requests": [
+            (request["custom_id"], request["body"]["model"], request["body"]["messages"][-1]["content"]) for request in requests
+        ]}
+        self.send_json(self.openai_batch(STATE["batches"][batch_id]))
+
+    def openai_batch(self, batch):
+        total = len(batch["requests"])
+        if batch["cancelled"]:
+            return {"id": batch["id"], "status": "cancelled", "request_counts": {"total": total, "completed": 0, "failed": 0}}
+        if not self.finished(batch):
+            status = "validating" if time.time() - batch["created"] < self.delay / 4 else "in_progress"
+            return {"id": batch["id"], "status": status, "request_counts": {"total": total, "completed": 0, "failed": 0}}
+        if batch["output_file_id"] is None:
+            lines = []
+            for custom_id, model, prompt in batch["requests"]:
+                text, prompt_tokens, completion_tokens = answer(model, prompt)
+                lines.append(json.dumps({"custom_id": custom_id, "error": None, "response": {"status_code": 200, "body": {
+                    "model": model, "choices": [{"index": 0, "message": {"role": "assistant", "content": text}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+                }}}))
+            batch["output_file_id"] = self.next_id("file")
+            STATE["files"][batch["output_file_id"]] = "\n".join(lines).encode("utf-8")
+        return {"id": batch["id"], "status": "completed", "output_file_id": batch["output_file_id"],
+                "request_counts": {"total": total, "completed": total, "failed": 0}}
+
+    def create_anthropic_batch(self):
+        body = json.loads(self.read_body())
+        batch_id = self.next_id("msgbatch")
+        STATE["batches"][batch_id] = {"id": batch_id, "created": time.time(), "cancelled": False, "requests": [
+            (request["custom_id"], request["params"]["model"], request["params"]["messages"][-1]["content"])
+            for request in body["requests"]
+        ]}
+        self.send_json(self.anthropic_batch(STATE["batches"][batch_id]))
+
+    def anthropic_batch(self, batch):
+        total = len(batch["requests"])
+        ended = self.finished(batch)
+        counts = {"processing": 0 if ended else total, "succeeded": total if ended and not batch["cancelled"] else 0,
+                  "errored": 0, "canceled": total if batch["cancelled"] else 0, "expired": 0}
+        host = self.headers.get("Host", f"127.0.0.1:{self.server.server_address[1]}")
+        return {"id": batch["id"], "type": "message_batch", "processing_status": "ended" if ended else "in_progress",
+                "request_counts": counts, "results_url": f"http://{host}/v1/messages/batches/{batch['id']}/results" if ended else None}
+
+    def anthropic_results(self, batch):
+        lines = []
+        for custom_id, model, prompt in batch["requests"]:
+            if batch["cancelled"]:
+                lines.append(json.dumps({"custom_id": custom_id, "result": {"type": "canceled"}}))
+                continue
+            text, prompt_tokens, completion_tokens = answer(model, prompt)
+            lines.append(json.dumps({"custom_id": custom_id, "result": {"type": "succeeded", "message": {
+                "model": model, "role": "assistant", "content": [{"type": "text", "text": text}],
+                "usage": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens}
+            }}}))
+        return "\n".join(lines).encode("utf-8")
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI Batch and Anthropic Message Batches APIs; "
+                                                 "point the Batch dialog's base URL at http://127.0.0.1:PORT/v1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--delay", type=float, default=5.0, help="Seconds before a batch completes")
+    args = parser.parse_args()
+
+    handler = type("Handler", (BatchHandler,), {"delay": args.delay})
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+    server.daemon_threads = True
+    print(f"Batch stand-in on http://127.0.0.1:{args.port}/v1, batches complete after {args.delay:g}s")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import gc
+import random
+import tracemalloc
+
+from V2 import ConversationStore
+
+WORDS = [
+    "the", "model", "agrees", "with", "this", "approach", "because", "latency", "matters",
+    "we", "should", "consider", "caching", "tokens", "and", "streaming", "responses", "carefully"
+]
+
+def generate_turns(turns, tokens_per_turn, seed=0):
+    rng = random.Random(seed)
+    models = ["llama3:latest", "claude-3-5-sonnet-20240620", "gpt-4o", "mixtral-8x7b-32768"]
+    for index in range(turns):
+        yield models[index % len(models)], [f"{rng.choice(WORDS)} " for _ in range(tokens_per_turn)]
+
+def build_legacy(turns, tokens_per_turn):
+    history = []
+    for model, tokens in generate_turns(turns, tokens_per_turn):
+        current_response = ""
+        for token in tokens:
+            current_response += token
+        history.append({"role": "assistant", "content": f"{model}: {current_response}"})
+    return history
+
+def build_store(turns, tokens_per_turn):
+    store = ConversationStore()
+    for model, tokens in generate_turns(turns, tokens_per_turn):
+        store.begin_turn()
+        for token in tokens:
+            store.add_chunk(token)
+        store.finish_turn(model)
+    return store
+
+def measure(builder, turns, tokens_per_turn):
+    gc.collect()
+    tracemalloc.start()
+    result = builder(turns, tokens_per_turn)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory used per stored token by the conversation history")
+    parser.add_argument("--turns", type=int, default=100000)
+    parser.add_argument("--tokens-per-turn", type=int, default=50)
+    args = parser.parse_args()
+
+    total_tokens = args.turns * args.tokens_per_turn
+    print(f"{args.turns} turns, {args.tokens_per_turn} tokens per turn, {total_tokens} tokens")
+    print(f"{'Layout':<22}{'Retained MiB':>14}{'Peak MiB':>12}{'Bytes/token':>14}")
+    for name, builder in [("list of dicts", build_legacy), ("ConversationStore", build_store)]:
+        current, peak = measure(builder, args.turns, args.tokens_per_turn)
+        print(f"{name:<22}{current / 2 ** 20:>14.1f}{peak / 2 ** 20:>12.1f}{current / total_tokens:>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QEvent
+from PyQt5.QtWidgets import QApplication, QWidget, QToolBar, QCheckBox, QProgressBar
+
+from V2 import MainWindow, Theme, ModernButton, ModernComboBox, ProviderButton
+
+# The styling the application sheet replaced: a themed sheet on the main window plus a small fixed
+# sheet on each styled widget, set as the widget was built
+PREVIOUS_WINDOW_SHEET = """
+    QMainWindow, QWidget {{
+        background-color: {bg};
+        color: {text};
+    }}
+    QPushButton {{
+        background-color: {button};
+        color: {text};
+        border: none;
+        padding: 5px 10px;
+        border-radius: 5px;
+    }}
+    QPushButton:hover {{
+        background-color: {button_hover};
+    }}
+    QLineEdit, QTextEdit, QComboBox {{
+        background-color: {input};
+        color: {text};
+        border: 1px solid {border};
+        padding: 5px;
+        border-radius: 5px;
+    }}
+    QScrollBar:vertical {{
+        background: {scroll_bg};
+        width: 12px;
+        margin: 0px;
+    }}
+    QScrollBar::handle:vertical {{
+        background: {scroll_handle};
+        min-height: 20px;
+        border-radius: 6px;
+    }}
+    QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {{
+        height: 0px;
+    }}
+"""
+
+PREVIOUS_WIDGET_SHEETS = {
+    "modern_button": """
+        QPushButton { background-color: #45475a; color: #cdd6f4; border: none; padding: 10px 20px; border-radius: 8px; font-weight: bold; }
+        QPushButton:hover { background-color: #585b70; }
+        QPushButton:pressed { background-color: #313244; }
+        QPushButton:disabled { background-color: #313244; color: #6c7086; }
+    """,
+    "provider_button": """
+        QPushButton { background-color: #45475a; color: #cdd6f4; border: none; padding: 10px 20px; border-radius: 8px; font-weight: bold; }
+        QPushButton:hover { background-color: #585b70; }
+        QPushButton:checked { background-color: #cba6f7; color: #1e1e2e; }
+        QPushButton:disabled { background-color: #313244; color: #6c7086; }
+    """,
+    "combo": """
+        QComboBox { background-color: #313244; color: #cdd6f4; border: 1px solid #6c7086; padding: 5px; border-radius: 8px; }
+        QComboBox::drop-down { subcontrol-origin: padding; subcontrol-position: top right; width: 25px; border-left-width: 1px;
+                               border-left-color: #6c7086; border-left-style: solid; border-top-right-radius: 8px; border-bottom-right-radius: 8px; }
+        QComboBox QAbstractItemView { background-color: #313244; color: #cdd6f4; selection-background-color: #585b70; }
+    """,
+    "modelPicker": """
+        QListView { background-color: #1e1e2e; color: #cdd6f4; border: 1px solid #6c7086; border-radius: 8px; padding: 4px; }
+        QListView::item { padding: 6px 10px; border-radius: 6px; }
+        QListView::item:hover { background-color: #45475a; }
+        QListView::item:selected { background-color: #cba6f7; color: #1e1e2e; }
+    """,
+    "chatDisplay": """
+        QTextEdit { background-color: #1e1e2e; color: #cdd6f4; border: none; padding: 10px; border-radius: 10px; }
+    """,
+    "chatInput": """
+        QLineEdit { background-color: #313244; color: #cdd6f4; border: 1px solid #6c7086; padding: 10px; border-radius: 8px; }
+    """,
+    "spendLabel": "color: #a6adc8;",
+    "statusLabel": "color: #cdd6f4; font-weight: bold;",
+    "removeParticipant": """
+        QPushButton { background-color: #45475a; color: #cdd6f4; border: none; border-radius: 5px; padding: 4px; }
+        QPushButton:hover { background-color: #f38ba8; color: #1e1e2e; }
+    """,
+    "modeTabs": """
+        QTabWidget::pane { border: 1px solid #6c7086; background: #1e1e2e; border-radius: 8px; }
+        QTabBar::tab { background: #313244; color: #cdd6f4; padding: 10px; margin-right: 2px;
+                       border-top-left-radius: 8px; border-top-right-radius: 8px; }
+        QTabBar::tab:selected { background: #45475a; }
+    """,
+    "checkbox": """
+        QCheckBox { color: #cdd6f4; }
+        QCheckBox::indicator { width: 18px; height: 18px; border-radius: 4px; border: 1px solid #6c7086; }
+        QCheckBox::indicator:unchecked { background-color: #313244; }
+        QCheckBox::indicator:checked { background-color: #cba6f7; }
+    """,
+    "progress": """
+        QProgressBar { border: 1px solid #6c7086; border-radius: 5px; text-align: center; background-color: #313244; }
+        QProgressBar::chunk { background-color: #cba6f7; width: 20px; }
+    """,
+    "toolbar": """
+        QToolBar { background-color: #1e1e2e; border: none; spacing: 10px; }
+        QToolButton { background-color: #45475a; color: #cdd6f4; border: none; padding: 5px; border-radius: 5px; }
+        QToolButton:hover { background-color: #585b70; }
+    """
+}
+
+def previous_sheet_key(widget):
+    if isinstance(widget, ProviderButton):
+        return "provider_button"
+    if isinstance(widget, ModernButton):
+        return "modern_button"
+    if isinstance(widget, ModernComboBox):
+        return "combo"
+    if isinstance(widget, QCheckBox):
+        return "checkbox"
+    if isinstance(widget, QProgressBar):
+        return "progress"
+    if isinstance(widget, QToolBar):
+        return "toolbar"
+    if widget.objectName() in PREVIOUS_WIDGET_SHEETS:
+        return widget.objectName()
+    return None
+
+def previous_apply_theme(window, theme):
+    window.current_theme = theme
+    window.setStyleSheet(PREVIOUS_WINDOW_SHEET.format(**theme))
+
+def build_window(previous):
+    start = time.perf_counter()
+    window = MainWindow()
+    if previous:
+        for widget in window.findChildren(QWidget):
+            key = previous_sheet_key(widget)
+            if key:
+                widget.setStyleSheet(PREVIOUS_WIDGET_SHEETS[key])
+    window.show()
+    QApplication.processEvents()
+    return window, time.perf_counter() - start
+
+def switch_theme(window):
+    # A different background and accent change both stylings' themed sheet: one new sheet, one repolish
+    theme = dict(window.current_theme, accent="#89b4fa", bg="#181825")
+    start = time.perf_counter()
+    window.apply_theme(theme)
+    QApplication.processEvents()
+    return time.perf_counter() - start
+
+def close_window(window):
+    window.close()
+    window.deleteLater()
+    # Outside an event loop deleteLater() waits for this; live windows would be repolished by later switches
+    QApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+    QApplication.processEvents()
+
+def main():
+    parser = argparse.ArgumentParser(description="Main window construction and theme switch time")
+    parser.add_argument("--windows", type=int, default=10)
+    args = parser.parse_args()
+
+    app = QApplication([])
+    MainWindow.get_api_keys = lambda self: {}  # Skip the key prompt; no provider is contacted
+    current_apply_theme = MainWindow.apply_theme
+    print(f"{args.windows} windows, {app.platformName()} platform")
+    print(f"{'Styling':<26}{'Build ms':>10}{'Min ms':>10}{'Widgets':>10}{'Theme switch ms':>18}")
+    for name, previous in [("application sheet", False), ("previous per-widget sheets", True)]:
+        MainWindow.apply_theme = previous_apply_theme if previous else current_apply_theme
+        app.setStyleSheet("")
+        builds, switches = [], []
+        for _ in range(args.windows):
+            Theme.compiled.clear()
+            window, elapsed = build_window(previous)
+            builds.append(elapsed)
+            switches.append(switch_theme(window))
+            widgets = len(window.findChildren(QWidget))
+            window.apply_theme(Theme.DARK)
+            close_window(window)
+        print(f"{name:<26}{statistics.mean(builds) * 1000:>10.1f}{min(builds) * 1000:>10.1f}"
+              f"{widgets:>10}{statistics.mean(switches) * 1000:>18.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication
+
+from V2 import MainWindow
+
+WORDS = [
+    "the", "model", "agrees", "with", "this", "approach", "because", "latency", "matters",
+    "we", "should", "consider", "caching", "tokens", "and", "streaming", "responses", "carefully"
+]
+
+# Metric -> (label, unit, default limit on its growth per 1000 turns)
+METRICS = {
+    "rss": ("RSS", "MiB", 8.0),
+    "heap": ("Python heap", "MiB", 4.0),
+    "lag": ("Event-loop lag p95", "ms", 5.0),
+    "turn": ("Per-turn overhead", "ms", 2.0)
+}
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    # Streams random words in Ollama's NDJSON format; the prompt is read in full like a real server would
+    protocol_version = "HTTP/1.1"
+    models = []
+    tokens = 50
+    delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (ConnectionResetError, BrokenPipeError):
+            pass  # The client pool drops idle keep-alive connections, and stopping closes streams mid-reply
+
+    def do_GET(self):
+        self.send_json({"models": [{"name": name} for name in self.models]})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        rng = random.Random(len(request.get("prompt", "")))
+        count = min(self.tokens, request.get("options", {}).get("num_predict", self.tokens))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for _ in range(count):
+            if self.delay:
+                time.sleep(self.delay)
+            self.send_chunk({"response": f"{rng.choice(WORDS)} "})
+        self.send_chunk({"done": True, "prompt_eval_count": len(request.get("prompt", "")) // 4, "eval_count": count})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def send_json(self, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_mock_ollama(models, tokens, delay):
+    handler = type("Handler", (MockOllamaHandler,), {"models": models, "tokens": tokens, "delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # No /proc: fall back to the peak, which still catches steady growth
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def slope(points):
+    # Least-squares growth of value per turn
+    count = len(points)
+    mean_x = sum(x for x, _ in points) / count
+    mean_y = sum(y for _, y in points) / count
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+class Soak:
+    def __init__(self, window, sessions, args):
+        self.window = window
+        self.sessions = sessions
+        self.args = args
+        self.samples = []
+        self.started = time.perf_counter()
+        self.window_started = self.started
+        self.window_turns = 0
+        self.next_sample = args.sample_every
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.poll)
+
+    def turns(self):
+        # Each collaboration history starts with the system prompt and the opening message
+        return sum(max(0, len(session.conversation_history) - 2) for session in self.sessions)
+
+    def poll(self):
+        turns = self.turns()
+        if turns >= self.next_sample:
+            self.sample(turns)
+            self.next_sample = turns + self.args.sample_every
+        if turns >= self.args.turns:
+            for session in self.sessions:
+                if session.collaborating:
+                    session.stop_chat()
+        # Stopped workers wind down on their own; quit once every one has exited
+        if not any(session.collaborating or session.active_workers or session.abandoned_workers for session in self.sessions):
+            self.timer.stop()
+            QApplication.instance().quit()
+
+    def sample(self, turns):
+        now = time.perf_counter()
+        lag = sorted(self.window.diagnostics.lag_samples)
+        self.window.diagnostics.lag_samples.clear()
+        sample = {
+            "turns": turns,
+            "elapsed": now - self.started,
+            "rss": rss_bytes() / 2 ** 20,
+            "heap": tracemalloc.get_traced_memory()[0] / 2 ** 20,
+            "lag": lag[int(len(lag) * 0.95) - 1] * 1000 if len(lag) >= 20 else (lag[-1] * 1000 if lag else 0.0),
+            "turn": (now - self.window_started) * 1000 / max(1, turns - self.window_turns)
+        }
+        self.samples.append(sample)
+        self.window_started = now
+        self.window_turns = turns
+        print(f"{turns:>8}{sample['elapsed']:>10.1f}" + "".join(f"{sample[name]:>14.2f}" for name in METRICS), flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless long-run collaboration soak: fails when memory, "
+                                                 "event-loop lag or per-turn overhead grow faster than the given slopes")
+    parser.add_argument("--turns", type=int, default=5000, help="Total turns across all sessions")
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--participants", type=int, default=2)
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens per mock reply")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between mock tokens")
+    parser.add_argument("--replay", help="Answer from a stream recording instead of the mock server")
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay speed, 0 for maximum")
+    parser.add_argument("--sample-every", type=int, default=100, help="Turns between samples")
+    parser.add_argument("--warmup", type=int, default=500, help="Turns left out of the slope fit")
+    parser.add_argument("--csv", help="Write the samples to this file")
+    for name, (label, unit, limit) in METRICS.items():
+        parser.add_argument(f"--max-{name}-slope", type=float, default=limit,
+                            help=f"{label} growth limit in {unit} per 1000 turns (default {limit:g})")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    app = QApplication([])
+    server = None
+    if args.replay:
+        MainWindow.get_api_keys = lambda self: {}
+        window = MainWindow()
+        window.start_replay(args.replay, args.speed)
+        models = [f"{provider}: {name}" for provider, names in window.replayer.models().items() for name in names]
+        source = f"replay of {args.replay} at {'maximum speed' if not args.speed else f'{args.speed:g}x'}"
+    else:
+        names = [f"soak-{index}:latest" for index in range(args.participants)]
+        server = start_mock_ollama(names, args.tokens, args.token_delay)
+        MainWindow.get_api_keys = lambda self: {"ollama_ip": f"127.0.0.1:{server.server_address[1]}"}
+        window = MainWindow()
+        models = [f"Ollama: {name}" for name in names]
+        source = f"mock Ollama, {args.tokens} tokens per reply, {args.token_delay * 1000:g} ms per token"
+    window.show()
+    window.diagnostics.set_enabled(True)
+    roles = list(window.role_prompts)
+    for index in range(args.participants):
+        window.control_panel.add_participant(models[index % len(models)], roles[index % len(roles)])
+    window.current_mode = "collaboration"
+
+    sessions = [window.session] + [window.new_session() for _ in range(args.sessions - 1)]
+    for session in sessions:
+        session.start_collaboration()
+        session.collab_settings.update(rounds=0, novelty_threshold=0)
+        session.budget.configure(session.collab_settings)
+    print(f"{args.turns} turns, {args.sessions} session(s), {args.participants} participants, {source}")
+    print(f"{'Turns':>8}{'Seconds':>10}" + "".join(f"{METRICS[name][0].split()[0] + ' ' + METRICS[name][1]:>14}" for name in METRICS))
+
+    soak = Soak(window, sessions, args)
+    soak.timer.start(20)
+    for session in sessions:
+        session.handle_message("Discuss how to keep a long-running chat application fast.")
+    app.exec_()
+    window.close()
+    if server is not None:
+        server.shutdown()
+
+    if args.csv:
+        with open(args.csv, "w") as output:
+            output.write(",".join(["turns", "elapsed"] + list(METRICS)) + "\n")
+            for sample in soak.samples:
+                output.write(",".join(f"{sample[name]:.4f}" for name in ["turns", "elapsed"] + list(METRICS)) + "\n")
+
+    fitted = [sample for sample in soak.samples if sample["turns"] > args.warmup]
+    if len(fitted) < 3:
+        print(f"Too few samples after the {args.warmup}-turn warmup to fit slopes; run more turns")
+        sys.exit(2)
+    print(f"\n{'Metric':<22}{'Slope/1000 turns':>18}{'Limit':>10}")
+    failed = False
+    for name, (label, unit, _) in METRICS.items():
+        growth = slope([(sample["turns"], sample[name]) for sample in fitted]) * 1000
+        limit = getattr(args, f"max_{name}_slope")
+        passed = growth <= limit
+        failed = failed or not passed
+        print(f"{label:<22}{growth:>13.2f} {unit:<4}{limit:>10g}  {'ok' if passed else 'FAIL'}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()